@@ -0,0 +1,58 @@
+"""
+Shared fixtures for the pytest-benchmark suite.
+
+The synthetic catalog is generated once per session in the configured
+database (not a test database), sized by BENCH_CATALOG_SIZE, and reused
+across runs unless BENCH_REGENERATE=1. Because they write to that database,
+the benchmarks are skipped unless RUN_BENCHMARKS=1; run them against a local
+database only:
+
+    RUN_BENCHMARKS=1 BENCH_CATALOG_SIZE=100000 pytest --benchmark-json=bench.json
+"""
+
+import os
+
+import pytest
+from products import benchmark
+
+CATALOG_SIZE = int(os.environ.get("BENCH_CATALOG_SIZE", 20000))
+CATEGORIES = int(os.environ.get("BENCH_CATEGORIES", 20))
+SKEW = float(os.environ.get("BENCH_SKEW", 1.0))
+QUERIES = int(os.environ.get("BENCH_QUERIES", 100))
+K = int(os.environ.get("BENCH_K", 10))
+MIN_RECALL = float(os.environ.get("BENCH_MIN_RECALL", 0.9))
+RUN_BENCHMARKS = os.environ.get("RUN_BENCHMARKS") == "1"
+
+
+def pytest_collection_modifyitems(config, items):
+    # A plain `pytest` must never touch the configured (possibly real) database
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="writes to the configured database; set RUN_BENCHMARKS=1")
+    for item in items:
+        item.add_marker(skip)
+
+
+@pytest.fixture(scope="session")
+def django_db_setup():
+    """Benchmarks run against the configured database, not a throwaway copy."""
+
+
+@pytest.fixture(scope="session")
+def catalog(django_db_blocker):
+    with django_db_blocker.unblock():
+        existing = benchmark.catalog_queryset().count()
+        if existing != CATALOG_SIZE or os.environ.get("BENCH_REGENERATE") == "1":
+            benchmark.generate_catalog(CATALOG_SIZE, CATEGORIES, SKEW)
+        yield benchmark.catalog_queryset()
+
+
+@pytest.fixture(scope="session")
+def targets(catalog, django_db_blocker):
+    with django_db_blocker.unblock():
+        return benchmark.sample_products(QUERIES)
+
+
+@pytest.fixture(scope="session")
+def query_vectors(targets):
+    return benchmark.query_vectors(targets)
@@ -0,0 +1,49 @@
+import itertools
+
+import pytest
+from products import benchmark as suite
+from products.engines import get_search_engine
+
+from .conftest import K, MIN_RECALL
+
+pytestmark = pytest.mark.django_db
+
+
+@pytest.mark.benchmark(group="search")
+def test_semantic_search(benchmark, query_vectors):
+    engine = get_search_engine()
+    queries = itertools.cycle(query_vectors)
+    benchmark(lambda: suite.search_ids(engine, next(queries), K))
+
+    found = [suite.search_ids(engine, vector, K) for vector in query_vectors]
+    exact = [suite.exact_search_ids(vector, K) for vector in query_vectors]
+    recall = suite.recall_at_k(found, exact)
+    benchmark.extra_info[f"recall@{K}"] = recall
+    assert recall >= MIN_RECALL
+
+
+@pytest.mark.benchmark(group="recommend")
+def test_recommendations(benchmark, targets):
+    engine = get_search_engine()
+    products = itertools.cycle(targets)
+    benchmark(lambda: suite.recommendation_ids(engine, next(products), K))
+
+    found = [suite.recommendation_ids(engine, target, K) for target in targets]
+    exact = [suite.exact_recommendation_ids(target, K) for target in targets]
+    recall = suite.recall_at_k(found, exact)
+    benchmark.extra_info[f"recall@{K}"] = recall
+    assert recall >= MIN_RECALL
+
+
+@pytest.mark.benchmark(group="embed")
+@pytest.mark.parametrize("batch_size", [1, 32, 64])
+def test_batch_embedding(benchmark, batch_size):
+    from products import embeddings
+
+    try:
+        embeddings.warm_up()
+    except ImportError as e:
+        pytest.skip(f"Encoder unavailable: {e}")
+    texts = [f"Benchmark product {i} with a short description" for i in range(batch_size)]
+    benchmark(embeddings.encode, texts, batch_size=batch_size)
+    benchmark.extra_info["docs_per_round"] = batch_size
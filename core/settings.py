@@ -10,9 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import copy
 import os
 from pathlib import Path
-from celery import Celery
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "products.middleware.RequestMetricsMiddleware",
+    "products.middleware.ReplicaRoutingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -94,6 +96,65 @@ DATABASES = {
     }
 }
 
+# Server-side binding sends parameters separately from the SQL, so query
+# vectors travel in pgvector's binary format and psycopg prepares a
+# statement once it has run DB_PREPARE_THRESHOLD times on a connection.
+# Off by default: it applies to every ORM query, Django lists queries it
+# breaks, and generic prepared plans cannot pick the per-category partial
+# indexes. Opt in after `manage.py benchmark_connections`.
+DB_SERVER_SIDE_BINDING = os.getenv("DB_SERVER_SIDE_BINDING", "false").lower() == "true"
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", 5))
+
+# Set when connecting through PgBouncer in transaction pooling mode: session
+# settings are applied per transaction and named prepared statements are
+# disabled (PgBouncer < 1.21 cannot route them).
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+DATABASES["default"]["OPTIONS"] = {
+    "server_side_binding": DB_SERVER_SIDE_BINDING,
+    "prepare_threshold": None if DB_PGBOUNCER else DB_PREPARE_THRESHOLD,
+}
+if DB_PGBOUNCER:
+    # Server-side cursors do not survive the end of a PgBouncer transaction
+    DATABASES["default"]["DISABLE_SERVER_SIDE_CURSORS"] = True
+
+# psycopg3 connection pool (Django >= 5.1), off when 0: each process keeps
+# up to DB_POOL_MAX_SIZE connections open and hands them out per request.
+# Without the pool, connections persist for DB_CONN_MAX_AGE seconds instead
+# of being opened and closed around every request and Celery task.
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 0))
+if DB_POOL_MAX_SIZE:
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": int(os.getenv("DB_POOL_MIN_SIZE", 2)),
+        "max_size": DB_POOL_MAX_SIZE,
+        "timeout": 10,
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.getenv("DB_CONN_MAX_AGE", 60))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# Read replicas: comma-separated "host" or "host:port" entries, same
+# credentials as the primary. Product reads of GET requests go to a replica
+# lagging at most DB_REPLICA_MAX_LAG_SECONDS; see products/routers.py.
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(","))):
+    host, _, port = replica.strip().partition(":")
+    alias = f"replica_{index}"
+    DATABASES[alias] = {
+        **copy.deepcopy(DATABASES["default"]),
+        "HOST": host,
+        "PORT": port or DATABASES["default"]["PORT"],
+        # Tests read the replicas through the test database
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ["products.routers.ReplicaRouter"]
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", 5))
+DB_REPLICA_LAG_CHECK_SECONDS = float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", 2))
+# Reads of a client that just wrote stay on the primary this long
+DB_READ_YOUR_WRITES_SECONDS = int(os.getenv("DB_READ_YOUR_WRITES_SECONDS", 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -136,25 +197,153 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 CORS_ALLOW_ALL_ORIGINS = True
 
-# Set the default Django settings module for the 'celery' program.
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+REST_FRAMEWORK = {
+    # orjson-backed JSON when available; the browsable API is kept
+    "DEFAULT_RENDERER_CLASSES": [
+        "products.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    # Limits of the throttled public endpoints (sync and async), e.g.
+    # "100/min"; unset means unlimited
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": os.environ.get("THROTTLE_ANON_RATE") or None,
+        "user": os.environ.get("THROTTLE_USER_RATE") or None,
+    },
+}
 
-app = Celery('core')
+# Cache (response cache, catalog versions). Redis when configured, otherwise
+# a per-process in-memory cache (and no response cache, see below).
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+            "OPTIONS": {"socket_timeout": 0.25, "socket_connect_timeout": 0.25},
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
 
-# Using a string here means the worker doesn't have to serialize
-# the configuration object to child processes.
-# - namespace='CELERY' means all celery-related configuration keys
-#   should have a `CELERY_` prefix.
-app.config_from_object('django.conf:settings', namespace='CELERY')
+# Cached responses are invalidated by catalog version bumps from API
+# workers, Celery and management commands, which only reach every process
+# through a shared cache: without Redis, response caching is off.
+RESPONSE_CACHE_ENABLED = (
+    os.environ.get("RESPONSE_CACHE_ENABLED", str(bool(CACHE_REDIS_URL))).lower() == "true"
+)
 
-# Load task modules from all registered Django apps.
-app.autodiscover_tasks()
+# Seconds a cached search/recommendation response may be served. Writes
+# invalidate earlier through catalog version counters.
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get("RESPONSE_CACHE_TIMEOUT", 300))
 
 # --- Celery Configuration ---
+# The Celery app itself is created in core/celery.py
 # Docker service name 'redis' is used as the host
 CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://redis:6379/0")
 CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", "redis://redis:6379/0")
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
-CELERY_TIMEZONE = "UTC"
\ No newline at end of file
+CELERY_TIMEZONE = "UTC"
+# --- Embeddings ---
+EMBEDDING_MODEL_NAME = os.environ.get("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+
+# Bulk encodes keep the title and the first N description tokens (0: the
+# whole description, up to the model's max sequence length). Changing it
+# marks every stored vector as stale.
+EMBEDDING_DESCRIPTION_TOKENS = int(os.environ.get("EMBEDDING_DESCRIPTION_TOKENS", 0))
+
+# "local": load the model in each process (shared copy-on-write under
+# gunicorn preload_app). "socket": send texts to `manage.py run_encoder`.
+EMBEDDING_ENCODER = os.environ.get("EMBEDDING_ENCODER", "local")
+EMBEDDING_ENCODER_SOCKET = os.environ.get("EMBEDDING_ENCODER_SOCKET", "/tmp/product-encoder.sock")
+
+# Load the model when gunicorn starts. Turn off for CRUD-only pods: they
+# then never import the ML stack (search requests load it on first use).
+EMBEDDING_PRELOAD = os.environ.get("EMBEDDING_PRELOAD", "true").lower() == "true"
+
+# In-process inference: "torch" (sentence-transformers) or "onnx" (ONNX
+# Runtime, int8 dynamic quantization; export with `manage.py export_onnx_model`).
+EMBEDDING_INFERENCE_BACKEND = os.environ.get("EMBEDDING_INFERENCE_BACKEND", "torch")
+EMBEDDING_ONNX_DIR = os.environ.get("EMBEDDING_ONNX_DIR", str(BASE_DIR / "models" / "minilm-onnx"))
+EMBEDDING_ONNX_FILE = os.environ.get("EMBEDDING_ONNX_FILE", "model_int8.onnx")
+EMBEDDING_ONNX_THREADS = int(os.environ.get("EMBEDDING_ONNX_THREADS", 1))
+
+# Micro-batching of concurrent search queries within a process: wait up to
+# MAX_WAIT_MS for up to MAX_SIZE queries and encode them in one forward pass.
+# Only useful where a process serves concurrent requests (ASGI or threaded
+# workers); under sync workers every search would just wait MAX_WAIT_MS.
+EMBEDDING_MICROBATCH = os.environ.get("EMBEDDING_MICROBATCH", "false").lower() == "true"
+EMBEDDING_MICROBATCH_MAX_SIZE = int(os.environ.get("EMBEDDING_MICROBATCH_MAX_SIZE", 32))
+EMBEDDING_MICROBATCH_MAX_WAIT_MS = float(os.environ.get("EMBEDDING_MICROBATCH_MAX_WAIT_MS", 5))
+
+# Threads running query encodes for the async (ASGI) endpoints
+EMBEDDING_ASYNC_WORKERS = int(os.environ.get("EMBEDDING_ASYNC_WORKERS", 4))
+
+# Query-embedding cache: in-process LRU plus an optional shared Redis tier
+# (leave the URL empty to disable the Redis tier).
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+QUERY_EMBEDDING_CACHE_REDIS_URL = os.environ.get("QUERY_EMBEDDING_CACHE_REDIS_URL", "")
+QUERY_EMBEDDING_CACHE_TTL = int(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 60 * 60 * 24))
+
+# Debounced embedding queue: saves add ids to a Redis set that a single
+# Celery task drains in batches of EMBEDDING_BATCH_SIZE.
+EMBEDDING_QUEUE_REDIS_URL = os.environ.get("EMBEDDING_QUEUE_REDIS_URL", CELERY_BROKER_URL)
+EMBEDDING_DEBOUNCE_SECONDS = int(os.environ.get("EMBEDDING_DEBOUNCE_SECONDS", 2))
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 256))
+# Drains a product may fail before it is dropped from the queue
+EMBEDDING_MAX_ATTEMPTS = int(os.environ.get("EMBEDDING_MAX_ATTEMPTS", 3))
+
+# Number of precomputed neighbours stored per product in ProductNeighbor
+PRODUCT_NEIGHBORS_K = int(os.environ.get("PRODUCT_NEIGHBORS_K", 20))
+
+# pgvector HNSW query tuning for filtered (category/price) searches.
+# Iterative scans require pgvector >= 0.8: "off", "relaxed_order" or "strict_order".
+PGVECTOR_HNSW_EF_SEARCH = int(os.environ.get("PGVECTOR_HNSW_EF_SEARCH", 100))
+PGVECTOR_ITERATIVE_SCAN = os.environ.get("PGVECTOR_ITERATIVE_SCAN", "off")
+
+# Which HNSW index vector searches use: "vector" (float32), "halfvec"
+# (float16, half the memory) or "bit" (binary quantization, shortlists
+# EMBEDDING_RERANK_CANDIDATES rows re-ranked at full precision).
+# Build the matching index with `manage.py build_vector_index`.
+EMBEDDING_INDEX_PRECISION = os.environ.get("EMBEDDING_INDEX_PRECISION", "vector")
+EMBEDDING_RERANK_CANDIDATES = int(os.environ.get("EMBEDDING_RERANK_CANDIDATES", 200))
+
+# Vector search engine for recommendations and semantic search: "pgvector"
+# (PostgreSQL) or "memory" (in-process index over a snapshot written by
+# `manage.py export_embeddings`, kept fresh from a Redis change feed).
+SEARCH_ENGINE = os.environ.get("SEARCH_ENGINE", "pgvector")
+SEARCH_SNAPSHOT_DIR = os.environ.get("SEARCH_SNAPSHOT_DIR", BASE_DIR / "snapshots")
+# Catalogs at least this large get an HNSW graph (hnswlib) in the snapshot;
+# smaller ones are searched with a brute-force matmul.
+SEARCH_HNSW_MIN_PRODUCTS = int(os.environ.get("SEARCH_HNSW_MIN_PRODUCTS", 200000))
+SEARCH_FEED_REDIS_URL = os.environ.get("SEARCH_FEED_REDIS_URL", CELERY_BROKER_URL)
+SEARCH_FEED_STREAM = os.environ.get("SEARCH_FEED_STREAM", "products:embedding-changes")
+SEARCH_FEED_MAXLEN = int(os.environ.get("SEARCH_FEED_MAXLEN", 100000))
+SEARCH_FEED_POLL_SECONDS = float(os.environ.get("SEARCH_FEED_POLL_SECONDS", 1.0))
+
+# --- Instrumentation ---
+# Per-stage Server-Timing header (encode, db, count, serialize, render)
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "true").lower() == "true"
+
+# Sampling profiler: write a cProfile dump for 1 in N sync requests
+# (0 = off). Inspect with `python -m pstats` or snakeviz.
+PROFILE_SAMPLE_RATE = int(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR", str(BASE_DIR / "profiles"))
+
+# Who may scrape /metrics: clients sending "Authorization: Bearer
+# <METRICS_TOKEN>", or connecting from one of METRICS_ALLOWED_IPS (by
+# default only the host itself). The app ports are published directly, so
+# the nginx deny alone does not protect the endpoint.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+METRICS_ALLOWED_IPS = [
+    ip.strip()
+    for ip in os.environ.get("METRICS_ALLOWED_IPS", "127.0.0.1,::1").split(",")
+    if ip.strip()
+]
+
+# Port the Celery worker serves its /metrics on (0 = off). Prefork children
+# share metrics through PROMETHEUS_MULTIPROC_DIR.
+CELERY_METRICS_PORT = int(os.environ.get("CELERY_METRICS_PORT", 0))
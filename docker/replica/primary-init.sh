@@ -0,0 +1,4 @@
+#!/bin/sh
+# Runs once when the primary's data volume is initialized: accept streaming
+# replication connections from the compose network.
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
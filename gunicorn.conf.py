@@ -0,0 +1,48 @@
+# Gunicorn settings (picked up automatically from the working directory).
+import os
+
+bind = "0.0.0.0:8000"
+workers = int(os.environ.get("GUNICORN_WORKERS", 3))
+
+# Load Django in the master before forking, so the model weights loaded in
+# when_ready() are shared copy-on-write by every worker instead of each
+# worker holding its own copy.
+preload_app = True
+
+
+def when_ready(server):
+    from django.conf import settings
+    from products import embeddings
+
+    if not settings.EMBEDDING_PRELOAD:
+        return
+
+    # Weights only: running inference before fork can deadlock torch's
+    # thread pool in the children, so the forward pass happens post_fork.
+    embeddings.preload()
+
+
+def post_fork(server, worker):
+    from django.conf import settings
+    from products import embeddings
+
+    if not settings.EMBEDDING_PRELOAD:
+        return
+
+    embeddings.warm_up()
+
+
+def on_starting(server):
+    # Multiprocess Prometheus metrics: start from an empty directory
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class ProductsConfig(AppConfig):
@@ -7,3 +8,6 @@ class ProductsConfig(AppConfig):
 
     def ready(self):
         import products.signals  # noqa: F401
+        from products.db import configure_connection
+
+        connection_created.connect(configure_connection)
@@ -0,0 +1,153 @@
+"""
+Async (ASGI) variants of the search and recommendation endpoints.
+
+Under an ASGI server a request waiting on the encoder or on PostgreSQL does
+not hold a worker thread: encodes run on the bounded encoder pool
+(EMBEDDING_ASYNC_WORKERS threads) and queries go through Django's async ORM,
+so one process can keep many slow searches in flight. Recommendations
+return the same body as the sync endpoint; search pages skip the total count
+and return {"page", "has_exact_matches", "results"} instead of the paginated
+envelope. Both are throttled like the sync endpoints, but not response-cached.
+"""
+
+import functools
+import logging
+import math
+
+from asgiref.sync import sync_to_async
+from django.db.models import F, QuerySet
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
+
+from . import embeddings, metrics
+from .cache import get_query_embedding_cache
+from .engines import get_search_engine
+from .models import SIMILARITY_THRESHOLD, Product
+from .pagination import StandardResultsSetPagination
+from .serializers import ProductReadSerializer
+from .views import RECOMMENDATION_LIMIT
+
+logger = logging.getLogger(__name__)
+
+
+def parse_positive_int(value, default, maximum=None):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        return default
+    if number < 1:
+        return default
+    return min(number, maximum) if maximum else number
+
+
+def throttle_wait(request):
+    """
+    Seconds to wait if one of the sync endpoints' DRF throttles rejects the
+    request, else None. Counters live in the shared cache under the same
+    keys, so sync and async requests draw from one budget.
+    """
+    waits = []
+    for throttle_class in (AnonRateThrottle, UserRateThrottle):
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            waits.append(throttle.wait() or 0)
+    return max(waits) if waits else None
+
+
+def throttled(view):
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        # Resolving request.user and the cache counters is synchronous
+        wait = await sync_to_async(throttle_wait)(request)
+        if wait is not None:
+            seconds = math.ceil(wait)
+            return JsonResponse(
+                {"detail": f"Request was throttled. Expected available in {seconds} seconds."},
+                status=429,
+                headers={"Retry-After": str(seconds)},
+            )
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+@require_GET
+@throttled
+async def async_semantic_search(request):
+    """
+    Semantic search without a total count: ?q=, ?page=, ?page_size=.
+    Returns {"page", "has_exact_matches", "results"}.
+    """
+    query = request.GET.get("q", "")
+    if not query:
+        return JsonResponse({"q": ["This query parameter is required."]}, status=400)
+
+    page = parse_positive_int(request.GET.get("page"), 1)
+    page_size = parse_positive_int(
+        request.GET.get("page_size"),
+        StandardResultsSetPagination.page_size,
+        StandardResultsSetPagination.max_page_size,
+    )
+
+    try:
+        with metrics.span("encode"):
+            query_embedding = await embeddings.run_in_encoder_executor(
+                get_query_embedding_cache().get_or_encode, query, embeddings.encode_query
+            )
+    except Exception as e:
+        logger.error(f"Search error: {e}")
+        return JsonResponse({"page": page, "has_exact_matches": False, "results": []})
+
+    results = get_search_engine().search(query_embedding)
+    offset = (page - 1) * page_size
+    with metrics.span("db"):
+        if isinstance(results, QuerySet):
+            products = [product async for product in results[offset : offset + page_size]]
+        else:
+            # In-memory engine: ranking is CPU-bound, keep it off the event loop
+            products = await sync_to_async(results.__getitem__)(
+                slice(offset, offset + page_size)
+            )
+
+    return JsonResponse(
+        {
+            "page": page,
+            "has_exact_matches": any(p.distance < SIMILARITY_THRESHOLD for p in products),
+            "results": ProductReadSerializer(products, many=True).data,
+        }
+    )
+
+
+@require_GET
+@throttled
+async def async_product_recommendations(request, pk):
+    """Same results as ProductRecommendationView, served without blocking a thread."""
+    with metrics.span("db"):
+        products = [
+            product
+            async for product in Product.objects.for_read()
+            .filter(neighbor_of__product_id=pk)
+            .annotate(distance=F("neighbor_of__distance"))
+            .order_by("neighbor_of__rank")[:RECOMMENDATION_LIMIT]
+        ]
+
+    if not products:
+        # Not materialized yet: fall back to a live vector search
+        try:
+            with metrics.span("db"):
+                target_product = await Product.objects.aget(pk=pk)
+        except Product.DoesNotExist:
+            return JsonResponse({"detail": "No Product matches the given query."}, status=404)
+
+        if target_product.embedding is None:
+            logger.warning(f"Product ID {pk} has no embedding.")
+        else:
+            # pgvector sets per-transaction HNSW options on a raw cursor;
+            # the in-memory engine is CPU-bound
+            with metrics.span("db"):
+                products = await sync_to_async(get_search_engine().similar_to)(
+                    target_product, RECOMMENDATION_LIMIT
+                )
+
+    return JsonResponse(ProductReadSerializer(products, many=True).data, safe=False)
@@ -0,0 +1,179 @@
+"""
+Building blocks for ``manage.py benchmark_search`` and the pytest-benchmark
+suite in ``benchmarks/``: synthetic catalogs, latency percentiles and
+recall@K against exact (index-free) search.
+
+Synthetic products use the BENCH_ASIN_PREFIX ASIN prefix so they can be
+told apart from (and deleted without touching) real catalog rows. Run the
+benchmarks against a local database, never production.
+"""
+
+import time
+
+import numpy as np
+from django.db import connection
+from django.db.models import Q, QuerySet
+from django.test.utils import override_settings
+
+from .cache import bump_catalog_version
+from .models import EMBEDDING_DIMENSIONS, Product, ProductNeighbor
+from .search import fetch_nearest, session_options
+
+BENCH_ASIN_PREFIX = "BENCH"
+
+
+def category_weights(categories, skew):
+    """Zipf-like category sizes: weight of the i-th category is 1 / i**skew."""
+    weights = 1.0 / np.arange(1, categories + 1) ** skew
+    return weights / weights.sum()
+
+
+def generate_catalog(size, categories=20, skew=1.0, seed=0, batch_size=5000):
+    """
+    Replaces the synthetic catalog with ``size`` products spread over
+    ``categories`` categories with the given skew (0 = uniform). Embeddings
+    are clustered around one random centroid per category, like real
+    product text, and stored with their provenance so they are not stale.
+    """
+    rng = np.random.default_rng(seed)
+    delete_catalog()
+
+    centroids = rng.standard_normal((categories, EMBEDDING_DIMENSIONS)).astype(np.float32)
+    assignments = rng.choice(categories, size=size, p=category_weights(categories, skew))
+    prices = np.round(rng.lognormal(mean=3.5, sigma=1.0, size=size), 2)
+
+    for start in range(0, size, batch_size):
+        end = min(start + batch_size, size)
+        noise = rng.standard_normal((end - start, EMBEDDING_DIMENSIONS)).astype(np.float32)
+        vectors = centroids[assignments[start:end]] + 0.6 * noise
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        products = []
+        for offset, vector in enumerate(vectors):
+            i = start + offset
+            product = Product(
+                asin=f"{BENCH_ASIN_PREFIX}{i:012d}",
+                title=f"Benchmark product {i}",
+                category=f"Bench category {assignments[i]}",
+                price=float(prices[i]),
+            )
+            product.set_embedding(vector)
+            products.append(product)
+        # bulk_create() sends no post_save: nothing is queued for embedding
+        Product.objects.bulk_create(products)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ANALYZE {Product._meta.db_table}")
+    bump_catalog_version()
+
+
+def delete_catalog():
+    """
+    Removes the synthetic catalog with one DELETE, skipping the per-row
+    post_delete handlers a queryset delete() would run.
+    """
+    ProductNeighbor.objects.filter(
+        Q(product__asin__startswith=BENCH_ASIN_PREFIX)
+        | Q(neighbor__asin__startswith=BENCH_ASIN_PREFIX)
+    ).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {Product._meta.db_table} WHERE asin LIKE %s",
+            [f"{BENCH_ASIN_PREFIX}%"],
+        )
+        deleted = cursor.rowcount
+    bump_catalog_version()
+    return deleted
+
+
+def catalog_queryset():
+    return Product.objects.filter(asin__startswith=BENCH_ASIN_PREFIX)
+
+
+def sample_products(count, seed=0):
+    """Random synthetic products (id, category, price, embedding) used as query targets."""
+    ids = list(catalog_queryset().values_list("id", flat=True))
+    if not ids:
+        return []
+    rng = np.random.default_rng(seed)
+    chosen = rng.choice(ids, size=min(count, len(ids)), replace=False).tolist()
+    return list(
+        Product.objects.filter(id__in=chosen).only("id", "category", "price", "embedding")
+    )
+
+
+def query_vectors(targets, seed=0, noise=0.3):
+    """Search queries near (not equal to) existing products, like real queries."""
+    rng = np.random.default_rng(seed)
+    vectors = np.stack([target.embedding for target in targets]).astype(np.float32)
+    vectors += noise * rng.standard_normal(vectors.shape).astype(np.float32) / np.sqrt(
+        EMBEDDING_DIMENSIONS
+    )
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def latency_summary(latencies, elapsed=None):
+    """p50/p95/p99 in milliseconds, plus queries per second."""
+    latencies_ms = np.asarray(latencies) * 1000
+    elapsed = elapsed if elapsed is not None else float(np.sum(latencies))
+    return {
+        "queries": len(latencies),
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+        "qps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def timed(func, inputs):
+    """Calls ``func`` once per input; returns (results, per-call seconds, total seconds)."""
+    results, latencies = [], []
+    started = time.perf_counter()
+    for item in inputs:
+        call_started = time.perf_counter()
+        results.append(func(item))
+        latencies.append(time.perf_counter() - call_started)
+    return results, latencies, time.perf_counter() - started
+
+
+def search_ids(engine, vector, k):
+    """Top-k ids from a search engine (pgvector goes through fetch_nearest())."""
+    results = engine.search(vector)
+    if isinstance(results, QuerySet):
+        return [row.id for row in fetch_nearest(results, k)]
+    return [row.id for row in results[:k]]
+
+
+def recommendation_ids(engine, target, k):
+    return [row.id for row in engine.similar_to(target, k)]
+
+
+def exact_ids(queryset, k):
+    """
+    Ground truth: the first ``k`` ids of a distance-ordered queryset with
+    index scans disabled and full-precision distances, i.e. brute force.
+    """
+    with session_options({"enable_indexscan": "off"}, using=queryset.db):
+        return list(queryset.values_list("id", flat=True)[:k])
+
+
+def exact_search_ids(vector, k):
+    with override_settings(EMBEDDING_INDEX_PRECISION="vector"):
+        queryset = Product.objects.filter(embedding__isnull=False).order_by_distance(vector)
+    return exact_ids(queryset, k)
+
+
+def exact_recommendation_ids(target, k):
+    with override_settings(EMBEDDING_INDEX_PRECISION="vector"):
+        queryset = Product.objects.similar_to(target)
+    return exact_ids(queryset, k)
+
+
+def recall_at_k(approximate, exact):
+    """Mean fraction of the exact top-K found by the approximate search."""
+    recalls = [
+        len(set(found) & set(truth)) / len(truth)
+        for found, truth in zip(approximate, exact)
+        if truth
+    ]
+    return round(float(np.mean(recalls)), 4) if recalls else None
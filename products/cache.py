@@ -0,0 +1,327 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from rest_framework import status
+from rest_framework.response import Response
+
+from .embeddings import encoder_id
+from .routers import replica_used
+
+logger = logging.getLogger(__name__)
+
+# One client per URL and process; redis-py clients are thread-safe and pool
+# their own connections.
+_redis_clients = {}
+_redis_lock = threading.Lock()
+
+
+def get_redis(url):
+    """
+    Returns a shared redis-py client for ``url``.
+    Short socket timeouts keep a slow or unreachable Redis from stalling requests.
+    """
+    with _redis_lock:
+        client = _redis_clients.get(url)
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(
+                url, socket_timeout=0.25, socket_connect_timeout=0.25
+            )
+            _redis_clients[url] = client
+        return client
+
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a search query: NFKC, case-folded, whitespace collapsed.
+    Folds queries that should share an embedding (and a cache entry); the
+    vector of the folded text can differ slightly from the raw query's, as
+    NFKC and case folding change some tokens the encoder sees.
+    """
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Two-tier cache for query embeddings.
+    - Tier 1: bounded in-process LRU (per worker, no network round-trip).
+    - Tier 2: optional shared Redis, so workers reuse each other's encodes.
+    Keys are built from the normalized query and the encoder (model and
+    inference backend), so a model upgrade or a switch between torch and
+    ONNX never serves vectors from the previous one.
+    """
+
+    def __init__(self, model_name, max_size=1024, redis_url="", ttl=86400):
+        self.model_name = model_name
+        self.max_size = max_size
+        self.redis_url = redis_url
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            model_name=encoder_id(),
+            max_size=settings.QUERY_EMBEDDING_CACHE_SIZE,
+            redis_url=settings.QUERY_EMBEDDING_CACHE_REDIS_URL,
+            ttl=settings.QUERY_EMBEDDING_CACHE_TTL,
+        )
+
+    def make_key(self, normalized_query: str) -> str:
+        digest = hashlib.sha1(normalized_query.encode("utf-8")).hexdigest()
+        return f"qemb:{self.model_name}:{digest}"
+
+    def get_or_encode(self, query: str, encode) -> np.ndarray:
+        """
+        Returns the embedding for ``query``, calling ``encode(normalized_query)``
+        only when neither tier has it. Returned arrays are read-only.
+        """
+        normalized = normalize_query(query)
+        key = self.make_key(normalized)
+
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.local_hits += 1
+                return vector
+
+        vector = self._redis_get(key)
+        if vector is not None:
+            with self._lock:
+                self.redis_hits += 1
+        else:
+            vector = np.asarray(encode(normalized), dtype=np.float32)
+            self._redis_set(key, vector)
+            with self._lock:
+                self.misses += 1
+
+        vector.setflags(write=False)
+        self._store(key, vector)
+        return vector
+
+    def _store(self, key, vector):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _redis_get(self, key):
+        if not self.redis_url:
+            return None
+        try:
+            raw = get_redis(self.redis_url).get(key)
+        except Exception as e:
+            logger.warning(f"Query embedding cache read failed: {e}")
+            return None
+        if raw is None:
+            return None
+        return np.frombuffer(raw, dtype=np.float32).copy()
+
+    def _redis_set(self, key, vector):
+        if not self.redis_url:
+            return
+        try:
+            get_redis(self.redis_url).set(key, vector.tobytes(), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"Query embedding cache write failed: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.local_hits = self.redis_hits = self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.local_hits + self.redis_hits + self.misses
+            hits = self.local_hits + self.redis_hits
+            return {
+                "model": self.model_name,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "redis_enabled": bool(self.redis_url),
+                "local_hits": self.local_hits,
+                "redis_hits": self.redis_hits,
+                "misses": self.misses,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_query_embedding_cache = None
+
+
+def get_query_embedding_cache() -> QueryEmbeddingCache:
+    global _query_embedding_cache
+    if _query_embedding_cache is None:
+        _query_embedding_cache = QueryEmbeddingCache.from_settings()
+    return _query_embedding_cache
+
+
+# --- Versioned response cache ---
+# Cached responses embed a catalog version in their key. Writes bump the
+# version instead of deleting keys, so stale entries are simply never read
+# again and expire on their own. Search depends on the whole catalog (global
+# version); recommendations only on their product's category.
+GLOBAL_VERSION_KEY = "catalog:version"
+# Unix time of the last bump, to spot responses read from a lagging replica
+LAST_WRITE_KEY = "catalog:last-write"
+
+
+def _category_version_key(category):
+    digest = hashlib.sha1(category.encode("utf-8")).hexdigest()
+    return f"catalog:version:category:{digest}"
+
+
+def _product_category_key(product_id):
+    return f"catalog:product-category:{product_id}"
+
+
+def get_catalog_version(category=None):
+    key = GLOBAL_VERSION_KEY if category is None else _category_version_key(category)
+    try:
+        return cache.get_or_set(key, 1, timeout=None)
+    except Exception as e:
+        logger.warning(f"Response cache unavailable: {e}")
+        return None
+
+
+def bump_catalog_version(categories=(), product_ids=()):
+    """
+    Invalidates cached responses affected by a write: everything that depends
+    on the whole catalog, plus the given categories.
+    """
+    keys = [GLOBAL_VERSION_KEY] + [_category_version_key(c) for c in set(categories)]
+    try:
+        for key in keys:
+            # add() is a no-op if the key exists; incr() is atomic in Redis
+            cache.add(key, 1, timeout=None)
+            cache.incr(key)
+        cache.set(LAST_WRITE_KEY, time.time(), timeout=None)
+        cache.delete_many([_product_category_key(pk) for pk in product_ids])
+    except Exception as e:
+        logger.warning(f"Could not bump catalog version: {e}")
+
+
+def get_product_category(product_id):
+    """Category of a product (None if it does not exist), cached until it is saved."""
+    key = _product_category_key(product_id)
+    try:
+        category = cache.get(key)
+    except Exception:
+        category = None
+    if category is None:
+        from .models import Product
+
+        category = (
+            Product.objects.filter(pk=product_id)
+            .values_list("category", flat=True)
+            .first()
+        )
+        if category is not None:
+            try:
+                cache.set(key, category, timeout=None)
+            except Exception:
+                pass
+    return category
+
+
+def etag_matches(etag, if_none_match):
+    """
+    Whether an If-None-Match header lists ``etag`` (or is ``*``), using the
+    weak comparison RFC 9110 prescribes for If-None-Match.
+    """
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    if "*" in tags:
+        return True
+    return etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in tags if tag}
+
+
+class VersionedResponseCacheMixin:
+    """
+    Caches successful GET responses under a key built from the endpoint, the
+    query string and a catalog version (see get_response_cache_version()).
+    Needs a shared cache (RESPONSE_CACHE_ENABLED): versions bumped in one
+    process must be seen by all of them.
+    Responses carry an ETag, and a matching If-None-Match gets a 304, so
+    clients and nginx can revalidate without transferring the body.
+    The mixin wraps get(), so views build their response in list() (or
+    another method the parent's get() calls) rather than overriding get().
+    """
+
+    def get_response_cache_version(self):
+        """Catalog version the response depends on; None disables caching."""
+        return get_catalog_version()
+
+    def get_response_cache_timeout(self):
+        """
+        A replica may not have applied the write behind the current version
+        yet: responses it served shortly after a write are only cached for
+        as long as replicas may lag.
+        """
+        if replica_used():
+            try:
+                last_write = cache.get(LAST_WRITE_KEY)
+            except Exception:
+                last_write = None
+            lag = settings.DB_REPLICA_MAX_LAG_SECONDS
+            if last_write is not None and time.time() - last_write < lag:
+                return lag
+        return settings.RESPONSE_CACHE_TIMEOUT
+
+    def get_response_cache_key(self, request):
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return None
+        version = self.get_response_cache_version()
+        if version is None:
+            return None
+        params = sorted(request.query_params.lists())
+        digest = hashlib.sha1(
+            json.dumps([request.path, params]).encode("utf-8")
+        ).hexdigest()
+        return f"response:{type(self).__name__}:v{version}:{digest}"
+
+    def get(self, request, *args, **kwargs):
+        key = self.get_response_cache_key(request)
+        cached = None
+        if key is not None:
+            try:
+                cached = cache.get(key)
+            except Exception as e:
+                logger.warning(f"Response cache read failed: {e}")
+
+        if cached is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            body = json.dumps(response.data, cls=DjangoJSONEncoder, sort_keys=True)
+            cached = {
+                "data": response.data,
+                "etag": f'"{hashlib.sha1(body.encode("utf-8")).hexdigest()}"',
+            }
+            if key is not None:
+                try:
+                    cache.set(key, cached, timeout=self.get_response_cache_timeout())
+                except Exception as e:
+                    logger.warning(f"Response cache write failed: {e}")
+
+        etag = cached["etag"]
+        if etag_matches(etag, request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response(cached["data"], headers={"ETag": etag})
@@ -0,0 +1,83 @@
+"""
+Per-connection PostgreSQL setup, run once per physical connection (a
+persistent connection, a pooled one or a PgBouncer client connection):
+
+- pgvector types are registered with psycopg, so query vectors passed
+  through vector_param() are bound as pgvector's binary format (1.5 KB)
+  instead of a ~4 KB text literal the server has to parse, and can be
+  reused by prepared statements (DB_SERVER_SIDE_BINDING).
+- Session defaults (hnsw.ef_search, hnsw.iterative_scan) are SET once, so
+  searches using the defaults need no transaction and no SET LOCAL round
+  trips; see products.search.session_options(). Behind PgBouncer in
+  transaction mode (DB_PGBOUNCER) session state does not stick to a
+  client, so every search sets its options locally instead.
+"""
+
+import logging
+import weakref
+
+import numpy as np
+import psycopg
+from django.conf import settings
+from pgvector import Vector
+from pgvector.psycopg import register_vector
+
+logger = logging.getLogger(__name__)
+
+# Raw psycopg connection -> session settings applied to it. Pools hand the
+# same physical connection to many Django connection objects, so state is
+# tracked per raw connection and dropped with it.
+_configured = weakref.WeakKeyDictionary()
+
+
+def session_defaults():
+    """Settings every connection starts with, as {name: value} strings."""
+    values = {"hnsw.ef_search": str(settings.PGVECTOR_HNSW_EF_SEARCH)}
+    if settings.PGVECTOR_ITERATIVE_SCAN != "off":
+        values["hnsw.iterative_scan"] = settings.PGVECTOR_ITERATIVE_SCAN
+    return values
+
+
+def configure_connection(sender, connection, **kwargs):
+    """connection_created receiver: registers vector types and session defaults."""
+    if connection.vendor != "postgresql":
+        return
+    raw = connection.connection
+    if raw in _configured:
+        return
+    try:
+        register_vector(raw)
+    except psycopg.ProgrammingError:
+        # The vector extension does not exist yet (before the first
+        # migrate): vectors are sent as text until the next connection
+        logger.info("pgvector types not found; vector parameters will be sent as text.")
+        return
+
+    applied = {}
+    if not settings.DB_PGBOUNCER:
+        with raw.cursor() as cursor:
+            for name, value in session_defaults().items():
+                cursor.execute("SELECT set_config(%s, %s, false)", [name, value])
+                applied[name] = value
+    _configured[raw] = applied
+
+
+def session_overrides(connection, values):
+    """The subset of ``values`` ({name: value}) the connection's session does not already have."""
+    connection.ensure_connection()
+    applied = _configured.get(connection.connection, {})
+    values = {name: str(value) for name, value in values.items()}
+    return {name: value for name, value in values.items() if applied.get(name) != value}
+
+
+def vector_param(vector, connection, vector_class=Vector):
+    """
+    A query vector as a bind parameter: a pgvector object (binary with
+    server-side binding) when the connection has the vector types
+    registered, otherwise its text form.
+    """
+    value = vector_class(np.asarray(vector, dtype=np.float32))
+    connection.ensure_connection()
+    if connection.connection in _configured:
+        return value
+    return value.to_text()
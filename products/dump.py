@@ -0,0 +1,146 @@
+"""
+Portable single-file embedding dumps (``manage.py export_embeddings --file``
+and ``manage.py load_embeddings``), for moving a re-embedded catalog
+between environments, seeding test databases and offline evaluation.
+
+Layout (little-endian, every section 64-byte aligned):
+- 4096-byte header: MAGIC followed by space-padded JSON with count, dim,
+  dtype, model and the byte offset of each section
+- ids: int64[count]
+- asins: S20[count]
+- hashes: S64[count] (embedding_hash of each row, hex)
+- vectors: float32 or float16 [count, dim], C-contiguous
+
+read_embedding_dump() maps the sections with numpy.memmap, so opening a
+dump copies nothing.
+"""
+
+import json
+import os
+
+import numpy as np
+
+MAGIC = b"PRDEMB01"
+HEADER_SIZE = 4096
+ALIGNMENT = 64
+ASIN_DTYPE = np.dtype("S20")
+HASH_DTYPE = np.dtype("S64")
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(count, dim, dtype):
+    offsets = {}
+    offset = HEADER_SIZE
+    for name, nbytes in [
+        ("ids", count * 8),
+        ("asins", count * ASIN_DTYPE.itemsize),
+        ("hashes", count * HASH_DTYPE.itemsize),
+        ("vectors", count * dim * np.dtype(dtype).itemsize),
+    ]:
+        offsets[name] = offset
+        offset = _align(offset + nbytes)
+    return offsets, offset
+
+
+class EmbeddingDump:
+    """Sections of a dump file; arrays are numpy.memmap views."""
+
+    def __init__(self, header, ids, asins, hashes, vectors):
+        self.header = header
+        self.ids = ids
+        self.asins = asins
+        self.hashes = hashes
+        self.vectors = vectors
+
+    @property
+    def model(self):
+        return self.header["model"]
+
+    def __len__(self):
+        return self.header["count"]
+
+
+def _write_header(f, header):
+    body = MAGIC + json.dumps(header).encode("utf-8")
+    if len(body) > HEADER_SIZE:
+        raise ValueError("Embedding dump header is too large")
+    f.seek(0)
+    f.write(body.ljust(HEADER_SIZE, b" "))
+
+
+def _map_sections(path, header, mode):
+    count, dim, offsets = header["count"], header["dim"], header["offsets"]
+
+    def section(name, dtype, shape):
+        if count == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode=mode, offset=offsets[name], shape=shape)
+
+    return (
+        section("ids", "<i8", (count,)),
+        section("asins", ASIN_DTYPE, (count,)),
+        section("hashes", HASH_DTYPE, (count,)),
+        section("vectors", np.dtype(header["dtype"]).newbyteorder("<"), (count, dim)),
+    )
+
+
+class EmbeddingDumpWriter:
+    """
+    Streams rows into a new dump of at most ``capacity`` rows. Sections are
+    preallocated, so rows can be written chunk by chunk without holding the
+    catalog in memory; close() records the number of rows actually written.
+    Writes to ``path.tmp`` and renames it into place on close.
+    """
+
+    def __init__(self, path, capacity, dim, dtype="float32", model=""):
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        offsets, size = _layout(capacity, dim, dtype)
+        self.header = {
+            "count": capacity,
+            "dim": dim,
+            "dtype": np.dtype(dtype).name,
+            "model": model,
+            "offsets": offsets,
+        }
+        with open(self.tmp_path, "wb") as f:
+            _write_header(f, self.header)
+            f.truncate(size)
+        self.ids, self.asins, self.hashes, self.vectors = _map_sections(
+            self.tmp_path, self.header, "r+"
+        )
+        self.count = 0
+        self.capacity = capacity
+
+    def write(self, ids, asins, hashes, vectors):
+        """Appends rows; returns how many fit (the rest are dropped)."""
+        n = min(len(ids), self.capacity - self.count)
+        end = self.count + n
+        self.ids[self.count : end] = ids[:n]
+        self.asins[self.count : end] = asins[:n]
+        self.hashes[self.count : end] = hashes[:n]
+        self.vectors[self.count : end] = np.asarray(vectors[:n], dtype=np.float32)
+        self.count = end
+        return n
+
+    def close(self):
+        for section in (self.ids, self.asins, self.hashes, self.vectors):
+            if isinstance(section, np.memmap):
+                section.flush()
+        del self.ids, self.asins, self.hashes, self.vectors
+        self.header["count"] = self.count
+        with open(self.tmp_path, "r+b") as f:
+            _write_header(f, self.header)
+        os.replace(self.tmp_path, self.path)
+
+
+def read_embedding_dump(path) -> EmbeddingDump:
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{path} is not an embedding dump")
+    header = json.loads(raw[len(MAGIC) :].decode("utf-8").rstrip())
+    return EmbeddingDump(header, *_map_sections(path, header, "r"))
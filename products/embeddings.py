@@ -0,0 +1,687 @@
+"""
+Single entry point for turning product and query text into vectors.
+
+The API views, the Celery tasks and the management commands all call
+``encode()``; which encoder serves it is chosen by EMBEDDING_ENCODER:
+
+- "local": the model is loaded lazily, once per process, on first use
+  (thread-safe). Under gunicorn with ``preload_app`` the master loads the
+  weights before forking, so workers share them copy-on-write.
+  EMBEDDING_INFERENCE_BACKEND picks PyTorch ("torch") or an int8-quantized
+  ONNX Runtime export of the same model ("onnx").
+- "socket": texts are sent over a Unix socket to ``manage.py run_encoder``,
+  a single process per host that holds the only copy of the model and
+  batches requests from every API worker together.
+
+Bulk paths (the embedding task and ``generate_embeddings``) call
+``encode_documents()`` instead: products are tokenized first, their
+descriptions cut to EMBEDDING_DESCRIPTION_TOKENS, and texts of similar
+token length are encoded together so each batch is padded only to its own
+longest text.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LocalEncoder:
+    """Runs the SentenceTransformer model inside the current process."""
+
+    # SentenceTransformer.encode() orders each call's texts by character length
+    sorts_by_length = True
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # Imported here so processes that never encode (migrate,
+                    # CRUD-only workers) do not pay for torch
+                    from sentence_transformers import SentenceTransformer
+
+                    logger.info(f"Loading SentenceTransformer model {self.model_name}...")
+                    self._model = SentenceTransformer(self.model_name, device="cpu")
+                    logger.info("Model loaded successfully.")
+        return self._model
+
+    def load(self):
+        return self.model
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self):
+        return self.model.max_seq_length
+
+    def encode(self, texts, batch_size=64):
+        return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+    def encode_documents(self, documents, batch_size=64, description_tokens=0):
+        return schedule_encode(self, documents, batch_size, description_tokens)
+
+
+class OnnxEncoder:
+    """
+    Runs the model exported by ``manage.py export_onnx_model`` through ONNX
+    Runtime. Reproduces the sentence-transformers pipeline of all-MiniLM-L6-v2
+    (tokenize, mean pooling over the attention mask, L2 normalization), so it
+    is a drop-in for LocalEncoder.
+    """
+
+    def __init__(self, model_dir, file_name="model_int8.onnx", threads=1, max_seq_length=256):
+        self.model_dir = model_dir
+        self.file_name = file_name
+        self.threads = threads
+        self.max_seq_length = max_seq_length
+        self._session = None
+        self._tokenizer = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    import onnxruntime as ort
+                    from transformers import AutoTokenizer
+
+                    options = ort.SessionOptions()
+                    options.intra_op_num_threads = self.threads
+                    options.inter_op_num_threads = 1
+                    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+                    options.graph_optimization_level = (
+                        ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                    )
+                    path = os.path.join(self.model_dir, self.file_name)
+                    logger.info(f"Loading ONNX model {path}...")
+                    self._tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+                    self._session = ort.InferenceSession(
+                        path, options, providers=["CPUExecutionProvider"]
+                    )
+                    self._input_names = {i.name for i in self._session.get_inputs()}
+                    logger.info("ONNX model loaded successfully.")
+        return self._session
+
+    @property
+    def tokenizer(self):
+        self.load()
+        return self._tokenizer
+
+    def encode(self, texts, batch_size=64):
+        session = self.load()
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self._tokenizer(
+                texts[start : start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            inputs = {
+                name: value.astype(np.int64)
+                for name, value in tokens.items()
+                if name in self._input_names
+            }
+            hidden = session.run(None, inputs)[0]
+
+            # Mean pooling over real (non-padding) tokens, then L2 normalize
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append(pooled.astype(np.float32))
+
+        vectors = np.concatenate(batches) if batches else np.empty((0, 0), np.float32)
+        return vectors[0] if single else vectors
+
+    def encode_documents(self, documents, batch_size=64, description_tokens=0):
+        return schedule_encode(self, documents, batch_size, description_tokens)
+
+
+def encoder_id():
+    """
+    Identifies the vectors the configured encoder produces: the model name,
+    plus the ONNX export for EMBEDDING_INFERENCE_BACKEND=onnx (int8 vectors
+    differ from the torch ones). With EMBEDDING_ENCODER=socket the backend
+    setting must match the one run_encoder uses.
+    """
+    if settings.EMBEDDING_INFERENCE_BACKEND == "onnx":
+        export = os.path.splitext(settings.EMBEDDING_ONNX_FILE)[0]
+        return f"{settings.EMBEDDING_MODEL_NAME}@onnx-{export}"
+    return settings.EMBEDDING_MODEL_NAME
+
+
+def build_local_encoder(backend=None):
+    """In-process encoder for EMBEDDING_INFERENCE_BACKEND (or ``backend``)."""
+    backend = backend or settings.EMBEDDING_INFERENCE_BACKEND
+    if backend == "onnx":
+        return OnnxEncoder(
+            settings.EMBEDDING_ONNX_DIR,
+            file_name=settings.EMBEDDING_ONNX_FILE,
+            threads=settings.EMBEDDING_ONNX_THREADS,
+        )
+    return LocalEncoder(settings.EMBEDDING_MODEL_NAME)
+
+
+# --- Bulk encoding ---
+
+
+class BulkEncodeStats:
+    """
+    Counters of bulk encodes. ``padded_slots`` is the number of token
+    positions the model actually ran (batch size x longest text, per batch);
+    ``baseline_slots`` what the same texts cost when passed to the encoder
+    in one call, as before the scheduler: SentenceTransformer.encode()
+    orders each call by character length, ONNX batches in input order.
+    """
+
+    def __init__(self):
+        self.documents = 0
+        self.batches = 0
+        self.tokens = 0
+        self.padded_slots = 0
+        self.baseline_slots = 0
+        self.truncated = 0
+        self.seconds = 0.0
+
+    def add(self, other):
+        for name in vars(self):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+    @property
+    def padding_waste(self):
+        """Share of the token positions run by the model that were padding."""
+        return 1 - self.tokens / self.padded_slots if self.padded_slots else 0.0
+
+    @property
+    def baseline_padding_waste(self):
+        return 1 - self.tokens / self.baseline_slots if self.baseline_slots else 0.0
+
+    @property
+    def docs_per_sec(self):
+        return self.documents / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "documents": self.documents,
+            "batches": self.batches,
+            "tokens": self.tokens,
+            "truncated": self.truncated,
+            "padding_waste": round(self.padding_waste, 4),
+            "baseline_padding_waste": round(self.baseline_padding_waste, 4),
+            "docs_per_sec": round(self.docs_per_sec, 1),
+        }
+
+
+def truncate_to_tokens(tokenizer, texts, budget):
+    """
+    Cuts each text after its first ``budget`` tokens, at the end of that
+    token in the original string (no decode round trip, so casing and
+    spacing are kept). Returns (texts, number of texts cut).
+    """
+    encoded = tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+    result, truncated = [], 0
+    for text, offsets in zip(texts, encoded["offset_mapping"]):
+        if len(offsets) > budget:
+            text = text[: offsets[budget - 1][1]]
+            truncated += 1
+        result.append(text)
+    return result, truncated
+
+
+def token_lengths(tokenizer, texts, max_length):
+    """Tokens per text as the model sees them: special tokens included, capped at ``max_length``."""
+    encoded = tokenizer(texts, truncation=True, max_length=max_length)
+    return np.array([len(ids) for ids in encoded["input_ids"]], dtype=np.int64)
+
+
+def plan_batches(lengths, batch_size):
+    """
+    Groups text indices into batches of similar token length, longest
+    first, so every batch is padded only to its own longest text.
+    """
+    order = np.argsort(-lengths, kind="stable")
+    return [order[start : start + batch_size] for start in range(0, len(order), batch_size)]
+
+
+def padded_slots(lengths, batches):
+    """Token positions run for ``batches``: each is padded to its longest text."""
+    return int(sum(len(batch) * lengths[batch].max() for batch in batches))
+
+
+def schedule_encode(encoder, documents, batch_size=64, description_tokens=0):
+    """
+    Encodes (title, description) pairs through a local encoder in length
+    buckets. With ``description_tokens`` each description is cut to that
+    many tokens first; the title is always kept whole. Returns the vectors
+    in input order and a BulkEncodeStats.
+    """
+    started = time.perf_counter()
+    stats = BulkEncodeStats()
+    if not documents:
+        return np.empty((0, 0), np.float32), stats
+
+    tokenizer = encoder.tokenizer
+    titles = [title for title, _ in documents]
+    descriptions = [description for _, description in documents]
+    if description_tokens:
+        descriptions, stats.truncated = truncate_to_tokens(
+            tokenizer, descriptions, description_tokens
+        )
+    texts = [f"{title} {description}" for title, description in zip(titles, descriptions)]
+
+    lengths = token_lengths(tokenizer, texts, encoder.max_seq_length)
+    batches = plan_batches(lengths, batch_size)
+    vectors = None
+    for batch in batches:
+        batch_vectors = encoder.encode([texts[i] for i in batch], batch_size=len(batch))
+        if vectors is None:
+            vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+        vectors[batch] = batch_vectors
+
+    if getattr(encoder, "sorts_by_length", False):
+        baseline_order = np.argsort([-len(text) for text in texts], kind="stable")
+    else:
+        baseline_order = np.arange(len(texts))
+    baseline = [
+        baseline_order[start : start + batch_size] for start in range(0, len(texts), batch_size)
+    ]
+    stats.documents = len(texts)
+    stats.batches = len(batches)
+    stats.tokens = int(lengths.sum())
+    stats.padded_slots = padded_slots(lengths, batches)
+    stats.baseline_slots = padded_slots(lengths, baseline)
+    stats.seconds = time.perf_counter() - started
+    return vectors, stats
+
+
+# --- Unix socket protocol ---
+# Request:  uint32 length + UTF-8 JSON {"texts": [...], "batch_size": n}, or
+#           {"documents": [[title, description], ...], "batch_size": n,
+#           "description_tokens": n} for a scheduled bulk encode
+# Response: uint8 status + uint32 rows + uint32 dims, then rows*dims float32
+#           (status 0) or a UTF-8 error message of `rows` bytes (status 1).
+_REQUEST_HEADER = struct.Struct(">I")
+_RESPONSE_HEADER = struct.Struct(">BII")
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("Encoder socket closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+class SocketEncoder:
+    """Client for EncoderServer; keeps one connection per thread and process."""
+
+    def __init__(self, path, timeout=30.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None and self._local.pid != os.getpid():
+            # Inherited through fork() (e.g. opened by preload() in the
+            # gunicorn master): sharing the stream would interleave frames
+            # and hand one process another's vectors. Close our copy only.
+            sock.close()
+            sock = None
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+            self._local.pid = os.getpid()
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def load(self):
+        self._connection()
+
+    def encode(self, texts, batch_size=64):
+        single = isinstance(texts, str)
+        vectors = self._request(
+            {"texts": [texts] if single else list(texts), "batch_size": batch_size}
+        )
+        return vectors[0] if single else vectors
+
+    def encode_documents(self, documents, batch_size=64, description_tokens=0):
+        """Scheduled in the encoder process, which logs the padding stats (returned as None)."""
+        vectors = self._request(
+            {
+                "documents": [list(document) for document in documents],
+                "batch_size": batch_size,
+                "description_tokens": description_tokens,
+            }
+        )
+        return vectors, None
+
+    def _request(self, request):
+        payload = json.dumps(request).encode("utf-8")
+
+        # Retry once on a fresh connection (e.g. after an encoder restart)
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                sock.sendall(_REQUEST_HEADER.pack(len(payload)) + payload)
+                status, rows, dims = _RESPONSE_HEADER.unpack(
+                    _recv_exactly(sock, _RESPONSE_HEADER.size)
+                )
+                if status != 0:
+                    message = _recv_exactly(sock, rows).decode("utf-8")
+                    raise RuntimeError(f"Encoder error: {message}")
+                body = _recv_exactly(sock, rows * dims * 4)
+                break
+            except OSError:
+                self._close()
+                if attempt:
+                    raise
+
+        return np.frombuffer(body, dtype=np.float32).reshape(rows, dims)
+
+
+class _PendingRequest:
+    def __init__(self, texts, batch_size):
+        self.texts = texts
+        self.batch_size = batch_size
+        self.future = Future()
+
+
+class MicroBatchEncoder:
+    """
+    Coalesces concurrent encode requests into shared forward passes.
+
+    A background thread takes the first queued request, keeps collecting
+    requests for up to ``max_wait_ms`` (or until ``max_batch_size`` texts),
+    encodes them in one call and hands each caller its own rows. Trades a
+    few milliseconds of latency for much better throughput under load.
+    """
+
+    def __init__(self, encoder, max_batch_size=32, max_wait_ms=5.0):
+        self.encoder = encoder
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.pending = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker_pid = None
+        self.requests = 0
+        self.batches = 0
+        self.batched_texts = 0
+        self.largest_batch = 0
+
+    def load(self):
+        self.encoder.load()
+
+    def _ensure_worker(self):
+        # Threads do not survive fork(): (re)start one per process
+        if self._worker_pid != os.getpid():
+            with self._lock:
+                if self._worker_pid != os.getpid():
+                    self.pending = queue.Queue()
+                    threading.Thread(target=self._run, daemon=True).start()
+                    self._worker_pid = os.getpid()
+
+    def submit(self, texts, batch_size=64):
+        """Queues a list of texts; the returned future resolves to their rows."""
+        self._ensure_worker()
+        request = _PendingRequest(list(texts), batch_size)
+        self.pending.put(request)
+        return request.future
+
+    def encode(self, texts, batch_size=64):
+        single = isinstance(texts, str)
+        vectors = self.submit([texts] if single else texts, batch_size).result()
+        return vectors[0] if single else vectors
+
+    def _collect(self):
+        batch = [self.pending.get()]
+        total = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        while total < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    request = self.pending.get(timeout=remaining)
+                else:
+                    request = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            total += len(request.texts)
+        return batch, total
+
+    def _run(self):
+        while True:
+            batch, total = self._collect()
+            with self._lock:
+                self.requests += len(batch)
+                self.batches += 1
+                self.batched_texts += total
+                self.largest_batch = max(self.largest_batch, total)
+
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self.encoder.encode(
+                    texts, batch_size=max(request.batch_size for request in batch)
+                )
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            start = 0
+            for request in batch:
+                end = start + len(request.texts)
+                request.future.set_result(vectors[start:end])
+                start = end
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self.pending.qsize(),
+                "requests": self.requests,
+                "batches": self.batches,
+                "mean_batch_size": round(self.batched_texts / self.batches, 2)
+                if self.batches
+                else 0.0,
+                "largest_batch": self.largest_batch,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+class _EncoderRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # Connections are persistent: serve requests until the client hangs up
+        while True:
+            try:
+                (length,) = _REQUEST_HEADER.unpack(
+                    _recv_exactly(self.request, _REQUEST_HEADER.size)
+                )
+                request = json.loads(_recv_exactly(self.request, length))
+            except ConnectionError:
+                return
+
+            try:
+                if "documents" in request:
+                    vectors = self.server.encode_documents(
+                        request["documents"],
+                        request.get("batch_size", 64),
+                        request.get("description_tokens", 0),
+                    )
+                else:
+                    vectors = self.server.submit(
+                        request["texts"], request.get("batch_size", 64)
+                    ).result()
+            except Exception as e:
+                message = str(e).encode("utf-8")
+                self.request.sendall(_RESPONSE_HEADER.pack(1, len(message), 0) + message)
+                continue
+
+            vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+            rows, dims = vectors.shape
+            self.request.sendall(_RESPONSE_HEADER.pack(0, rows, dims) + vectors.tobytes())
+
+
+class EncoderServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Serves an encoder over a Unix socket. One thread per client connection
+    queues requests on a MicroBatchEncoder, which combines requests from
+    all clients into shared forward passes.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, encoder, max_batch_size=256, max_wait_ms=0.0):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, _EncoderRequestHandler)
+        self.batcher = MicroBatchEncoder(encoder, max_batch_size, max_wait_ms)
+
+    def submit(self, texts, batch_size):
+        return self.batcher.submit(texts, batch_size)
+
+    def encode_documents(self, documents, batch_size, description_tokens):
+        # Bulk requests are already large: scheduled directly, not micro-batched
+        vectors, stats = schedule_encode(
+            self.batcher.encoder, documents, batch_size, description_tokens
+        )
+        logger.info(f"Bulk encode: {stats.as_dict()}")
+        return vectors
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    """Returns the process-wide encoder selected by EMBEDDING_ENCODER."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                if settings.EMBEDDING_ENCODER == "socket":
+                    _encoder = SocketEncoder(settings.EMBEDDING_ENCODER_SOCKET)
+                else:
+                    _encoder = build_local_encoder()
+    return _encoder
+
+
+def encode(texts, batch_size=64):
+    """
+    Encodes one text (returns a 1-D float32 array) or a list of texts
+    (returns a 2-D array with one row per text).
+    """
+    return get_encoder().encode(texts, batch_size=batch_size)
+
+
+def encode_documents(documents, batch_size=64):
+    """
+    Encodes (title, description) pairs for storage, in length buckets and
+    with descriptions cut to EMBEDDING_DESCRIPTION_TOKENS. Returns a 2-D
+    array with one row per pair and a BulkEncodeStats (None when a remote
+    encoder did the work).
+    """
+    return get_encoder().encode_documents(
+        documents,
+        batch_size=batch_size,
+        description_tokens=settings.EMBEDDING_DESCRIPTION_TOKENS,
+    )
+
+
+_query_encoder = None
+
+
+def get_query_encoder():
+    """
+    Encoder for latency-sensitive single queries (semantic/hybrid search):
+    the process encoder behind a MicroBatchEncoder when EMBEDDING_MICROBATCH
+    is on, so concurrent searches share forward passes.
+    """
+    global _query_encoder
+    if _query_encoder is None:
+        with _encoder_lock:
+            if _query_encoder is None:
+                _query_encoder = get_encoder()
+                if settings.EMBEDDING_MICROBATCH:
+                    _query_encoder = MicroBatchEncoder(
+                        _query_encoder,
+                        max_batch_size=settings.EMBEDDING_MICROBATCH_MAX_SIZE,
+                        max_wait_ms=settings.EMBEDDING_MICROBATCH_MAX_WAIT_MS,
+                    )
+    return _query_encoder
+
+
+def encode_query(text):
+    """Encodes a single search query (1-D float32 array)."""
+    return get_query_encoder().encode(text)
+
+
+_async_executor = None
+
+
+def get_async_executor():
+    """
+    Bounded thread pool that runs encodes on behalf of the async views.
+    At most EMBEDDING_ASYNC_WORKERS encodes run at once; further requests
+    wait on the event loop without holding a thread.
+    """
+    global _async_executor
+    if _async_executor is None:
+        with _encoder_lock:
+            if _async_executor is None:
+                _async_executor = ThreadPoolExecutor(
+                    max_workers=settings.EMBEDDING_ASYNC_WORKERS,
+                    thread_name_prefix="encode",
+                )
+    return _async_executor
+
+
+async def run_in_encoder_executor(func, *args):
+    """Awaits ``func(*args)`` on the encoder thread pool."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_async_executor(), func, *args)
+
+
+def preload():
+    """Loads the model weights (or connects to the encoder) without running inference."""
+    get_encoder().load()
+
+
+def warm_up():
+    """Runs one forward pass so the first real request does not pay for it."""
+    get_encoder().encode(["warm up"])
@@ -0,0 +1,539 @@
+"""
+Pluggable vector search engines, selected by SEARCH_ENGINE.
+
+- "pgvector": distances are computed by PostgreSQL (HNSW indexes).
+- "memory": an in-process index over a snapshot exported with
+  ``manage.py export_embeddings``, so vector math does not load the database
+  that serves CRUD. The snapshot matrix is memory-mapped, so every worker on
+  a host shares one copy through the page cache. Small catalogs are searched
+  with a brute-force BLAS matmul; catalogs of SEARCH_HNSW_MIN_PRODUCTS or more
+  use an HNSW graph (hnswlib) saved alongside the snapshot. Category and
+  price filters use bitmaps and a price order precomputed at export time.
+  Rows changed after the export are read from an embedding-change feed (a
+  Redis stream) and searched from a small in-memory overlay until the next
+  snapshot is published.
+"""
+
+import json
+import logging
+import math
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+from .cache import get_redis
+from .models import Product, embedding_model_id
+from .search import fetch_nearest
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+HNSW_FILE = "hnsw.bin"
+# Rows multiplied per block when scanning a float16 matrix (bounded upcast)
+BLOCK_ROWS = 65536
+# Filtered candidate sets up to this size are scanned exactly instead of HNSW
+BRUTE_FORCE_MAX_ROWS = 65536
+# Most graph candidates fetched for one filtered search before the exact scan
+HNSW_MAX_FETCH = 8192
+
+
+# --- Change feed ---
+
+
+def publish_embedding_changes(product_ids):
+    """
+    Appends changed or deleted product ids to the embedding-change feed read
+    by the in-memory engine. A no-op when the pgvector engine is in use.
+    """
+    if settings.SEARCH_ENGINE != "memory" or not product_ids:
+        return
+    try:
+        get_redis(settings.SEARCH_FEED_REDIS_URL).xadd(
+            settings.SEARCH_FEED_STREAM,
+            {"ids": ",".join(str(pk) for pk in product_ids)},
+            maxlen=settings.SEARCH_FEED_MAXLEN,
+            approximate=True,
+        )
+    except Exception as e:
+        logger.warning(f"Could not publish embedding changes: {e}")
+
+
+def get_feed_position():
+    """Id of the newest feed entry ("0-0" if empty or unavailable)."""
+    try:
+        entries = get_redis(settings.SEARCH_FEED_REDIS_URL).xrevrange(
+            settings.SEARCH_FEED_STREAM, count=1
+        )
+    except Exception as e:
+        logger.warning(f"Embedding-change feed unavailable: {e}")
+        return "0-0"
+    return entries[0][0].decode() if entries else "0-0"
+
+
+# --- Snapshots ---
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def write_snapshot(root, ids, vectors, categories, prices, dtype="float32", feed_position="0-0"):
+    """
+    Writes a snapshot directory under ``root`` and points CURRENT at it.
+    Readers switch on their next poll; snapshots older than the previous one
+    are removed.
+    - ids.npy: int64 product ids, ascending
+    - vectors.npy: L2-normalized embeddings (float32 or float16)
+    - category_bitmaps.npy: one packed bitmap per entry of meta["categories"]
+    - price_order.npy / sorted_prices.npy: rows by ascending price (no NULLs)
+    - hnsw.bin: HNSW graph, only for catalogs of SEARCH_HNSW_MIN_PRODUCTS+
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    vectors = normalize_rows(vectors)[order].astype(dtype)
+    categories = [categories[i] for i in order]
+    prices = np.asarray(
+        [np.nan if p is None else p for p in prices], dtype=np.float64
+    )[order]
+
+    names = sorted(set(categories))
+    code_of = {name: code for code, name in enumerate(names)}
+    codes = np.asarray([code_of[c] for c in categories], dtype=np.int32)
+    bitmaps = np.stack(
+        [np.packbits(codes == code) for code in range(len(names))]
+    ) if names else np.zeros((0, 0), dtype=np.uint8)
+
+    priced = np.flatnonzero(~np.isnan(prices))
+    price_order = priced[np.argsort(prices[priced], kind="stable")]
+
+    name = f"snapshot-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    np.save(os.path.join(path, "ids.npy"), ids)
+    np.save(os.path.join(path, "vectors.npy"), vectors)
+    np.save(os.path.join(path, "category_bitmaps.npy"), bitmaps)
+    np.save(os.path.join(path, "price_order.npy"), price_order)
+    np.save(os.path.join(path, "sorted_prices.npy"), prices[price_order])
+
+    if len(ids) >= settings.SEARCH_HNSW_MIN_PRODUCTS:
+        build_hnsw(path, vectors)
+
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "count": len(ids),
+                "dtype": dtype,
+                "categories": names,
+                "model": embedding_model_id(),
+                "feed_position": feed_position,
+            },
+            f,
+        )
+
+    # Write-then-rename so readers never see a half-written pointer
+    previous = read_current(root)
+    tmp_path = os.path.join(root, f"{CURRENT_FILE}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+    # Workers may still have the previous snapshot mapped; keep it
+    for entry in os.listdir(root):
+        if entry.startswith("snapshot-") and entry not in (name, previous):
+            shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+    return path
+
+
+def read_snapshot_meta(path):
+    with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_current(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def build_hnsw(path, vectors):
+    try:
+        import hnswlib
+    except ImportError:
+        logger.warning("hnswlib is not installed; the snapshot will be searched by brute force.")
+        return
+    index = hnswlib.Index(space="cosine", dim=vectors.shape[1])
+    index.init_index(max_elements=len(vectors), ef_construction=200, M=16)
+    # Labels are row numbers in the snapshot matrix
+    index.add_items(vectors.astype(np.float32), np.arange(len(vectors)))
+    index.save_index(os.path.join(path, HNSW_FILE))
+
+
+class Snapshot:
+    """Read-only view of one snapshot directory (arrays are memory-mapped)."""
+
+    def __init__(self, path):
+        self.meta = read_snapshot_meta(path)
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.category_bitmaps = np.load(
+            os.path.join(path, "category_bitmaps.npy"), mmap_mode="r"
+        )
+        self.price_order = np.load(os.path.join(path, "price_order.npy"), mmap_mode="r")
+        self.sorted_prices = np.load(os.path.join(path, "sorted_prices.npy"), mmap_mode="r")
+        self.category_codes = {name: code for code, name in enumerate(self.meta["categories"])}
+        self.hnsw = None
+
+        hnsw_path = os.path.join(path, HNSW_FILE)
+        if os.path.exists(hnsw_path):
+            try:
+                import hnswlib
+
+                self.hnsw = hnswlib.Index(space="cosine", dim=self.vectors.shape[1])
+                self.hnsw.load_index(hnsw_path, max_elements=len(self.ids))
+            except ImportError:
+                logger.warning("hnswlib is not installed; searching the snapshot by brute force.")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows_for(self, product_ids):
+        """Row numbers of the given ids that exist in the snapshot."""
+        product_ids = np.asarray(list(product_ids), dtype=np.int64)
+        if len(product_ids) == 0 or len(self) == 0:
+            return np.zeros(0, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, product_ids), len(self) - 1)
+        return rows[self.ids[rows] == product_ids]
+
+    def filter_mask(self, category=None, min_price=None, max_price=None):
+        """Boolean row mask for the filters, or None when nothing is filtered."""
+        mask = None
+        if category is not None:
+            code = self.category_codes.get(category)
+            if code is None:
+                return np.zeros(len(self), dtype=bool)
+            mask = np.unpackbits(self.category_bitmaps[code], count=len(self)).astype(bool)
+        if min_price is not None or max_price is not None:
+            lo = 0 if min_price is None else np.searchsorted(self.sorted_prices, min_price, "left")
+            hi = (
+                len(self.sorted_prices)
+                if max_price is None
+                else np.searchsorted(self.sorted_prices, max_price, "right")
+            )
+            price_mask = np.zeros(len(self), dtype=bool)
+            price_mask[self.price_order[lo:hi]] = True
+            mask = price_mask if mask is None else mask & price_mask
+        return mask
+
+    def brute_force(self, query, k, rows=None):
+        """Top-k (row, distance) by cosine distance, over ``rows`` or all rows."""
+        count = len(self) if rows is None else len(rows)
+        k = min(k, count)
+        if k == 0:
+            return []
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, BLOCK_ROWS):
+            block = (
+                self.vectors[start : start + BLOCK_ROWS]
+                if rows is None
+                else self.vectors[rows[start : start + BLOCK_ROWS]]
+            )
+            scores[start : start + len(block)] = block.astype(np.float32, copy=False) @ query
+        top = np.argpartition(-scores, k - 1)[:k]
+        row_numbers = top if rows is None else rows[top]
+        return list(zip(row_numbers.tolist(), (1.0 - scores[top]).tolist()))
+
+    def hnsw_search(self, query, k, mask):
+        """
+        Top-k by HNSW, keeping rows allowed by ``mask``; may return fewer.
+        The graph does not know the filters, so candidates are over-fetched
+        by the mask's selectivity and doubled until k rows pass or
+        HNSW_MAX_FETCH is reached (like pgvector's iterative scans).
+        """
+        limit = min(len(self), max(k, HNSW_MAX_FETCH))
+        if mask is None:
+            fetch = min(k, limit)
+        else:
+            allowed = int(mask.sum())
+            if allowed == 0:
+                return []
+            fetch = min(limit, max(k * 4, math.ceil(k * len(self) / allowed)))
+        while True:
+            self.hnsw.set_ef(max(settings.PGVECTOR_HNSW_EF_SEARCH, fetch))
+            labels, distances = self.hnsw.knn_query(query, k=fetch)
+            hits = [
+                (int(row), float(distance))
+                for row, distance in zip(labels[0], distances[0])
+                if mask is None or mask[row]
+            ]
+            if len(hits) >= k or fetch >= limit:
+                return hits[:k]
+            fetch = min(limit, fetch * 2)
+
+
+class SearchEngine:
+    """
+    Vector search backend used by the recommendation and semantic search views.
+    - search(vector): sliceable, distance-ordered products annotated with 'distance'.
+    - similar_to(target, k): up to k recommendations with the similar_to() filters.
+    """
+
+    def search(self, vector):
+        raise NotImplementedError
+
+    def similar_to(self, target, k):
+        raise NotImplementedError
+
+
+class PgvectorEngine(SearchEngine):
+    def search(self, vector):
+        return (
+            Product.objects.filter(embedding__isnull=False)
+            .order_by_distance(vector)
+            .for_read()
+        )
+
+    def similar_to(self, target, k):
+        return fetch_nearest(Product.objects.similar_to(target).for_read(), k)
+
+
+class RankedResults:
+    """
+    Lazy, sliceable result list for the memory engine, so the standard
+    paginator can page it: only the top ``stop`` ids are ranked and only the
+    requested slice is loaded from the database.
+    """
+
+    def __init__(self, engine, vector):
+        self.engine = engine
+        self.vector = vector
+
+    def count(self):
+        return self.engine.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            return self[item : item + 1][0]
+        start = item.start or 0
+        stop = self.count() if item.stop is None else item.stop
+        hits = self.engine.nearest(self.vector, stop)[start:]
+        return self.engine.load_products(hits)
+
+
+class EngineState:
+    """
+    What a memory-engine search reads, published as one object: the snapshot,
+    its rows that are stale (changed or deleted since the export) and the
+    rows changed since (id -> (vector, category, price)). The feed consumer
+    and snapshot reloads build a new state and swap the reference, so a
+    search never pairs one snapshot with another's shadow mask.
+    """
+
+    __slots__ = ("snapshot", "name", "shadowed", "overlay")
+
+    def __init__(self, snapshot, name, shadowed, overlay):
+        shadowed.setflags(write=False)
+        self.snapshot = snapshot
+        self.name = name
+        self.shadowed = shadowed
+        self.overlay = overlay
+
+
+class MemoryEngine(SearchEngine):
+    def __init__(self, root=None):
+        self.root = root or str(settings.SEARCH_SNAPSHOT_DIR)
+        self.state = None
+        self.feed_position = "0-0"
+        # Serializes writers (reloads, feed consumption); readers only take
+        # a reference to self.state
+        self._lock = threading.Lock()
+        self._last_poll = 0.0
+
+    @property
+    def snapshot(self):
+        return None if self.state is None else self.state.snapshot
+
+    # Freshness
+
+    def refresh(self, force=False):
+        """Loads a newer snapshot and applies pending feed entries."""
+        now = time.monotonic()
+        if not force and now - self._last_poll < settings.SEARCH_FEED_POLL_SECONDS:
+            return
+        with self._lock:
+            self._last_poll = now
+            name = read_current(self.root)
+            if name is None:
+                raise RuntimeError(
+                    f"No embedding snapshot in {self.root}; run `manage.py export_embeddings`."
+                )
+            if self.state is None or name != self.state.name:
+                model = read_snapshot_meta(os.path.join(self.root, name))["model"]
+                if model == embedding_model_id():
+                    self._load(name)
+                else:
+                    # Queries are encoded with the configured model: vectors
+                    # from another model or backend rank meaninglessly
+                    message = (
+                        f"Embedding snapshot {name} was produced by {model}, this "
+                        f"environment uses {embedding_model_id()}; re-run "
+                        "`manage.py export_embeddings`."
+                    )
+                    if self.state is None:
+                        raise RuntimeError(message)
+                    logger.error(f"{message} Keeping snapshot {self.state.name}.")
+            self._apply_feed()
+
+    def _load(self, name):
+        snapshot = Snapshot(os.path.join(self.root, name))
+        logger.info(f"Loaded embedding snapshot {name} ({len(snapshot)} products).")
+        self.feed_position = snapshot.meta["feed_position"]
+        self.state = EngineState(snapshot, name, np.zeros(len(snapshot), dtype=bool), {})
+
+    def _apply_feed(self):
+        try:
+            client = get_redis(settings.SEARCH_FEED_REDIS_URL)
+            changed = set()
+            while True:
+                response = client.xread(
+                    {settings.SEARCH_FEED_STREAM: self.feed_position}, count=1000
+                )
+                if not response:
+                    break
+                for entry_id, fields in response[0][1]:
+                    self.feed_position = entry_id.decode()
+                    changed.update(int(pk) for pk in fields[b"ids"].decode().split(",") if pk)
+        except Exception as e:
+            logger.warning(f"Embedding-change feed unavailable, results may be stale: {e}")
+            return
+        if changed:
+            self._apply_changes(changed)
+
+    def _apply_changes(self, product_ids):
+        rows = {
+            pk: (embedding, category, price)
+            for pk, embedding, category, price in Product.objects.filter(
+                id__in=product_ids
+            ).values_list("id", "embedding", "category", "price")
+        }
+        # Copy-on-write: searches running in other threads keep the old state
+        state = self.state
+        overlay = dict(state.overlay)
+        for pk in product_ids:
+            embedding, category, price = rows.get(pk, (None, None, None))
+            if embedding is None:
+                # Deleted, or waiting for its embedding
+                overlay.pop(pk, None)
+            else:
+                overlay[pk] = (normalize_rows(embedding), category, price)
+        shadowed = state.shadowed.copy()
+        shadowed[state.snapshot.rows_for(product_ids)] = True
+        self.state = EngineState(state.snapshot, state.name, shadowed, overlay)
+
+    # Search
+
+    def count(self):
+        self.refresh()
+        state = self.state
+        return int(len(state.snapshot) - state.shadowed.sum() + len(state.overlay))
+
+    def nearest(self, vector, k, category=None, min_price=None, max_price=None, exclude_ids=()):
+        """Top-k (product_id, distance), nearest first, ties broken by id."""
+        self.refresh()
+        # One reference: the feed consumer may publish a new state meanwhile
+        state = self.state
+        snapshot, shadowed, overlay = state.snapshot, state.shadowed, state.overlay
+        query = normalize_rows(vector)
+
+        mask = snapshot.filter_mask(category, min_price, max_price)
+        if shadowed.any() or exclude_ids:
+            mask = np.ones(len(snapshot), dtype=bool) if mask is None else mask.copy()
+            mask &= ~shadowed
+            mask[snapshot.rows_for(exclude_ids)] = False
+
+        hits = []
+        allowed = len(snapshot) if mask is None else int(mask.sum())
+        use_hnsw = snapshot.hnsw is not None and allowed > BRUTE_FORCE_MAX_ROWS
+        if use_hnsw:
+            hits = snapshot.hnsw_search(query, k, mask)
+        if len(hits) < min(k, allowed):
+            # Small candidate set, or the graph came up short even after
+            # growing the fetch: exact scan (like fetch_nearest's refill)
+            if use_hnsw:
+                logger.info(
+                    f"HNSW search returned {len(hits)}/{k} rows; refilled with an exact scan."
+                )
+            rows = None if mask is None else np.flatnonzero(mask)
+            hits = snapshot.brute_force(query, k, rows)
+        results = [(int(snapshot.ids[row]), distance) for row, distance in hits]
+
+        excluded = set(exclude_ids)
+        for pk, (embedding, item_category, price) in overlay.items():
+            if pk in excluded or (category is not None and item_category != category):
+                continue
+            if min_price is not None or max_price is not None:
+                if price is None:
+                    continue
+                if (min_price is not None and price < min_price) or (
+                    max_price is not None and price > max_price
+                ):
+                    continue
+            results.append((pk, float(1.0 - embedding @ query)))
+
+        results.sort(key=lambda hit: (hit[1], hit[0]))
+        return results[:k]
+
+    def load_products(self, hits):
+        products = Product.objects.for_read().in_bulk([pk for pk, _ in hits])
+        results = []
+        for pk, distance in hits:
+            product = products.get(pk)
+            if product is not None:
+                product.distance = distance
+                results.append(product)
+        return results
+
+    def search(self, vector):
+        return RankedResults(self, vector)
+
+    def similar_to(self, target, k):
+        price = target.price
+        hits = self.nearest(
+            target.embedding,
+            k,
+            category=target.category or None,
+            min_price=None if price is None else price * 0.5,
+            max_price=None if price is None else price * 1.5,
+            exclude_ids=[target.id],
+        )
+        return self.load_products(hits)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_search_engine() -> SearchEngine:
+    """Process-wide engine selected by SEARCH_ENGINE."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if settings.SEARCH_ENGINE == "memory":
+                    _engine = MemoryEngine()
+                else:
+                    _engine = PgvectorEngine()
+    return _engine
@@ -0,0 +1,99 @@
+import json
+
+import numpy as np
+import psycopg
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from pgvector import Vector
+from pgvector.psycopg import register_vector
+from psycopg_pool import ConnectionPool
+from products.benchmark import latency_summary, timed
+from products.models import EMBEDDING_DIMENSIONS
+
+SEARCH_SQL = """
+SELECT id FROM products_product
+WHERE embedding IS NOT NULL
+ORDER BY embedding <=> %s::vector
+LIMIT 10
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures what connection reuse and binary vector parameters save per "
+        "query: a new connection per request vs a persistent connection vs a "
+        "pool checkout, and text vs binary (prepared) vector parameters."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        params = connection.get_connection_params()
+        # Plain psycopg connections: Django's cursor wrappers are not measured
+        for key in ["cursor_factory", "prepare_threshold"]:
+            params.pop(key, None)
+        try:
+            psycopg.connect(**params).close()
+        except psycopg.Error as e:
+            raise CommandError(f"Cannot connect: {e}")
+
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((options["requests"], EMBEDDING_DIMENSIONS)).astype(np.float32)
+        texts = [Vector(v).to_text() for v in vectors]
+        results = {}
+
+        def query_on_new_connection(text):
+            with psycopg.connect(**params) as conn:
+                return conn.execute(SEARCH_SQL, [text]).fetchall()
+
+        results["new_connection"] = self.measure(query_on_new_connection, texts)
+
+        with psycopg.connect(**params) as conn:
+            results["persistent_text"] = self.measure(
+                lambda text: conn.execute(SEARCH_SQL, [text], prepare=False).fetchall(), texts
+            )
+            register_vector(conn)
+            results["persistent_binary"] = self.measure(
+                lambda v: conn.execute(SEARCH_SQL, [Vector(v)], prepare=False, binary=True).fetchall(),
+                vectors,
+            )
+            results["persistent_binary_prepared"] = self.measure(
+                lambda v: conn.execute(SEARCH_SQL, [Vector(v)], prepare=True, binary=True).fetchall(),
+                vectors,
+            )
+
+        with ConnectionPool(kwargs=params, min_size=1, max_size=1, open=True) as pool:
+
+            def query_on_pool(text):
+                with pool.connection() as conn:
+                    return conn.execute(SEARCH_SQL, [text]).fetchall()
+
+            results["pool_checkout"] = self.measure(query_on_pool, texts)
+
+        results["parameter_bytes"] = {
+            "text": len(texts[0].encode("utf-8")),
+            "binary": len(Vector(vectors[0]).to_binary()),
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, summary in results.items():
+            if name == "parameter_bytes":
+                continue
+            self.stdout.write(
+                f"{name:>28}: p50 {summary['p50_ms']:.2f} | p95 {summary['p95_ms']:.2f} | "
+                f"p99 {summary['p99_ms']:.2f} ms | {summary['qps']:.1f} req/s"
+            )
+        sizes = results["parameter_bytes"]
+        self.stdout.write(
+            f"Vector parameter: {sizes['text']} bytes as text, {sizes['binary']} bytes binary."
+        )
+        saved = results["new_connection"]["p50_ms"] - results["persistent_text"]["p50_ms"]
+        self.stdout.write(self.style.SUCCESS(f"Connection setup costs ~{saved:.2f} ms per request."))
+
+    def measure(self, func, inputs):
+        _, latencies, elapsed = timed(func, inputs)
+        return latency_summary(latencies, elapsed)
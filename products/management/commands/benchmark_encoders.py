@@ -0,0 +1,123 @@
+import json
+import os
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.embeddings import build_local_encoder
+from products.models import Product
+
+
+def percentile(samples, pct):
+    return float(np.percentile(samples, pct)) if samples else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares encoder backends: single-query p50/p99 latency, batch docs/sec "
+        "(in input order and length-bucketed, with padding waste) and cosine "
+        "drift against the torch vectors"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--backends", nargs="+", default=["torch", "onnx"])
+        parser.add_argument("--queries", type=int, default=200, help="Single-text encodes timed.")
+        parser.add_argument("--docs", type=int, default=2000, help="Texts encoded for throughput.")
+        parser.add_argument("--batch-size", type=int, default=64)
+        parser.add_argument(
+            "--description-tokens",
+            type=int,
+            default=settings.EMBEDDING_DESCRIPTION_TOKENS,
+            help="Description token budget of the length-bucketed run (0: none).",
+        )
+        parser.add_argument(
+            "--from-db",
+            action="store_true",
+            help="Use the first --docs products of the database instead of the sample catalog.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def load_documents(self, count, from_db=False):
+        if from_db:
+            documents = list(
+                Product.objects.order_by("id").values_list("title", "description")[:count]
+            )
+        else:
+            path = os.path.join(settings.BASE_DIR, "products", "data", "products_data.json")
+            with open(path, "r", encoding="utf-8") as f:
+                items = json.load(f)
+            documents = [(item["title"], item.get("description", "")) for item in items]
+        # Repeat the catalog to the requested size
+        return [documents[i % len(documents)] for i in range(count)]
+
+    def handle(self, *args, **options):
+        documents = self.load_documents(options["docs"], options["from_db"])
+        docs = [f"{title} {description}" for title, description in documents]
+        queries = [docs[i % len(docs)] for i in range(options["queries"])]
+        results = {}
+        reference = None
+
+        for backend in options["backends"]:
+            encoder = build_local_encoder(backend)
+            encoder.encode(["warm up"])
+
+            latencies = []
+            for query in queries:
+                started = time.perf_counter()
+                encoder.encode(query)
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            vectors = encoder.encode(docs, batch_size=options["batch_size"])
+            elapsed = time.perf_counter() - started
+
+            _, stats = encoder.encode_documents(
+                documents,
+                batch_size=options["batch_size"],
+                description_tokens=options["description_tokens"],
+            )
+
+            result = {
+                "p50_ms": round(percentile(latencies, 50), 3),
+                "p99_ms": round(percentile(latencies, 99), 3),
+                "docs_per_sec": round(len(docs) / elapsed, 1),
+                "bucketed_docs_per_sec": round(stats.docs_per_sec, 1),
+                "padding_waste": round(stats.padding_waste, 4),
+                "baseline_padding_waste": round(stats.baseline_padding_waste, 4),
+            }
+
+            # Vectors are L2-normalized, so the row-wise dot product is the cosine
+            if reference is None:
+                reference = vectors
+            else:
+                cosines = np.sum(reference * vectors, axis=1)
+                result["cosine_mean"] = round(float(cosines.mean()), 5)
+                result["cosine_min"] = round(float(cosines.min()), 5)
+            results[backend] = result
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for backend, result in results.items():
+            line = (
+                f"{backend:>6}: p50 {result['p50_ms']:.2f} ms | p99 {result['p99_ms']:.2f} ms | "
+                f"{result['docs_per_sec']:.1f} docs/sec | bucketed "
+                f"{result['bucketed_docs_per_sec']:.1f} docs/sec, padding waste "
+                f"{result['padding_waste']:.1%} "
+                f"(unscheduled {result['baseline_padding_waste']:.1%})"
+            )
+            if "cosine_mean" in result:
+                line += (
+                    f" | cosine vs {options['backends'][0]}: mean {result['cosine_mean']:.4f}, "
+                    f"min {result['cosine_min']:.4f}"
+                )
+            self.stdout.write(line)
+        self.stdout.write(
+            self.style.SUCCESS(f"Median single-query speedup: {self.speedup(results):.2f}x")
+        )
+
+    def speedup(self, results):
+        p50s = [result["p50_ms"] for result in results.values()]
+        return p50s[0] / p50s[-1] if len(p50s) > 1 and p50s[-1] else 1.0
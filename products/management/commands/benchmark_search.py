@@ -0,0 +1,236 @@
+import json
+import platform
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from products import benchmark
+from products.engines import get_search_engine
+from products.management.commands.build_vector_index import VECTOR_INDEXES
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks vector search on a synthetic catalog: p50/p95/p99 latency and "
+        "QPS for search, recommendations and batch embedding, plus recall@K "
+        "against exact brute force. Use a local database only."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--size",
+            type=int,
+            default=0,
+            help="Generate a synthetic catalog of this many products (0 = reuse the existing one).",
+        )
+        parser.add_argument("--categories", type=int, default=20)
+        parser.add_argument(
+            "--skew", type=float, default=1.0, help="Category size skew (0 = uniform, 1 = Zipf)."
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--k", type=int, default=10)
+        parser.add_argument(
+            "--ef-search",
+            type=int,
+            nargs="+",
+            default=[settings.PGVECTOR_HNSW_EF_SEARCH],
+            help="hnsw.ef_search values to sweep.",
+        )
+        parser.add_argument(
+            "--scenarios",
+            nargs="+",
+            choices=["search", "recommend", "embed"],
+            default=["search", "recommend"],
+        )
+        parser.add_argument("--embed-texts", type=int, default=1000)
+        parser.add_argument("--embed-batch-size", type=int, default=64)
+        parser.add_argument(
+            "--rebuild-index",
+            action="store_true",
+            help="Rebuild the HNSW index of EMBEDDING_INDEX_PRECISION with --m/--ef-construction.",
+        )
+        parser.add_argument("--m", type=int, default=16)
+        parser.add_argument("--ef-construction", type=int, default=64)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+        parser.add_argument("--compare", help="Baseline JSON from a previous --output run.")
+        parser.add_argument(
+            "--max-latency-regression",
+            type=float,
+            default=0.2,
+            help="Allowed relative p95 increase over the baseline (0.2 = 20%%).",
+        )
+        parser.add_argument(
+            "--max-recall-drop", type=float, default=0.01, help="Allowed absolute recall@K drop."
+        )
+        parser.add_argument(
+            "--cleanup", action="store_true", help="Delete the synthetic catalog afterwards."
+        )
+
+    def handle(self, *args, **options):
+        if options["size"]:
+            self.stdout.write(
+                f"Generating {options['size']} products in {options['categories']} "
+                f"categories (skew {options['skew']})..."
+            )
+            started = time.perf_counter()
+            benchmark.generate_catalog(
+                options["size"], options["categories"], options["skew"], options["seed"]
+            )
+            self.stdout.write(f"Done in {time.perf_counter() - started:.1f}s.")
+
+        if options["rebuild_index"]:
+            self.rebuild_index(options["m"], options["ef_construction"])
+
+        targets = benchmark.sample_products(options["queries"], options["seed"])
+        if not targets and {"search", "recommend"} & set(options["scenarios"]):
+            raise CommandError("No synthetic catalog found; pass --size N to generate one.")
+
+        results = {
+            "config": {
+                key: options[key]
+                for key in ["size", "categories", "skew", "seed", "queries", "k", "m", "ef_construction"]
+            },
+            "environment": {
+                "catalog_size": benchmark.catalog_queryset().count(),
+                "search_engine": settings.SEARCH_ENGINE,
+                "index_precision": settings.EMBEDDING_INDEX_PRECISION,
+                "postgres": connection.pg_version,
+                "python": platform.python_version(),
+            },
+            "runs": [],
+        }
+
+        k = options["k"]
+        engine = get_search_engine()
+        if "search" in options["scenarios"] or "recommend" in options["scenarios"]:
+            queries = benchmark.query_vectors(targets, options["seed"])
+            # Ground truth does not depend on ef_search: compute it once
+            exact_search = [benchmark.exact_search_ids(vector, k) for vector in queries]
+            exact_recommend = [benchmark.exact_recommendation_ids(t, k) for t in targets]
+
+            for ef_search in options["ef_search"]:
+                run = {"ef_search": ef_search}
+                with override_settings(PGVECTOR_HNSW_EF_SEARCH=ef_search):
+                    if "search" in options["scenarios"]:
+                        found, latencies, elapsed = benchmark.timed(
+                            lambda vector: benchmark.search_ids(engine, vector, k), queries
+                        )
+                        run["search"] = {
+                            **benchmark.latency_summary(latencies, elapsed),
+                            f"recall@{k}": benchmark.recall_at_k(found, exact_search),
+                        }
+                    if "recommend" in options["scenarios"]:
+                        found, latencies, elapsed = benchmark.timed(
+                            lambda target: benchmark.recommendation_ids(engine, target, k), targets
+                        )
+                        run["recommend"] = {
+                            **benchmark.latency_summary(latencies, elapsed),
+                            f"recall@{k}": benchmark.recall_at_k(found, exact_recommend),
+                        }
+                results["runs"].append(run)
+
+        if "embed" in options["scenarios"]:
+            results["embed"] = self.benchmark_embedding(options)
+
+        if options["cleanup"]:
+            benchmark.delete_catalog()
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.print_results(results, k)
+
+        if options["compare"]:
+            self.compare(results, options)
+
+    def rebuild_index(self, m, ef_construction):
+        name, expression = VECTOR_INDEXES[settings.EMBEDDING_INDEX_PRECISION]
+        table = connection.ops.quote_name(benchmark.Product._meta.db_table)
+        self.stdout.write(f"Rebuilding {name} with m={m}, ef_construction={ef_construction}...")
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(name)}")
+            cursor.execute(
+                f"CREATE INDEX {connection.ops.quote_name(name)} ON {table} "
+                f"USING hnsw ({expression}) WITH (m = %s, ef_construction = %s)",
+                [m, ef_construction],
+            )
+        self.stdout.write(f"Done in {time.perf_counter() - started:.1f}s.")
+
+    def benchmark_embedding(self, options):
+        from products import embeddings
+
+        texts = [
+            f"Benchmark product {i} with a short description of its features"
+            for i in range(options["embed_texts"])
+        ]
+        embeddings.warm_up()
+        batch_size = options["embed_batch_size"]
+        batches = [texts[i : i + batch_size] for i in range(0, len(texts), batch_size)]
+        _, latencies, elapsed = benchmark.timed(
+            lambda batch: embeddings.encode(batch, batch_size=batch_size), batches
+        )
+        return {
+            **benchmark.latency_summary(latencies, elapsed),
+            "batch_size": batch_size,
+            "docs_per_sec": round(len(texts) / elapsed, 1),
+        }
+
+    def print_results(self, results, k):
+        env = results["environment"]
+        self.stdout.write(
+            f"Catalog: {env['catalog_size']} products | engine {env['search_engine']} | "
+            f"precision {env['index_precision']}"
+        )
+        for run in results["runs"]:
+            for scenario in ["search", "recommend"]:
+                if scenario not in run:
+                    continue
+                r = run[scenario]
+                self.stdout.write(
+                    f"ef_search={run['ef_search']:<4} {scenario:>9}: "
+                    f"p50 {r['p50_ms']:.2f} | p95 {r['p95_ms']:.2f} | p99 {r['p99_ms']:.2f} ms | "
+                    f"{r['qps']:.1f} QPS | recall@{k} {r[f'recall@{k}']}"
+                )
+        if "embed" in results:
+            r = results["embed"]
+            self.stdout.write(
+                f"embed (batch {r['batch_size']}): p50 {r['p50_ms']:.2f} | p95 {r['p95_ms']:.2f} ms | "
+                f"{r['docs_per_sec']:.1f} docs/sec"
+            )
+
+    def compare(self, results, options):
+        with open(options["compare"], "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        baseline_runs = {run["ef_search"]: run for run in baseline.get("runs", [])}
+        recall_key = f"recall@{options['k']}"
+        failures = []
+        for run in results["runs"]:
+            before_run = baseline_runs.get(run["ef_search"])
+            if before_run is None:
+                continue
+            for scenario in ["search", "recommend"]:
+                before, after = before_run.get(scenario), run.get(scenario)
+                if not before or not after:
+                    continue
+                label = f"ef_search={run['ef_search']} {scenario}"
+                if after["p95_ms"] > before["p95_ms"] * (1 + options["max_latency_regression"]):
+                    failures.append(f"{label}: p95 {before['p95_ms']} -> {after['p95_ms']} ms")
+                if (
+                    before.get(recall_key) is not None
+                    and after.get(recall_key) is not None
+                    and after[recall_key] < before[recall_key] - options["max_recall_drop"]
+                ):
+                    failures.append(
+                        f"{label}: {recall_key} {before[recall_key]} -> {after[recall_key]}"
+                    )
+        if failures:
+            raise CommandError("Regressions against baseline:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
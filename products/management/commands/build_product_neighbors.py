@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.models import Product
+from products.tasks import compute_product_neighbors
+
+
+class Command(BaseCommand):
+    help = "Materializes the top-K recommendations of every product into ProductNeighbor"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Products whose neighbour lists are rebuilt per transaction.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        products = Product.objects.filter(embedding__isnull=False)
+        count = products.count()
+
+        self.stdout.write(
+            f"Building top-{settings.PRODUCT_NEIGHBORS_K} neighbours for {count} products..."
+        )
+
+        processed = 0
+        last_id = 0
+        started = time.perf_counter()
+        while True:
+            ids = list(
+                products.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+
+            compute_product_neighbors(ids)
+
+            last_id = ids[-1]
+            processed += len(ids)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"✓ {processed}/{count} products ({processed / elapsed:.1f} products/sec)"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Process finished! {processed} neighbour lists built."))
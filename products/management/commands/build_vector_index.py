@@ -0,0 +1,174 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from pgvector.django import CosineDistance
+from products.models import Product
+
+# Index name and indexed expression + opclass per EMBEDDING_INDEX_PRECISION.
+# Expressions must match ProductQuerySet.order_by_distance() exactly.
+VECTOR_INDEXES = {
+    "vector": (
+        "product_embedding_hnsw_idx",
+        "embedding vector_cosine_ops",
+    ),
+    "halfvec": (
+        "product_embedding_halfvec_hnsw_idx",
+        "(embedding::halfvec(384)) halfvec_cosine_ops",
+    ),
+    "bit": (
+        "product_embedding_bit_hnsw_idx",
+        "(binary_quantize(embedding)::bit(384)) bit_hamming_ops",
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Builds the HNSW index for an embedding precision (vector, halfvec or bit), "
+        "optionally drops the others and measures recall against exact search"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--precision",
+            choices=sorted(VECTOR_INDEXES),
+            default=settings.EMBEDDING_INDEX_PRECISION,
+        )
+        parser.add_argument(
+            "--drop-unused",
+            action="store_true",
+            help="Drop the HNSW indexes of the other precisions.",
+        )
+        parser.add_argument(
+            "--evaluate",
+            type=int,
+            default=0,
+            metavar="N",
+            help="Measure recall@K and latency for N random products.",
+        )
+        parser.add_argument("--k", type=int, default=10)
+
+    def handle(self, *args, **options):
+        precision = options["precision"]
+        if precision != "vector" and self.pgvector_version() < (0, 7):
+            raise CommandError(f"The {precision} index requires pgvector >= 0.7.")
+
+        table = connection.ops.quote_name(Product._meta.db_table)
+        name, expression = VECTOR_INDEXES[precision]
+        if self.index_is_valid(name) is False:
+            # A failed CONCURRENTLY build leaves an INVALID index behind that
+            # IF NOT EXISTS would keep: it is maintained on writes but never
+            # used by searches
+            self.stdout.write(f"Dropping invalid {name} left by a failed build...")
+            self.drop_index(name)
+        self.stdout.write(f"Building {name}...")
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            # CONCURRENTLY keeps the table writable while the graph is built
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {connection.ops.quote_name(name)} "
+                f"ON {table} USING hnsw ({expression}) WITH (m = 16, ef_construction = 64)"
+            )
+        self.stdout.write(f"Done in {time.perf_counter() - started:.1f}s.")
+
+        if options["drop_unused"]:
+            for other, (other_name, _) in VECTOR_INDEXES.items():
+                if other == precision:
+                    continue
+                self.drop_index(other_name)
+                self.stdout.write(f"Dropped {other_name} (if present).")
+
+        for index_name, _ in VECTOR_INDEXES.values():
+            size = self.index_size(index_name)
+            if size is not None:
+                self.stdout.write(f"{index_name}: {size / 1024 / 1024:.1f} MB")
+
+        if options["evaluate"]:
+            if precision != settings.EMBEDDING_INDEX_PRECISION:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"Evaluating EMBEDDING_INDEX_PRECISION="
+                        f"{settings.EMBEDDING_INDEX_PRECISION}, not {precision}."
+                    )
+                )
+            self.evaluate(options["evaluate"], options["k"])
+
+    def pgvector_version(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+            row = cursor.fetchone()
+        if row is None:
+            raise CommandError("The pgvector extension is not installed.")
+        return tuple(int(part) for part in row[0].split(".")[:2])
+
+    def index_is_valid(self, name):
+        """pg_index.indisvalid for ``name``, None if the index does not exist."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                [name],
+            )
+            row = cursor.fetchone()
+        return None if row is None else row[0]
+
+    def drop_index(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DROP INDEX CONCURRENTLY IF EXISTS {connection.ops.quote_name(name)}"
+            )
+
+    def index_size(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_relation_size(to_regclass(%s))", [name])
+            return cursor.fetchone()[0]
+
+    def evaluate(self, sample_size, k):
+        samples = list(
+            Product.objects.filter(embedding__isnull=False)
+            .order_by("?")
+            .only("id", "embedding")[:sample_size]
+        )
+        recalls, approx_times, exact_times = [], [], []
+        for sample in samples:
+            candidates = Product.objects.filter(embedding__isnull=False).exclude(id=sample.id)
+
+            started = time.perf_counter()
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT set_config('hnsw.ef_search', %s, true)",
+                        [str(settings.PGVECTOR_HNSW_EF_SEARCH)],
+                    )
+                approx = list(
+                    candidates.order_by_distance(sample.embedding).values_list("id", flat=True)[:k]
+                )
+            approx_times.append(time.perf_counter() - started)
+
+            # Ground truth: full precision, no index
+            started = time.perf_counter()
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT set_config('enable_indexscan', 'off', true)")
+                exact = list(
+                    candidates.annotate(distance=CosineDistance("embedding", sample.embedding))
+                    .order_by("distance")
+                    .values_list("id", flat=True)[:k]
+                )
+            exact_times.append(time.perf_counter() - started)
+
+            if exact:
+                recalls.append(len(set(approx) & set(exact)) / len(exact))
+
+        if not recalls:
+            self.stdout.write("No embedded products to evaluate.")
+            return
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"recall@{k}: {statistics.mean(recalls):.4f} over {len(recalls)} queries | "
+                f"p50 latency: index {statistics.median(approx_times) * 1000:.2f} ms, "
+                f"exact {statistics.median(exact_times) * 1000:.2f} ms"
+            )
+        )
@@ -0,0 +1,57 @@
+import hashlib
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates a partial HNSW index per large category so category-filtered "
+        "recommendations search a graph that only contains matching products"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--min-rows",
+            type=int,
+            default=10000,
+            help="Only categories with at least this many embedded products get an index.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the statements without executing them.",
+        )
+
+    def handle(self, *args, **options):
+        categories = (
+            Product.objects.filter(embedding__isnull=False)
+            .exclude(category="")
+            .values("category")
+            .annotate(total=Count("id"))
+            .filter(total__gte=options["min_rows"])
+            .order_by("-total")
+        )
+
+        table = connection.ops.quote_name(Product._meta.db_table)
+        for row in categories:
+            category = row["category"]
+            digest = hashlib.sha1(category.encode("utf-8")).hexdigest()[:12]
+            index_name = connection.ops.quote_name(f"product_emb_hnsw_cat_{digest}")
+            literal = category.replace("'", "''")
+            # CONCURRENTLY keeps the table writable; it cannot run inside a
+            # transaction, which management commands do not open by default.
+            statement = (
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} "
+                f"ON {table} USING hnsw (embedding vector_cosine_ops) "
+                f"WITH (m = 16, ef_construction = 64) "
+                f"WHERE category = '{literal}'"
+            )
+            self.stdout.write(f"{category} ({row['total']} products): {statement}")
+            if not options["dry_run"]:
+                with connection.cursor() as cursor:
+                    cursor.execute(statement)
+
+        self.stdout.write(self.style.SUCCESS("Category indexes are up to date."))
@@ -0,0 +1,123 @@
+import os
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.dump import EmbeddingDumpWriter
+from products.engines import get_feed_position, write_snapshot
+from products.models import EMBEDDING_DIMENSIONS, Product, embedding_model_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports product embeddings to a snapshot for the in-memory search engine "
+        "(SEARCH_ENGINE=memory), or with --file to a portable dump that "
+        "load_embeddings can import into another database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=str(settings.SEARCH_SNAPSHOT_DIR))
+        parser.add_argument(
+            "--file",
+            help="Write a single-file dump (ids, ASINs, hashes, matrix) to this path instead.",
+        )
+        parser.add_argument(
+            "--dtype",
+            choices=["float32", "float16"],
+            default="float32",
+            help="float16 halves the matrix size at a small precision cost.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options["file"]:
+            self.export_dump(options)
+            return
+
+        os.makedirs(options["output"], exist_ok=True)
+
+        # Changes published after this point are replayed from the feed, so
+        # rows updated while exporting are never missed
+        feed_position = get_feed_position()
+
+        products = Product.objects.filter(embedding__isnull=False).order_by("id")
+        count = products.count()
+        ids = np.empty(count, dtype=np.int64)
+        vectors = np.empty((count, EMBEDDING_DIMENSIONS), dtype=np.float32)
+        categories = []
+        prices = []
+
+        self.stdout.write(f"Exporting {count} embeddings...")
+        row = 0
+        last_id = 0
+        while row < count:
+            # Keyset pagination over the primary key
+            chunk = list(
+                products.filter(id__gt=last_id).values_list(
+                    "id", "embedding", "category", "price"
+                )[: options["batch_size"]]
+            )
+            if not chunk:
+                break
+            # Rows inserted after count() was taken are left to the feed
+            chunk = chunk[: count - row]
+            for pk, embedding, category, price in chunk:
+                ids[row] = pk
+                vectors[row] = embedding
+                categories.append(category)
+                prices.append(price)
+                row += 1
+            last_id = chunk[-1][0]
+
+        path = write_snapshot(
+            options["output"],
+            ids[:row],
+            vectors[:row],
+            categories,
+            prices,
+            dtype=options["dtype"],
+            feed_position=feed_position,
+        )
+        size_mb = os.path.getsize(os.path.join(path, "vectors.npy")) / 1024**2
+        self.stdout.write(
+            self.style.SUCCESS(f"Snapshot written to {path} ({row} products, {size_mb:.1f} MB).")
+        )
+
+    def export_dump(self, options):
+        # Rows embedded by another model are stale and would be re-embedded
+        products = Product.objects.filter(
+            embedding__isnull=False, embedding_model=embedding_model_id()
+        ).order_by("id")
+        count = products.count()
+        self.stdout.write(f"Dumping {count} embeddings to {options['file']}...")
+
+        writer = EmbeddingDumpWriter(
+            options["file"],
+            capacity=count,
+            dim=EMBEDDING_DIMENSIONS,
+            dtype=options["dtype"],
+            model=embedding_model_id(),
+        )
+        last_id = 0
+        while writer.count < count:
+            chunk = list(
+                products.filter(id__gt=last_id).values_list(
+                    "id", "asin", "embedding_hash", "embedding"
+                )[: options["batch_size"]]
+            )
+            if not chunk:
+                break
+            ids, asins, hashes, vectors = zip(*chunk)
+            writer.write(
+                np.asarray(ids),
+                [asin.encode("utf-8") for asin in asins],
+                [h.encode("ascii") for h in hashes],
+                np.stack(vectors),
+            )
+            last_id = ids[-1]
+        writer.close()
+
+        size_mb = os.path.getsize(options["file"]) / 1024**2
+        self.stdout.write(
+            self.style.SUCCESS(f"Dumped {writer.count} embeddings ({size_mb:.1f} MB).")
+        )
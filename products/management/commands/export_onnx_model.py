@@ -0,0 +1,72 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Exports the embedding model to ONNX and writes an int8 dynamically "
+        "quantized copy for EMBEDDING_INFERENCE_BACKEND=onnx"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--output", default=settings.EMBEDDING_ONNX_DIR)
+        parser.add_argument("--opset", type=int, default=17)
+
+    def handle(self, *args, **options):
+        import torch
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        from sentence_transformers import SentenceTransformer
+
+        output = options["output"]
+        os.makedirs(output, exist_ok=True)
+
+        self.stdout.write(f"Loading model {settings.EMBEDDING_MODEL_NAME}...")
+        transformer = SentenceTransformer(settings.EMBEDDING_MODEL_NAME, device="cpu")[0]
+        tokenizer = transformer.tokenizer
+        tokenizer.save_pretrained(output)
+
+        class TokenEmbeddings(torch.nn.Module):
+            """Returns only last_hidden_state; pooling happens in OnnxEncoder."""
+
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    token_type_ids=token_type_ids,
+                )[0]
+
+        input_names = ["input_ids", "attention_mask", "token_type_ids"]
+        dummy = tokenizer(["export"], return_tensors="pt")
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        fp32_path = os.path.join(output, "model.onnx")
+        module = TokenEmbeddings(transformer.auto_model).eval()
+        with torch.no_grad():
+            torch.onnx.export(
+                module,
+                tuple(dummy[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=options["opset"],
+            )
+        self.stdout.write(f"✓ Exported {fp32_path}")
+
+        int8_path = os.path.join(output, "model_int8.onnx")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+        self.stdout.write(f"✓ Quantized {int8_path}")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Done. Check parity with `manage.py benchmark_encoders` before "
+                "switching EMBEDDING_INFERENCE_BACKEND to onnx."
+            )
+        )
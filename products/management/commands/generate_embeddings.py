@@ -1,43 +1,181 @@
-import torch
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from products import embeddings, metrics
+from products.cache import bump_catalog_version
+from products.engines import publish_embedding_changes
 from products.models import Product
-from sentence_transformers import SentenceTransformer
 
 
 class Command(BaseCommand):
     help = "Generates vectors (embeddings) for products using SentenceTransformers"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=512,
+            help="Products fetched, encoded and written back per chunk.",
+        )
+        parser.add_argument(
+            "--encode-batch-size",
+            type=int,
+            default=64,
+            help="Batch size used to encode the texts of a chunk.",
+        )
+        parser.add_argument(
+            "--checkpoint",
+            default=os.path.join(settings.BASE_DIR, ".generate_embeddings.checkpoint"),
+            help="File recording the last processed product id.",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue after the id stored in the checkpoint file.",
+        )
+        parser.add_argument(
+            "--rebuild-neighbors",
+            action="store_true",
+            help="Run build_product_neighbors once every chunk is written.",
+        )
+
+    def execute(self, *args, **options):
+        with metrics.track("command:generate_embeddings"):
+            return super().execute(*args, **options)
+
     def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        encode_batch_size = options["encode_batch_size"]
+        checkpoint_path = options["checkpoint"]
+
         self.stdout.write("Starting Phase 2: Embedding Generation...")
 
-        # Load the model (downloaded automatically the first time)
-        # We use the lightweight MiniLM-L6 model (384 dimensions)
-        self.stdout.write("Loading model all-MiniLM-L6-v2 on CPU...")
-        model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
+        # Find products missing a vector or whose title, description or
+        # model changed since their vector was generated
+        products = Product.objects.stale_embeddings()
 
-        # Find products that have text but are missing the vector
-        products = Product.objects.filter(embedding__isnull=True)
-        count = products.count()
+        last_id = 0
+        if options["resume"]:
+            last_id = self.read_checkpoint(checkpoint_path)
+            self.stdout.write(f"Resuming after product ID {last_id}.")
+            products = products.filter(id__gt=last_id)
 
+        count = products.count()
         if count == 0:
             self.stdout.write(self.style.SUCCESS("No new products to process."))
             return
 
-        self.stdout.write(f"Processing {count} products...")
+        # Load the model (downloaded automatically the first time)
+        # We use the lightweight MiniLM-L6 model (384 dimensions)
+        self.stdout.write(f"Loading model {settings.EMBEDDING_MODEL_NAME}...")
+        embeddings.preload()
+
+        self.stdout.write(f"Processing {count} products in chunks of {batch_size}...")
+
+        processed = 0
+        encode_stats = embeddings.BulkEncodeStats()
+        started = time.perf_counter()
+        while True:
+            # Keyset pagination: constant cost per chunk, no OFFSET scans,
+            # and only the columns needed to build the text are loaded.
+            chunk_started = time.perf_counter()
+            with metrics.span("db"):
+                chunk = list(
+                    products.filter(id__gt=last_id)
+                    .order_by("id")
+                    .only("id", "title", "description", "category")[:batch_size]
+                )
+            if not chunk:
+                break
+
+            documents = [p.get_embedding_document() for p in chunk]
+            with metrics.span("encode"):
+                vectors, chunk_stats = embeddings.encode_documents(
+                    documents, batch_size=encode_batch_size
+                )
+            if chunk_stats is not None:
+                encode_stats.add(chunk_stats)
+            for p, vector in zip(chunk, vectors):
+                p.set_embedding(vector)
 
-        for p in products:
-            # Combine title and description for better semantic context
-            text_data = f"{p.title} {p.description}"
+            # bulk_update() does not send post_save, so no redundant
+            # Celery task is queued for rows that already have a vector.
+            with metrics.span("save"), transaction.atomic():
+                Product.objects.bulk_update(
+                    chunk, fields=["embedding", "embedding_hash", "embedding_model"]
+                )
+            metrics.observe_embedding_batch(
+                "command", len(chunk), time.perf_counter() - chunk_started, chunk_stats
+            )
 
-            # Generate the embedding (numeric vector)
-            embedding_vector = model.encode(text_data)
+            bump_catalog_version({p.category for p in chunk})
+            publish_embedding_changes([p.id for p in chunk])
 
-            # Save to the database (converted to list for pgvector)
-            p.embedding = embedding_vector.tolist()
-            p.save()
+            last_id = chunk[-1].id
+            processed += len(chunk)
+            self.write_checkpoint(checkpoint_path, last_id)
 
-            self.stdout.write(f"✓ Vector generated for ASIN: {p.asin}")
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"✓ {processed}/{count} vectors generated "
+                f"(last ID {last_id}, {processed / elapsed:.1f} products/sec)"
+            )
 
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Process finished! {processed} embeddings created in {elapsed:.1f}s "
+                f"({processed / elapsed:.1f} products/sec)."
+            )
+        )
+        if encode_stats.documents:
+            # Padding waste: share of the token positions run by the model
+            # that were padding, vs passing each chunk to the encoder as is
+            line = (
+                f"Encoding: {encode_stats.docs_per_sec:.1f} docs/sec, "
+                f"padding waste {encode_stats.padding_waste:.1%} "
+                f"(unscheduled: {encode_stats.baseline_padding_waste:.1%})"
+            )
+            if settings.EMBEDDING_DESCRIPTION_TOKENS:
+                line += (
+                    f", {encode_stats.truncated} descriptions cut to "
+                    f"{settings.EMBEDDING_DESCRIPTION_TOKENS} tokens"
+                )
+            self.stdout.write(line + ".")
+        if options["rebuild_neighbors"]:
+            # bulk_update() skips the task path that refreshes neighbour
+            # lists; rebuilding once against the finished catalog is far
+            # cheaper than refreshing after every chunk
+            with metrics.span("neighbors"):
+                call_command("build_product_neighbors", stdout=self.stdout)
+        else:
+            self.stdout.write(
+                "Neighbour lists were not refreshed: run `manage.py build_product_neighbors` "
+                "(or pass --rebuild-neighbors)."
+            )
+        stages = metrics.current_timings().stages
         self.stdout.write(
-            self.style.SUCCESS(f"Process finished! {count} embeddings created.")
+            "Time per stage: "
+            + ", ".join(f"{stage} {seconds:.1f}s" for stage, seconds in stages.items())
         )
+
+    def read_checkpoint(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)["last_id"]
+
+    def write_checkpoint(self, path, last_id):
+        # Write-then-rename so an interrupted run never leaves a truncated file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"last_id": last_id}, f)
+        os.replace(tmp_path, path)
@@ -1,40 +1,200 @@
 import json
 import os
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from products.cache import bump_catalog_version
+from products.engines import publish_embedding_changes
 from products.models import Product
+from products.tasks import generate_product_embeddings
+
+PRODUCT_FIELDS = ['title', 'description', 'category', 'brand', 'price']
+
+
+def iter_json_lines(f):
+    """Yields one record per non-empty line of a JSON Lines file."""
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array(f, read_size=1 << 20, max_record_size=64 << 20):
+    """
+    Yields the elements of a top-level JSON array one at a time, keeping only
+    the unparsed tail of the file in memory (never the whole document).
+    An element that is still incomplete after ``max_record_size`` characters
+    is reported as malformed instead of buffering the rest of the file.
+    """
+    decoder = json.JSONDecoder()
+    head = f.read(read_size)
+    buffer = head.lstrip()
+    if not buffer.startswith('['):
+        raise ValueError("Expected a JSON array at the top level")
+    # Bytes of the file before buffer[0], for error messages
+    offset = len(head.encode('utf-8')) - len(buffer.encode('utf-8'))
+    pos = 1
+    eof = False
+
+    while True:
+        # Skip separators between elements
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        try:
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("Need more data", buffer, pos)
+            obj, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            # The element is split across reads: pull in the next block
+            record_offset = offset + len(buffer[:pos].encode('utf-8'))
+            if eof:
+                raise ValueError(f"{e.msg} in the record at byte {record_offset}") from e
+            if len(buffer) - pos > max_record_size:
+                raise ValueError(
+                    f"Malformed record at byte {record_offset}: no complete JSON "
+                    f"value within {max_record_size} characters"
+                ) from e
+            more = f.read(read_size)
+            eof = not more
+            offset = record_offset
+            buffer = buffer[pos:] + more
+            pos = 0
+            continue
+
+        yield obj
+        pos = end
+        # Drop consumed text so the buffer stays bounded
+        if pos >= read_size:
+            offset += len(buffer[:pos].encode('utf-8'))
+            buffer = buffer[pos:]
+            pos = 0
+
+
+def iter_records(path, data_format='auto'):
+    """Opens ``path`` and streams its records as JSON Lines or a JSON array."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if data_format == 'auto':
+            if path.endswith(('.jsonl', '.ndjson')):
+                data_format = 'jsonl'
+            else:
+                # Peek at the first significant character to pick a parser
+                first = ''
+                while not first.strip():
+                    first = f.read(1)
+                    if not first:
+                        return
+                f.seek(0)
+                data_format = 'json' if first == '[' else 'jsonl'
+
+        if data_format == 'jsonl':
+            yield from iter_json_lines(f)
+        else:
+            yield from iter_json_array(f)
+
 
 class Command(BaseCommand):
-    help = 'Seed database with Amazon product data from JSON file'
+    help = 'Seed database with Amazon product data from a JSON or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=os.path.join(settings.BASE_DIR, 'products', 'data', 'products_data.json'),
+            help='Path to a JSON array or JSON Lines (.jsonl/.ndjson) file.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=['auto', 'json', 'jsonl'],
+            default='auto',
+            help='Input format (auto-detected by default).',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Products upserted per INSERT ... ON CONFLICT statement.',
+        )
+        parser.add_argument(
+            '--no-embeddings',
+            action='store_true',
+            help='Do not queue embedding generation for imported products.',
+        )
 
     def handle(self, *args, **options):
-        # Construimos la ruta dinámica al archivo JSON
-        json_path = os.path.join(settings.BASE_DIR, 'products', 'data', 'products_data.json')
-        
+        json_path = options['file']
+        chunk_size = options['chunk_size']
+
         if not os.path.exists(json_path):
             self.stdout.write(self.style.ERROR(f"Archivo no encontrado en: {json_path}"))
             return
 
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-        self.stdout.write(f"Cargando {len(data)} productos desde el JSON...")
-        
-        created_count = 0
-        for item in data:
-            # Usamos get_or_create para evitar duplicados por ASIN
-            obj, created = Product.objects.get_or_create(
-                asin=item['asin'],
-                defaults={
-                    'title': item.get('title'),
-                    'description': item.get('description'),
-                    'category': item.get('category', ''),
-                    'brand': item.get('brand', ''),
-                    'price': item.get('price')
-                }
+        self.stdout.write(f"Importando productos desde {json_path} en bloques de {chunk_size}...")
+
+        # Keyed by ASIN: a repeated ASIN inside one INSERT ... ON CONFLICT
+        # statement is rejected by PostgreSQL, so the last occurrence wins.
+        chunk = {}
+        total = 0
+        try:
+            for item in iter_records(json_path, options['format']):
+                if not item.get('asin'):
+                    continue
+                chunk[item['asin']] = item
+                if len(chunk) >= chunk_size:
+                    total += self.upsert_chunk(chunk.values(), options['no_embeddings'])
+                    chunk = {}
+                    self.stdout.write(f"{total} productos procesados...")
+            if chunk:
+                total += self.upsert_chunk(chunk.values(), options['no_embeddings'])
+        except ValueError as e:
+            raise CommandError(f"JSON inválido en {json_path}: {e}")
+
+        self.stdout.write(self.style.SUCCESS(f"Proceso terminado. {total} productos importados o actualizados."))
+
+    def upsert_chunk(self, items, skip_embeddings=False):
+        # A record only overwrites the fields it contains: a partial
+        # re-import must not blank the title or category of existing rows.
+        # Records are upserted in groups sharing the same fields.
+        groups = {}
+        for item in items:
+            fields = tuple(field for field in PRODUCT_FIELDS if field in item)
+            groups.setdefault(fields, []).append(item)
+
+        # Existing rows may move out of their current categories
+        previous_categories = set(
+            Product.objects.filter(asin__in=[item['asin'] for item in items])
+            .values_list('category', flat=True)
+            .distinct()
+        )
+        products = []
+        for fields, group in groups.items():
+            group_products = [
+                Product(
+                    asin=item['asin'],
+                    **{
+                        field: item[field] if field == 'price' else item[field] or ''
+                        for field in fields
+                    },
+                )
+                for item in group
+            ]
+            # A single INSERT ... ON CONFLICT (asin) DO UPDATE per group
+            # instead of get_or_create() per row. bulk_create() sends no
+            # post_save, so embeddings are queued once for the whole chunk
+            # below. A record with nothing but its ASIN rewrites the ASIN, so
+            # existing rows still return their id.
+            Product.objects.bulk_create(
+                group_products,
+                update_conflicts=True,
+                unique_fields=['asin'],
+                update_fields=list(fields) or ['asin'],
             )
-            if created:
-                self.stdout.write(f"Creado: {item['title']}")
-                created_count += 1
-        
-        self.stdout.write(self.style.SUCCESS(f"Proceso terminado. {created_count} productos nuevos añadidos."))
\ No newline at end of file
+            products += group_products
+        bump_catalog_version(
+            {p.category for p in products} | previous_categories,
+            product_ids=[p.pk for p in products],
+        )
+        publish_embedding_changes([p.pk for p in products])
+        if not skip_embeddings:
+            generate_product_embeddings.delay([p.pk for p in products])
+        return len(products)
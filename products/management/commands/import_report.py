@@ -0,0 +1,117 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Packages that only processes which encode (or build HNSW graphs in
+# memory) should ever import
+HEAVY_MODULES = [
+    "torch",
+    "sentence_transformers",
+    "transformers",
+    "onnxruntime",
+    "tokenizers",
+    "hnswlib",
+]
+
+# What each target imports in a fresh interpreter
+TARGETS = {
+    "setup": "import django; django.setup()",
+    "urls": "import django; django.setup(); import core.urls",
+    "wsgi": "import core.wsgi",
+    "asgi": "import core.asgi",
+    "tasks": "import django; django.setup(); import products.tasks",
+}
+
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def parse_importtime(output):
+    """(module, self_us, cumulative_us, depth) per line of ``python -X importtime`` output."""
+    rows = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def heavy_modules(modules):
+    return sorted(
+        {module.split(".")[0] for module in modules} & set(HEAVY_MODULES)
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports the import time of a process entry point in a fresh interpreter "
+        "and fails if it loads the ML stack or exceeds a time budget"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target", choices=sorted(TARGETS), default="urls")
+        parser.add_argument("--top", type=int, default=15, help="Slowest top-level imports to list.")
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            default=0,
+            help="Fail when importing the target takes longer (0 = no budget).",
+        )
+        parser.add_argument(
+            "--allow-heavy",
+            action="store_true",
+            help="Report, but do not fail on, ML packages being imported.",
+        )
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", TARGETS[options["target"]]],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": settings.SETTINGS_MODULE},
+            cwd=str(settings.BASE_DIR),
+        )
+        rows = parse_importtime(result.stderr)
+        if result.returncode != 0:
+            errors = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+            raise CommandError("Import failed:\n" + "\n".join(errors[-20:]))
+
+        # Top-level imports add up to the whole import time
+        top_level = [row for row in rows if row[3] == 0]
+        total = sum(cumulative for _, _, cumulative, _ in top_level) / 1e6
+        slowest = sorted(top_level, key=lambda row: row[2], reverse=True)[: options["top"]]
+        heavy = heavy_modules(module for module, *_ in rows)
+
+        report = {
+            "target": options["target"],
+            "seconds": round(total, 3),
+            "modules": len(rows),
+            "heavy_modules": heavy,
+            "slowest": [
+                {"module": module, "ms": round(cumulative / 1000, 1)}
+                for module, _, cumulative, _ in slowest
+            ],
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            self.stdout.write(
+                f"{options['target']}: {total:.3f}s to import {len(rows)} modules"
+            )
+            for entry in report["slowest"]:
+                self.stdout.write(f"  {entry['ms']:>8.1f} ms  {entry['module']}")
+
+        problems = []
+        if heavy and not options["allow_heavy"]:
+            problems.append(f"ML packages imported: {', '.join(heavy)}")
+        if options["max_seconds"] and total > options["max_seconds"]:
+            problems.append(f"{total:.3f}s exceeds the {options['max_seconds']}s budget")
+        if problems:
+            raise CommandError("; ".join(problems))
+
@@ -0,0 +1,130 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from products.cache import bump_catalog_version
+from products.dump import read_embedding_dump
+from products.engines import publish_embedding_changes
+from products.models import EMBEDDING_DIMENSIONS, Product, embedding_model_id
+
+STAGING_TABLE = "products_embedding_staging"
+
+UPDATE_FROM_STAGING_SQL = f"""
+UPDATE products_product p
+SET embedding = s.embedding,
+    embedding_hash = s.embedding_hash,
+    embedding_model = %s
+FROM {STAGING_TABLE} s
+WHERE p.asin = s.asin
+RETURNING p.id, p.category
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads embeddings from a dump written by `export_embeddings --file` into "
+        "Product.embedding, matching rows by ASIN, using binary COPY"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("file", help="Path to the embedding dump.")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Rows copied and applied per transaction.",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Load vectors produced by another model than the configured one.",
+        )
+        parser.add_argument(
+            "--rebuild-neighbors",
+            action="store_true",
+            help="Run build_product_neighbors once every chunk is written.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            dump = read_embedding_dump(options["file"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        if dump.header["dim"] != EMBEDDING_DIMENSIONS:
+            raise CommandError(
+                f"Dump has {dump.header['dim']}-dimensional vectors, expected {EMBEDDING_DIMENSIONS}."
+            )
+        if dump.model != embedding_model_id() and not options["force"]:
+            # Queries are encoded with the configured model: mixing models
+            # makes distances meaningless until generate_embeddings runs
+            raise CommandError(
+                f"Dump was produced by {dump.model}, this environment uses "
+                f"{embedding_model_id()}. Pass --force to load it anyway."
+            )
+
+        self.stdout.write(
+            f"Loading {len(dump)} {dump.header['dtype']} embeddings ({dump.model})..."
+        )
+        batch_size = options["batch_size"]
+        loaded = 0
+        started = time.perf_counter()
+        for start in range(0, len(dump), batch_size):
+            updated = self.load_chunk(dump, start, start + batch_size)
+            loaded += len(updated)
+            self.stdout.write(f"✓ {min(start + batch_size, len(dump))}/{len(dump)} rows copied")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Loaded {loaded} embeddings in {elapsed:.1f}s "
+                f"({len(dump) - loaded} ASINs not found in this database)."
+            )
+        )
+        if options["rebuild_neighbors"]:
+            call_command("build_product_neighbors", stdout=self.stdout)
+        elif loaded:
+            self.stdout.write(
+                "Neighbour lists were not refreshed: run `manage.py build_product_neighbors` "
+                "(or pass --rebuild-neighbors)."
+            )
+        stale = Product.objects.stale_embeddings().count()
+        if stale:
+            self.stdout.write(
+                f"{stale} products still need embeddings (different text or model); "
+                "run `manage.py generate_embeddings`."
+            )
+
+    def load_chunk(self, dump, start, end):
+        """
+        COPYs rows [start, end) into a staging table and applies them in one
+        UPDATE. Returns the ids of the updated products.
+        """
+        # Vector types are registered on every connection (products.db)
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ("
+                    f"asin varchar(20), embedding vector({EMBEDDING_DIMENSIONS}), "
+                    "embedding_hash varchar(64)) ON COMMIT DELETE ROWS"
+                )
+                with cursor.copy(
+                    f"COPY {STAGING_TABLE} (asin, embedding, embedding_hash) "
+                    "FROM STDIN WITH (FORMAT BINARY)"
+                ) as copy:
+                    copy.set_types(["varchar", "vector", "varchar"])
+                    for asin, vector, embedding_hash in zip(
+                        dump.asins[start:end],
+                        dump.vectors[start:end],
+                        dump.hashes[start:end],
+                    ):
+                        copy.write_row(
+                            (asin.decode("utf-8"), vector, embedding_hash.decode("ascii"))
+                        )
+                cursor.execute(UPDATE_FROM_STAGING_SQL, [dump.model])
+                updated = cursor.fetchall()
+
+        # Bulk writes bypass post_save: invalidate caches and engines here
+        bump_catalog_version({category for _, category in updated})
+        publish_embedding_changes([pk for pk, _ in updated])
+        return [pk for pk, _ in updated]
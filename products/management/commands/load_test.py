@@ -0,0 +1,94 @@
+import json
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+DEFAULT_QUERIES = [
+    "wireless gaming mouse",
+    "mechanical keyboard",
+    "noise cancelling headphones",
+    "usb c charger",
+    "4k monitor",
+    "ergonomic office chair",
+]
+
+
+def percentile(samples, pct):
+    return float(np.percentile(samples, pct)) if samples else 0.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Fires concurrent search requests at running API servers and compares "
+        "throughput and latency (e.g. WSGI /products/search/ vs ASGI /products/async/search/)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target",
+            action="append",
+            dest="targets",
+            help="name=url of a search endpoint; repeatable.",
+        )
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--timeout", type=float, default=30.0)
+        parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results.")
+
+    def handle(self, *args, **options):
+        targets = options["targets"] or [
+            "wsgi=http://localhost:8000/products/search/",
+            "asgi=http://localhost:8001/products/async/search/",
+        ]
+        results = {}
+        for target in targets:
+            name, _, url = target.partition("=")
+            results[name] = self.run(url, options)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>6}: {result['requests_per_sec']:.1f} req/s | "
+                f"p50 {result['p50_ms']:.1f} ms | p99 {result['p99_ms']:.1f} ms | "
+                f"{result['errors']} errors"
+            )
+
+    def run(self, url, options):
+        queries = options["queries"]
+        urls = [
+            f"{url}?{urlencode({'q': queries[i % len(queries)]})}"
+            for i in range(options["requests"])
+        ]
+
+        def fetch(request_url):
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request_url, timeout=options["timeout"]) as response:
+                    response.read()
+                    ok = response.status == 200
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            outcomes = list(pool.map(fetch, urls))
+        elapsed = time.perf_counter() - started
+
+        latencies = [ms for ok, ms in outcomes if ok]
+        return {
+            "requests": len(outcomes),
+            "errors": len(outcomes) - len(latencies),
+            "requests_per_sec": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p99_ms": round(percentile(latencies, 99), 1),
+        }
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from products.embeddings import EncoderServer, build_local_encoder
+
+
+class Command(BaseCommand):
+    help = (
+        "Serves the embedding model over a Unix socket so every API worker on "
+        "this host shares one model copy (use with EMBEDDING_ENCODER=socket)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=settings.EMBEDDING_ENCODER_SOCKET)
+        parser.add_argument(
+            "--max-batch-size",
+            type=int,
+            default=256,
+            help="Maximum texts combined into one forward pass across clients.",
+        )
+        parser.add_argument(
+            "--max-wait-ms",
+            type=float,
+            default=0.0,
+            help="How long to wait for more requests before encoding a batch.",
+        )
+
+    def handle(self, *args, **options):
+        encoder = build_local_encoder()
+        self.stdout.write(f"Loading model {settings.EMBEDDING_MODEL_NAME}...")
+        encoder.encode(["warm up"])
+
+        server = EncoderServer(
+            options["socket"], encoder, options["max_batch_size"], options["max_wait_ms"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Encoder listening on {options['socket']}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,154 @@
+"""
+Hot-path instrumentation: per-stage timing spans, the ``Server-Timing``
+response header and Prometheus metrics served at ``/metrics``.
+
+A request (or task) is tracked with ``track(endpoint)``; code inside it
+wraps each stage in ``span("encode")``, ``span("db")``, ... Every span is
+observed in the ``product_api_stage_seconds`` histogram and added to the
+request's Server-Timing header. Spans outside a tracked request are
+recorded under the "other" endpoint.
+
+Under gunicorn each worker has its own metrics; set PROMETHEUS_MULTIPROC_DIR
+to a shared empty directory so /metrics aggregates all of them.
+"""
+
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+# Finer low end than the prometheus_client defaults: most stages take
+# single-digit milliseconds
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+REQUEST_SECONDS = Histogram(
+    "product_api_request_seconds",
+    "Request latency per endpoint.",
+    ["endpoint", "method", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "product_api_stage_seconds",
+    "Time spent per stage (encode, db, count, serialize, render, ...) per endpoint.",
+    ["endpoint", "stage"],
+    buckets=LATENCY_BUCKETS,
+)
+EMBEDDED_PRODUCTS = Counter(
+    "product_embeddings_generated_total",
+    "Product embeddings generated and saved.",
+    ["source"],
+)
+EMBEDDING_BATCH_SECONDS = Histogram(
+    "product_embedding_batch_seconds",
+    "Duration of one embedding batch (fetch, encode and save).",
+    ["source"],
+    buckets=LATENCY_BUCKETS + (30.0, 60.0),
+)
+EMBEDDING_TOKENS = Counter(
+    "product_embedding_tokens_total",
+    "Token positions run by bulk encodes: kind=text for real tokens, padding for the rest.",
+    ["source", "kind"],
+)
+EMBEDDING_QUEUE_LAG_SECONDS = Histogram(
+    "product_embedding_queue_lag_seconds",
+    "Age of the oldest pending product when a drain task starts.",
+    buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+EMBEDDING_QUEUE_DEPTH = Gauge(
+    "product_embedding_queue_depth",
+    "Pending product ids in the debounced embedding queue at the last drain.",
+    multiprocess_mode="mostrecent",
+)
+
+_current = contextvars.ContextVar("product_request_timings", default=None)
+
+
+class RequestTimings:
+    """Stage durations of one tracked request, summed per stage, in order of first use."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.stages = {}
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def server_timing(self, total=None):
+        entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.stages.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+@contextmanager
+def track(endpoint):
+    """Collects the spans run inside the block under ``endpoint``."""
+    timings = RequestTimings(endpoint)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def current_timings():
+    return _current.get()
+
+
+def record(stage, seconds):
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+    STAGE_SECONDS.labels(timings.endpoint if timings else "other", stage).observe(seconds)
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
+
+
+def observe_embedding_batch(source, count, seconds, encode_stats=None):
+    EMBEDDED_PRODUCTS.labels(source).inc(count)
+    EMBEDDING_BATCH_SECONDS.labels(source).observe(seconds)
+    if encode_stats is not None:
+        EMBEDDING_TOKENS.labels(source, "text").inc(encode_stats.tokens)
+        EMBEDDING_TOKENS.labels(source, "padding").inc(
+            encode_stats.padded_slots - encode_stats.tokens
+        )
+
+
+def get_registry():
+    """Registry aggregating every process's metrics in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def render_metrics():
+    """(body, content type) in the Prometheus text format."""
+    return generate_latest(get_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port):
+    """Serves /metrics on its own port (Celery workers have no HTTP server)."""
+    start_http_server(port, registry=get_registry())
@@ -0,0 +1,175 @@
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+from .routers import replica_reads
+
+logger = logging.getLogger(__name__)
+
+# cProfile allows one active profiler per process (sys.monitoring in 3.12+)
+_profile_lock = threading.Lock()
+
+
+def endpoint_name(request):
+    """URL name of the matched route; bounded label cardinality for metrics."""
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    return match.view_name or match.route or "unnamed"
+
+
+def _time_query(execute, sql, params, many, context):
+    with metrics.span("db"):
+        return execute(sql, params, many, context)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request per endpoint and stage. Database time is measured
+    with a query wrapper on every connection, other stages with
+    metrics.span() in the views. Adds a Server-Timing header when
+    SERVER_TIMING is on, and with PROFILE_SAMPLE_RATE = N writes a cProfile
+    dump of 1 in N sync requests to PROFILE_DIR.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        started = time.perf_counter()
+        with metrics.track("unmatched") as timings, ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(_time_query))
+            profiler = self.start_profiler()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    self.save_profile(profiler, request)
+        return self.finish(request, response, timings, started)
+
+    async def __acall__(self, request):
+        # Async views run their queries on other threads: they time DB
+        # access with explicit spans instead of the query wrapper
+        started = time.perf_counter()
+        with metrics.track("unmatched") as timings:
+            response = await self.get_response(request)
+        return self.finish(request, response, timings, started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timings = metrics.current_timings()
+        if timings is not None:
+            timings.endpoint = endpoint_name(request)
+
+    def finish(self, request, response, timings, started):
+        elapsed = time.perf_counter() - started
+        metrics.REQUEST_SECONDS.labels(
+            endpoint_name(request), request.method, response.status_code
+        ).observe(elapsed)
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = timings.server_timing(total=elapsed)
+        return response
+
+    def start_profiler(self):
+        rate = settings.PROFILE_SAMPLE_RATE
+        if not rate or random.randrange(rate) or not _profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiling tool is active
+            _profile_lock.release()
+            return None
+        return profiler
+
+    def save_profile(self, profiler, request):
+        try:
+            profiler.disable()
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(
+                settings.PROFILE_DIR,
+                f"{endpoint_name(request).replace(':', '-')}-{time.strftime('%Y%m%dT%H%M%S')}"
+                f"-{uuid.uuid4().hex[:8]}.prof",
+            )
+            profiler.dump_stats(path)
+            logger.info(f"Wrote request profile {path}")
+        except OSError as e:
+            logger.warning(f"Could not write request profile: {e}")
+        finally:
+            _profile_lock.release()
+
+
+READ_YOUR_WRITES_COOKIE = "primary_reads"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets read-only requests read products from a replica (see
+    products.routers). A successful write sets a cookie that keeps the
+    client's reads on the primary for DB_READ_YOUR_WRITES_SECONDS, so it
+    sees its own changes even while the replicas catch up.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.uses_replicas(request):
+            return self.finish(request, self.get_response(request))
+        with replica_reads():
+            return self.finish(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        if not self.uses_replicas(request):
+            return self.finish(request, await self.get_response(request))
+        with replica_reads():
+            return self.finish(request, await self.get_response(request))
+
+    def uses_replicas(self, request):
+        return (
+            bool(settings.DATABASE_REPLICAS)
+            and request.method in SAFE_METHODS
+            and READ_YOUR_WRITES_COOKIE not in request.COOKIES
+        )
+
+    def finish(self, request, response):
+        if (
+            settings.DATABASE_REPLICAS
+            and request.method not in SAFE_METHODS
+            and response.status_code < 400
+        ):
+            response.set_cookie(
+                READ_YOUR_WRITES_COOKIE,
+                "1",
+                max_age=settings.DB_READ_YOUR_WRITES_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
@@ -0,0 +1,33 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0002_product_embedding"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="embedding_hash",
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="embedding_model",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        # Existing vectors were all produced by all-MiniLM-L6-v2 from
+        # "title description": record that instead of re-embedding everything.
+        migrations.RunSQL(
+            sql="""
+                UPDATE products_product
+                SET embedding_hash = encode(
+                        sha256(convert_to(title || ' ' || description, 'UTF8')), 'hex'
+                    ),
+                    embedding_model = 'all-MiniLM-L6-v2'
+                WHERE embedding IS NOT NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
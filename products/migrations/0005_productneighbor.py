@@ -0,0 +1,27 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0004_product_embedding_hash"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductNeighbor",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("rank", models.PositiveSmallIntegerField()),
+                ("distance", models.FloatField()),
+                ("neighbor", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="neighbor_of", to="products.product")),
+                ("product", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="neighbor_links", to="products.product")),
+            ],
+            options={
+                "ordering": ["product", "rank"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("product", "rank"), name="unique_product_neighbor_rank")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+import pgvector.django.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0005_productneighbor"),
+    ]
+
+    operations = [
+        # Declared in Product.Meta since 0002 but never migrated
+        migrations.AddIndex(
+            model_name="product",
+            index=pgvector.django.indexes.HnswIndex(
+                ef_construction=64,
+                fields=["embedding"],
+                m=16,
+                name="product_embedding_hnsw_idx",
+                opclasses=["vector_cosine_ops"],
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(fields=["category", "price"], name="product_category_price_idx"),
+        ),
+    ]
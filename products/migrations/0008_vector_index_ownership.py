@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("products", "0007_product_search_vector"),
+    ]
+
+    operations = [
+        # Hands the float32 HNSW index over to `manage.py build_vector_index`,
+        # which owns the index of every EMBEDDING_INDEX_PRECISION. The index
+        # stays in the database; only the migration state forgets it, so
+        # `build_vector_index --drop-unused` can drop it for halfvec or bit.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.RemoveIndex(
+                    model_name="product",
+                    name="product_embedding_hnsw_idx",
+                ),
+            ],
+        ),
+    ]
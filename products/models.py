@@ -1,7 +1,179 @@
+import hashlib
+
+import numpy as np
+from django.conf import settings
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models
+from django.db.models import F, Q, Subquery, Value
+from django.db.models.functions import Cast, Concat
+from django.utils.functional import cached_property
 
 # Import necessary to handle vectors in PostgreSQL
-from pgvector.django import HnswIndex, VectorField
+from pgvector import HalfVector, Vector
+from pgvector.django import (
+    BitField,
+    CosineDistance,
+    HalfVectorField,
+    HammingDistance,
+    VectorField,
+)
+
+from .db import vector_param
+from .embeddings import encoder_id
+
+EMBEDDING_DIMENSIONS = 384
+# Cosine distances above this are reported as low-confidence matches
+SIMILARITY_THRESHOLD = 0.7
+# Columns shown by list, search and recommendation responses: everything but
+# the vector, its provenance and the full-text document
+PRODUCT_READ_FIELDS = [
+    "id", "asin", "title", "description", "category", "brand", "price", "created_at",
+]
+
+
+class TextSHA256(models.Func):
+    """
+    Hex SHA-256 of a text expression using PostgreSQL's built-in sha256()
+    (Django's SHA256 function requires the pgcrypto extension).
+    """
+
+    template = "encode(sha256(convert_to(%(expressions)s, 'UTF8')), 'hex')"
+    output_field = models.CharField()
+
+
+class VectorParam(models.Expression):
+    """
+    A query vector bound as a parameter, in binary when the connection
+    supports it (see products.db.vector_param), instead of the text literal
+    pgvector's distance functions inline.
+    """
+
+    def __init__(self, vector, vector_class=Vector):
+        self.vector = np.asarray(vector, dtype=np.float32)
+        self.vector_class = vector_class
+        field_class = HalfVectorField if vector_class is HalfVector else VectorField
+        super().__init__(output_field=field_class(dimensions=EMBEDDING_DIMENSIONS))
+
+    @cached_property
+    def identity(self):
+        # The default identity hashes every component of the vector
+        return (self.__class__, self.vector_class, self.vector.tobytes())
+
+    def as_sql(self, compiler, connection):
+        return "%s", [vector_param(self.vector, connection, self.vector_class)]
+
+
+def halfvec_embedding():
+    """embedding::halfvec(384), matching the halfvec HNSW expression index."""
+    return Cast("embedding", HalfVectorField(dimensions=EMBEDDING_DIMENSIONS))
+
+
+def binary_embedding():
+    """binary_quantize(embedding)::bit(384), matching the bit HNSW expression index."""
+    return Cast(
+        models.Func(
+            "embedding",
+            function="binary_quantize",
+            output_field=BitField(length=EMBEDDING_DIMENSIONS),
+        ),
+        BitField(length=EMBEDDING_DIMENSIONS),
+    )
+
+
+def binary_quantize(vector) -> str:
+    """Python equivalent of pgvector's binary_quantize(): 1 for positive components."""
+    return "".join("1" if component > 0 else "0" for component in vector)
+
+
+def embedding_model_id() -> str:
+    """
+    Provenance stored in Product.embedding_model: the encoder (model and
+    inference backend, see embeddings.encoder_id()), plus the description
+    token budget when one is set, since both change the vectors.
+    """
+    if settings.EMBEDDING_DESCRIPTION_TOKENS:
+        return f"{encoder_id()}+desc{settings.EMBEDDING_DESCRIPTION_TOKENS}"
+    return encoder_id()
+
+
+class ProductQuerySet(models.QuerySet):
+    def order_by_distance(self, vector):
+        """
+        Annotates cosine 'distance' to ``vector`` and orders by it, searching
+        the index selected by EMBEDDING_INDEX_PRECISION:
+        - "vector": full-precision float32 index.
+        - "halfvec": float16 expression index (half the memory); distances
+          are computed in half precision.
+        - "bit": binary-quantized index (1/32 of the memory) used only to
+          shortlist EMBEDDING_RERANK_CANDIDATES rows by Hamming distance,
+          which are then re-ranked with full-precision cosine distance.
+        """
+        precision = settings.EMBEDDING_INDEX_PRECISION
+
+        if precision == "halfvec":
+            distance = CosineDistance(halfvec_embedding(), VectorParam(vector, HalfVector))
+        elif precision == "bit":
+            shortlist = (
+                self.annotate(
+                    hamming_distance=HammingDistance(
+                        binary_embedding(), binary_quantize(vector)
+                    )
+                )
+                .order_by("hamming_distance")
+                .values("pk")[: settings.EMBEDDING_RERANK_CANDIDATES]
+            )
+            return (
+                self.model.objects.filter(pk__in=Subquery(shortlist))
+                .annotate(distance=CosineDistance("embedding", VectorParam(vector)))
+                .order_by("distance")
+            )
+        else:
+            distance = CosineDistance("embedding", VectorParam(vector))
+
+        return self.annotate(distance=distance).order_by("distance")
+
+    def for_read(self):
+        """
+        Loads only PRODUCT_READ_FIELDS. The 384-float embedding is never
+        shown, so it is neither transferred nor parsed; it can still be
+        used in filters and ORDER BY.
+        """
+        return self.only(*PRODUCT_READ_FIELDS)
+
+    def similar_to(self, target):
+        """
+        Products similar to ``target``, nearest first, annotated with 'distance'.
+        Candidates share the target's category (if any) and sit within
+        +/- 50% of its price (if any) to keep recommendations comparable.
+        """
+        queryset = self.exclude(id=target.id).filter(embedding__isnull=False)
+
+        if target.category:
+            queryset = queryset.filter(category=target.category)
+
+        if target.price is not None:
+            min_price = target.price * 0.5
+            max_price = target.price * 1.5
+            queryset = queryset.filter(price__gte=min_price, price__lte=max_price)
+
+        return queryset.order_by_distance(target.embedding)
+
+    def stale_embeddings(self):
+        """
+        Products whose stored vector does not match their current text or
+        the configured model: missing embeddings, edited title/description,
+        or vectors produced by a previous model.
+        """
+        return self.annotate(
+            current_embedding_hash=TextSHA256(
+                Concat("title", Value(" "), "description")
+            )
+        ).filter(
+            Q(embedding__isnull=True)
+            | ~Q(embedding_model=embedding_model_id())
+            | ~Q(embedding_hash=F("current_embedding_hash"))
+        )
 
 
 class Product(models.Model):
@@ -14,20 +186,92 @@ class Product(models.Model):
 
     # Now Django will recognize VectorField
     embedding = VectorField(dimensions=384, null=True, blank=True)
+    # Digest of get_embedding_text() and the model that produced the vector
+    # (see embedding_model_id()), used to re-embed only rows whose input
+    # actually changed.
+    embedding_hash = models.CharField(max_length=64, blank=True, editable=False)
+    embedding_model = models.CharField(max_length=255, blank=True, editable=False)
+
+    # Full-text document for lexical/hybrid search, maintained by PostgreSQL.
+    # Identifiers (ASIN, brand) and the title rank above the description.
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("asin", "brand", "title", weight="A", config="english")
+            + SearchVector("category", weight="B", config="english")
+            + SearchVector("description", weight="C", config="english")
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ProductQuerySet.as_manager()
+
     def __str__(self):
         return self.title
 
+    def get_embedding_text(self) -> str:
+        """
+        Text fed to the embedding model: title and description combined
+        for better semantic context.
+        """
+        return f"{self.title} {self.description}"
+
+    def get_embedding_document(self):
+        """(title, description) for embeddings.encode_documents()."""
+        return self.title, self.description
+
+    def compute_embedding_hash(self) -> str:
+        return hashlib.sha256(self.get_embedding_text().encode("utf-8")).hexdigest()
+
+    def set_embedding(self, vector):
+        """Stores a freshly encoded vector together with its provenance."""
+        self.embedding = vector
+        self.embedding_hash = self.compute_embedding_hash()
+        self.embedding_model = embedding_model_id()
+
+    def embedding_is_stale(self) -> bool:
+        return (
+            self.embedding is None
+            or self.embedding_model != embedding_model_id()
+            or self.embedding_hash != self.compute_embedding_hash()
+        )
+
     class Meta:
-        # Add HNSW index for faster vector similarity search
+        # The HNSW vector indexes are not declared here: the one matching
+        # EMBEDDING_INDEX_PRECISION is built (and the others dropped) by
+        # `manage.py build_vector_index`, see migration 0008.
         indexes = [
-            HnswIndex(
-                name="product_embedding_hnsw_idx",
-                fields=["embedding"],
-                m=16,
-                ef_construction=64,
-                opclasses=["vector_cosine_ops"],
+            # Serves the category/price predicates of similar_to(), including
+            # the exact refill scan in search.fetch_nearest()
+            models.Index(
+                fields=["category", "price"], name="product_category_price_idx"
+            ),
+            GinIndex(fields=["search_vector"], name="product_search_vector_gin"),
+        ]
+
+
+class ProductNeighbor(models.Model):
+    """
+    Materialized top-K recommendations for a product (rank 1 = nearest).
+    Rebuilt by the refresh_product_neighbors task whenever an embedding
+    changes, so the recommendation endpoint is a single indexed lookup.
+    """
+
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="neighbor_links"
+    )
+    neighbor = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="neighbor_of"
+    )
+    rank = models.PositiveSmallIntegerField()
+    distance = models.FloatField()
+
+    class Meta:
+        ordering = ["product", "rank"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["product", "rank"], name="unique_product_neighbor_rank"
             )
         ]
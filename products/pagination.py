@@ -0,0 +1,125 @@
+import base64
+import hashlib
+import json
+
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from . import metrics
+from .cache import normalize_query
+from .search import fetch_nearest
+
+
+class TimedPaginator(Paginator):
+    """Reports the total COUNT(*) as its own 'count' stage."""
+
+    @cached_property
+    def count(self):
+        with metrics.span("count"):
+            return super().count
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    django_paginator_class = TimedPaginator
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+
+
+class VectorCursorPagination(BasePagination):
+    """
+    Keyset pagination for querysets ordered by an annotated 'distance'.
+
+    The cursor stores the last distance served plus the ids already served
+    at exactly that distance, so the next page is a 'distance >= d' query.
+    There is no COUNT(*) and no OFFSET. Deep pages still get slower: the
+    HNSW scan only visits hnsw.ef_search candidates, and without iterative
+    scans (PGVECTOR_ITERATIVE_SCAN) pages past them fall back to the exact
+    refill of fetch_nearest(), a scan of every row that passes the filters.
+    Cursors are bound to the (normalized) search query they were issued for.
+    """
+
+    cursor_query_param = "cursor"
+    fingerprint_query_param = "q"
+    page_size = 10
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    invalid_cursor_message = "Invalid cursor."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.fingerprint = self.get_fingerprint(request)
+        self.has_next = False
+        self.next_cursor = None
+        if "distance" not in queryset.query.annotations:
+            # Views return Product.objects.none() when there is nothing to rank
+            return []
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded:
+            distance, seen_ids = self.decode_cursor(encoded)
+            queryset = queryset.filter(distance__gte=distance).exclude(id__in=seen_ids)
+
+        # One extra row tells us whether there is a next page
+        rows = fetch_nearest(queryset, self.page_size + 1, strict_order=True)
+        self.has_next = len(rows) > self.page_size
+        page = rows[: self.page_size]
+
+        self.next_cursor = None
+        if self.has_next:
+            last_distance = page[-1].distance
+            tied_ids = [row.id for row in page if row.distance == last_distance]
+            if encoded and distance == last_distance:
+                # The whole page tied with the previous cursor position
+                tied_ids = seen_ids + tied_ids
+            self.next_cursor = self.encode_cursor(last_distance, tied_ids)
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_fingerprint(self, request):
+        query = normalize_query(request.query_params.get(self.fingerprint_query_param, ""))
+        return hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+
+    def encode_cursor(self, distance, ids):
+        payload = json.dumps({"d": distance, "ids": ids, "q": self.fingerprint})
+        return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+    def decode_cursor(self, encoded):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            distance = float(payload["d"])
+            ids = [int(product_id) for product_id in payload["ids"]]
+            fingerprint = payload["q"]
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if fingerprint != self.fingerprint:
+            raise NotFound(self.invalid_cursor_message)
+        return distance, ids
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": None,
+                "results": data,
+            }
+        )
@@ -0,0 +1,135 @@
+"""
+Read-replica routing for product reads.
+
+Only reads made while serving a read-only request (GET/HEAD/OPTIONS, see
+products.middleware.ReplicaRoutingMiddleware) go to a replica; Celery tasks,
+management commands and anything after a write in the same request read
+from the primary, so they always see their own changes. A client that has
+just written gets a short-lived cookie that keeps its reads on the primary
+for DB_READ_YOUR_WRITES_SECONDS.
+
+Each replica's lag is checked at most every DB_REPLICA_LAG_CHECK_SECONDS
+per process; replicas lagging more than DB_REPLICA_MAX_LAG_SECONDS,
+disconnected from the primary or unreachable, are skipped, and reads fall back to the primary when none is
+left.
+"""
+
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+logger = logging.getLogger(__name__)
+
+# 0 on a server that is not in recovery (e.g. a second standalone instance
+# used for local testing) and on a streaming replica that has replayed
+# everything it received; otherwise the age of the last replayed
+# transaction. NULL when the WAL receiver is not streaming: its receive LSN
+# then freezes, replay catches up and the replica would look current
+# however far behind the primary it is. Reading pg_stat_wal_receiver.status
+# needs superuser or pg_read_all_stats; without it replicas count as
+# unhealthy.
+REPLICA_LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+_state = contextvars.ContextVar("replica_reads", default=None)
+# Replica alias -> (monotonic time of the check, lag in seconds or None if unreachable)
+_lag_checks = {}
+
+
+class ReplicaReads:
+    """Routing state of one read-only request."""
+
+    def __init__(self):
+        self.allowed = True
+        self.alias = None
+        self.replica_used = False
+
+
+@contextmanager
+def replica_reads():
+    """Lets product reads inside the block go to a replica."""
+    state = ReplicaReads()
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def replica_used():
+    """True if the current request has read from a replica."""
+    state = _state.get()
+    return state is not None and state.replica_used
+
+
+def replica_lag(alias):
+    """Replication lag of ``alias`` in seconds (None if it cannot be reached), cached briefly."""
+    now = time.monotonic()
+    checked = _lag_checks.get(alias)
+    if checked is not None and now - checked[0] < settings.DB_REPLICA_LAG_CHECK_SECONDS:
+        return checked[1]
+    try:
+        with connections[alias].cursor() as cursor:
+            cursor.execute(REPLICA_LAG_SQL)
+            lag = cursor.fetchone()[0]
+    except Exception as e:
+        logger.warning(f"Replica {alias} unavailable: {e}")
+        lag = None
+    else:
+        if lag is None:
+            logger.warning(f"Replica {alias} is not streaming from the primary.")
+        else:
+            lag = float(lag)
+    _lag_checks[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    replicas = []
+    for alias in settings.DATABASE_REPLICAS:
+        lag = replica_lag(alias)
+        if lag is not None and lag <= settings.DB_REPLICA_MAX_LAG_SECONDS:
+            replicas.append(alias)
+    return replicas
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.allowed or model._meta.app_label != "products":
+            return None
+        if state.alias is None:
+            # One replica per request, so the COUNT and the page agree
+            replicas = healthy_replicas()
+            if not replicas:
+                return None
+            state.alias = random.choice(replicas)
+            state.replica_used = True
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Read your own writes for the rest of the request
+            state.allowed = False
+            state.alias = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == DEFAULT_DB_ALIAS
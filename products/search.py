@@ -0,0 +1,346 @@
+import logging
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from .db import session_overrides, vector_param
+from .models import Product
+
+logger = logging.getLogger(__name__)
+
+# pgvector rejects hnsw.ef_search outside 1..1000
+MAX_EF_SEARCH = 1000
+
+
+def ef_search_for(candidates):
+    """hnsw.ef_search that lets one scan return ``candidates`` rows, within pgvector's limit."""
+    return min(max(candidates, settings.PGVECTOR_HNSW_EF_SEARCH), MAX_EF_SEARCH)
+
+
+def _set_local(cursor, name, value):
+    # set_config(..., is_local=true) behaves like SET LOCAL but accepts
+    # bind parameters, so it works with client- and server-side binding.
+    cursor.execute("SELECT set_config(%s, %s, true)", [name, str(value)])
+
+
+@contextmanager
+def session_options(options, using):
+    """
+    Runs the block with the given {setting: value} in effect on database
+    ``using``. Values the connection's session already has (the defaults
+    set once per connection by products.db) cost nothing; the others are
+    set with SET LOCAL in a transaction around the block.
+    """
+    overrides = session_overrides(connections[using], options)
+    if not overrides:
+        yield
+        return
+    with transaction.atomic(using=using):
+        with connections[using].cursor() as cursor:
+            for name, value in overrides.items():
+                _set_local(cursor, name, value)
+        yield
+
+
+def fetch_nearest(queryset, k, strict_order=False):
+    """
+    Evaluates a distance-ordered, filtered queryset (e.g. similar_to()) and
+    returns up to ``k`` rows, guaranteeing ``k`` whenever ``k`` matches exist.
+
+    An HNSW scan only visits ``hnsw.ef_search`` candidates before the
+    category/price predicates are applied, so selective filters can return
+    fewer than ``k`` rows. Two mitigations:
+    - pgvector >= 0.8 iterative index scans (PGVECTOR_ITERATIVE_SCAN) keep
+      walking the graph until enough rows pass the filter. ``strict_order``
+      forces exact ordering, which cursor pagination relies on.
+    - Refill: if the index still comes up short, the query is re-run exactly
+      with index scans disabled, using the (category, price) index instead.
+    """
+    options = {"hnsw.ef_search": settings.PGVECTOR_HNSW_EF_SEARCH}
+    iterative_scan = settings.PGVECTOR_ITERATIVE_SCAN
+    if iterative_scan != "off":
+        options["hnsw.iterative_scan"] = "strict_order" if strict_order else iterative_scan
+    with session_options(options, using=queryset.db):
+        rows = list(queryset[:k])
+
+    if len(rows) < k:
+        with session_options({"enable_indexscan": "off"}, using=queryset.db):
+            exact_rows = list(queryset[:k])
+        if len(exact_rows) > len(rows):
+            logger.info(
+                f"HNSW scan returned {len(rows)}/{k} rows; refilled with an exact scan."
+            )
+            rows = exact_rows
+
+    # relaxed_order iterative scans may return rows slightly out of order
+    rows.sort(key=lambda row: (row.distance, row.id))
+    return rows
+
+
+# Vector candidates for hybrid search, per EMBEDDING_INDEX_PRECISION (see
+# ProductQuerySet.order_by_distance); each statement targets its own index.
+NEAREST_SQL = {
+    "vector": """
+        SELECT p.id, p.embedding <=> %(embedding)s::vector AS distance
+        FROM products_product p
+        WHERE p.embedding IS NOT NULL
+        ORDER BY p.embedding <=> %(embedding)s::vector
+        LIMIT %(candidates)s
+    """,
+    "halfvec": """
+        SELECT p.id, p.embedding::halfvec(384) <=> %(embedding)s::halfvec(384) AS distance
+        FROM products_product p
+        WHERE p.embedding IS NOT NULL
+        ORDER BY p.embedding::halfvec(384) <=> %(embedding)s::halfvec(384)
+        LIMIT %(candidates)s
+    """,
+    "bit": """
+        SELECT p.id, p.embedding <=> %(embedding)s::vector AS distance
+        FROM products_product p
+        WHERE p.id IN (
+            SELECT q.id FROM products_product q
+            WHERE q.embedding IS NOT NULL
+            ORDER BY binary_quantize(q.embedding)::bit(384)
+                <~> binary_quantize(%(embedding)s::vector)::bit(384)
+            LIMIT %(shortlist)s
+        )
+        ORDER BY distance
+        LIMIT %(candidates)s
+    """,
+}
+
+HYBRID_SEARCH_SQL = """
+WITH lexical AS (
+    SELECT p.id,
+           ts_rank_cd(p.search_vector, query) AS lexical_score,
+           ROW_NUMBER() OVER (
+               ORDER BY ts_rank_cd(p.search_vector, query) DESC, p.id
+           ) AS lexical_rank
+    FROM products_product p, websearch_to_tsquery('english', %(query)s) query
+    WHERE p.search_vector @@ query
+    ORDER BY lexical_score DESC, p.id
+    LIMIT %(candidates)s
+),
+semantic AS (
+    SELECT nearest.id,
+           nearest.distance,
+           ROW_NUMBER() OVER (ORDER BY nearest.distance, nearest.id) AS vector_rank
+    FROM ({nearest}) nearest
+)
+SELECT p.id, p.asin, p.title, p.description, p.category, p.brand, p.price,
+       p.created_at,
+       l.lexical_rank, l.lexical_score, s.vector_rank, s.distance,
+       COALESCE(%(lexical_weight)s / (%(rrf_k)s + l.lexical_rank), 0)
+         + COALESCE(%(vector_weight)s / (%(rrf_k)s + s.vector_rank), 0) AS rrf_score
+FROM lexical l
+FULL OUTER JOIN semantic s ON s.id = l.id
+JOIN products_product p ON p.id = COALESCE(l.id, s.id)
+ORDER BY rrf_score DESC, p.id
+LIMIT %(limit)s
+"""
+
+
+def hybrid_search(
+    query,
+    query_embedding,
+    limit=10,
+    candidates=100,
+    lexical_weight=1.0,
+    vector_weight=1.0,
+    rrf_k=60,
+):
+    """
+    Fuses full-text (GIN on search_vector) and vector (HNSW) rankings with
+    weighted Reciprocal Rank Fusion, in a single round-trip:
+
+        rrf_score = lexical_weight / (rrf_k + lexical_rank)
+                  + vector_weight / (rrf_k + vector_rank)
+
+    Each side contributes its top ``candidates`` rows; a product missing
+    from one side scores 0 for it. Returned products carry the component
+    scores (lexical_rank, lexical_score, vector_rank, distance, rrf_score).
+    """
+    using = router.db_for_read(Product)
+    params = {
+        "query": query,
+        "embedding": vector_param(query_embedding, connections[using]),
+        "candidates": candidates,
+        "lexical_weight": float(lexical_weight),
+        "vector_weight": float(vector_weight),
+        "rrf_k": float(rrf_k),
+        "limit": limit,
+        "shortlist": max(candidates, settings.EMBEDDING_RERANK_CANDIDATES),
+    }
+    sql = HYBRID_SEARCH_SQL.replace(
+        "{nearest}", NEAREST_SQL[settings.EMBEDDING_INDEX_PRECISION]
+    )
+    options = {"hnsw.ef_search": ef_search_for(candidates)}
+    with session_options(options, using=using):
+        return list(Product.objects.db_manager(using).raw(sql, params))
+
+
+# Same candidate filters as ProductQuerySet.similar_to(), applied per target
+# row ``t`` inside a LATERAL subquery.
+_NEIGHBOR_FILTERS = """
+    {alias}.id <> t.id
+    AND {alias}.embedding IS NOT NULL
+    AND (t.category = '' OR {alias}.category = t.category)
+    AND (t.price IS NULL OR {alias}.price BETWEEN t.price * 0.5 AND t.price * 1.5)
+    AND NOT ({alias}.id = ANY(%(excluded)s::bigint[]))
+"""
+
+# Per-target neighbour lookup, per EMBEDDING_INDEX_PRECISION
+NEIGHBORS_SQL = {
+    "vector": """
+        SELECT p.id, p.embedding <=> t.embedding AS distance
+        FROM products_product p
+        WHERE {filters}
+        ORDER BY p.embedding <=> t.embedding
+        LIMIT req.k
+    """,
+    "halfvec": """
+        SELECT p.id, p.embedding::halfvec(384) <=> t.embedding::halfvec(384) AS distance
+        FROM products_product p
+        WHERE {filters}
+        ORDER BY p.embedding::halfvec(384) <=> t.embedding::halfvec(384)
+        LIMIT req.k
+    """,
+    "bit": """
+        SELECT p.id, p.embedding <=> t.embedding AS distance
+        FROM products_product p
+        WHERE p.id IN (
+            SELECT q.id FROM products_product q
+            WHERE {shortlist_filters}
+            ORDER BY binary_quantize(q.embedding)::bit(384)
+                <~> binary_quantize(t.embedding)::bit(384)
+            LIMIT %(shortlist)s
+        )
+        ORDER BY distance
+        LIMIT req.k
+    """,
+}
+
+BATCH_NEIGHBORS_SQL = """
+SELECT req.id AS target_id, n.id, n.distance
+FROM unnest(%(ids)s::bigint[], %(limits)s::int[]) AS req(id, k)
+JOIN products_product t ON t.id = req.id
+CROSS JOIN LATERAL ({neighbors}) n
+WHERE t.embedding IS NOT NULL
+"""
+
+
+def _batch_neighbors_sql():
+    return BATCH_NEIGHBORS_SQL.replace(
+        "{neighbors}", NEIGHBORS_SQL[settings.EMBEDDING_INDEX_PRECISION]
+    ).format(
+        filters=_NEIGHBOR_FILTERS.format(alias="p").strip(),
+        shortlist_filters=_NEIGHBOR_FILTERS.format(alias="q").strip(),
+    )
+
+
+def _run_batch_neighbors(limits, excluded, exact=False):
+    params = {
+        "ids": list(limits),
+        "limits": list(limits.values()),
+        "excluded": list(excluded),
+        "shortlist": max(max(limits.values()), settings.EMBEDDING_RERANK_CANDIDATES),
+    }
+    if exact:
+        options = {"enable_indexscan": "off"}
+    else:
+        options = {"hnsw.ef_search": ef_search_for(max(limits.values()))}
+        if settings.PGVECTOR_ITERATIVE_SCAN != "off":
+            options["hnsw.iterative_scan"] = settings.PGVECTOR_ITERATIVE_SCAN
+
+    using = router.db_for_read(Product)
+    rows = {target_id: [] for target_id in limits}
+    with session_options(options, using=using):
+        with connections[using].cursor() as cursor:
+            cursor.execute(_batch_neighbors_sql(), params)
+            for target_id, neighbor_id, distance in cursor.fetchall():
+                rows[target_id].append((neighbor_id, distance))
+    return rows
+
+
+def _unique_fetch_limits(limits):
+    """
+    Over-fetch for unique lists: a target can lose neighbours only to
+    targets whose candidates overlap with its own (same category, or a
+    blank category on either side, see similar_to()), at most their k each.
+    Capped at MAX_EF_SEARCH, so one index scan can still return them.
+    """
+    categories = dict(
+        Product.objects.db_manager(router.db_for_read(Product))
+        .filter(id__in=list(limits))
+        .values_list("id", "category")
+    )
+
+    def overlap(a, b):
+        return not a or not b or a == b
+
+    fetch = {}
+    for target_id, k in limits.items():
+        category = categories.get(target_id)
+        competing = sum(
+            other_k
+            for other_id, other_k in limits.items()
+            if other_id != target_id and overlap(category, categories.get(other_id))
+        )
+        fetch[target_id] = min(k + competing, MAX_EF_SEARCH)
+    return fetch
+
+
+def batch_nearest(limits, exclude_ids=(), unique=False):
+    """
+    Neighbours of many products in one statement: the target embeddings are
+    read by a single join and each target's ANN lookup runs in a LATERAL
+    subquery with the same filters as similar_to().
+
+    ``limits`` maps product id -> number of neighbours wanted. Products in
+    ``exclude_ids`` are never returned. With ``unique``, a product appears in
+    at most one list (the target it is nearest to); lists are over-fetched
+    so they still fill up. Targets that do not exist or have no embedding
+    are left out of the result.
+    Returns {product_id: [(neighbor_id, distance), ...]}, nearest first.
+    """
+    if not limits:
+        return {}
+
+    fetch = dict(limits)
+    if unique:
+        fetch = _unique_fetch_limits(limits)
+
+    rows = _run_batch_neighbors(fetch, exclude_ids)
+
+    # Same refill as fetch_nearest(): redo short lists with an exact scan
+    short = {
+        target_id: k for target_id, k in fetch.items() if len(rows[target_id]) < k
+    }
+    if short:
+        exact_rows = _run_batch_neighbors(short, exclude_ids, exact=True)
+        for target_id, neighbors in exact_rows.items():
+            if len(neighbors) > len(rows[target_id]):
+                rows[target_id] = neighbors
+
+    # Exact (re-ranked) scans may return ties in any order
+    for neighbors in rows.values():
+        neighbors.sort(key=lambda row: (row[1], row[0]))
+
+    if not unique:
+        return {target_id: neighbors for target_id, neighbors in rows.items() if neighbors}
+
+    # Greedy assignment, closest pairs first
+    assigned = {target_id: [] for target_id in limits}
+    taken = set()
+    candidates = sorted(
+        (distance, target_id, neighbor_id)
+        for target_id, neighbors in rows.items()
+        for neighbor_id, distance in neighbors
+    )
+    for distance, target_id, neighbor_id in candidates:
+        if neighbor_id in taken or len(assigned[target_id]) >= limits[target_id]:
+            continue
+        assigned[target_id].append((neighbor_id, distance))
+        taken.add(neighbor_id)
+    return {target_id: neighbors for target_id, neighbors in assigned.items() if neighbors}
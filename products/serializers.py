@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Product
+from . import metrics
+from .models import SIMILARITY_THRESHOLD, Product
 
 class ProductSerializer(serializers.ModelSerializer):
     """
@@ -11,7 +12,7 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         # We explicitly list or exclude fields to avoid sending raw 
         # vector data (384+ floats) to the client.
-        exclude = ["embedding"]
+        exclude = ["embedding", "embedding_hash", "embedding_model", "search_vector"]
 
     def to_representation(self, instance):
         """
@@ -21,4 +22,103 @@ class ProductSerializer(serializers.ModelSerializer):
         representation = super().to_representation(instance)
         if representation.get('price'):
             representation['price'] = float(representation['price'])
-        return representation
\ No newline at end of file
+        return representation
+
+class ProductReadListSerializer(serializers.ListSerializer):
+    """Times serialization of result lists as the 'serialize' stage."""
+
+    def to_representation(self, data):
+        with metrics.span("serialize"):
+            return super().to_representation(data)
+
+
+class ProductReadSerializer(serializers.BaseSerializer):
+    """
+    Read-only fast path for list, search and recommendation responses.
+    Builds each item as a plain dict (same fields as ProductSerializer)
+    instead of running the ModelSerializer field machinery per row, and
+    emits 'distance' and 'is_high_confidence' when the row has a distance.
+    Expects instances loaded with Product.objects.for_read().
+    """
+    # Formats created_at exactly like the ModelSerializer field
+    datetime_field = serializers.DateTimeField()
+
+    class Meta:
+        list_serializer_class = ProductReadListSerializer
+
+    def to_representation(self, instance):
+        price = instance.price
+        data = {
+            "id": instance.id,
+            "asin": instance.asin,
+            "title": instance.title,
+            "description": instance.description,
+            "category": instance.category,
+            "brand": instance.brand,
+            "price": float(price) if price else price,
+            "created_at": self.datetime_field.to_representation(instance.created_at),
+        }
+        distance = getattr(instance, "distance", None)
+        if distance is not None:
+            data["distance"] = float(distance)
+            data["is_high_confidence"] = distance < SIMILARITY_THRESHOLD
+        return data
+
+
+class HybridSearchParamsSerializer(serializers.Serializer):
+    """
+    Validates the query parameters of the hybrid search endpoint.
+    Weights scale each ranking's contribution to the fused score.
+    """
+    q = serializers.CharField()
+    limit = serializers.IntegerField(default=10, min_value=1, max_value=100)
+    candidates = serializers.IntegerField(default=100, min_value=10, max_value=1000)
+    lexical_weight = serializers.FloatField(default=1.0, min_value=0.0)
+    vector_weight = serializers.FloatField(default=1.0, min_value=0.0)
+    rrf_k = serializers.IntegerField(default=60, min_value=1)
+
+
+class HybridSearchResultSerializer(ProductReadSerializer):
+    """
+    Product plus the per-component scores behind its hybrid ranking.
+    Ranks and scores are null when the product was not a candidate on that side.
+    """
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # The vector distance is reported under 'scores'
+        data.pop("distance", None)
+        data.pop("is_high_confidence", None)
+        data["scores"] = self.get_scores(instance)
+        return data
+
+    def get_scores(self, instance):
+        return {
+            "rrf": instance.rrf_score,
+            "lexical_rank": instance.lexical_rank,
+            "lexical_score": instance.lexical_score,
+            "vector_rank": instance.vector_rank,
+            "distance": instance.distance,
+        }
+
+
+class BatchRecommendationParamsSerializer(serializers.Serializer):
+    """
+    Validates the body of the batch recommendation endpoint.
+    'k' applies to every id unless overridden in 'k_per_id' ({"<id>": k}).
+    """
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=100
+    )
+    k = serializers.IntegerField(default=5, min_value=1, max_value=50)
+    k_per_id = serializers.DictField(
+        child=serializers.IntegerField(min_value=1, max_value=50), required=False
+    )
+    exclude_input = serializers.BooleanField(default=False)
+    unique = serializers.BooleanField(default=False)
+
+    def validate_k_per_id(self, value):
+        try:
+            return {int(product_id): k for product_id, k in value.items()}
+        except ValueError:
+            raise serializers.ValidationError("Keys must be product ids.")
@@ -1,14 +1,86 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from .cache import bump_catalog_version
+from .engines import publish_embedding_changes
 from .models import Product
-from .tasks import generate_product_embedding
+from .tasks import queue_product_embeddings, refresh_product_neighbors
+
+# Fields of the similar_to() filters: changing one invalidates neighbour lists
+NEIGHBOR_FILTER_FIELDS = ("category", "price")
+
+
+@receiver(pre_save, sender=Product)
+def remember_stored_filters(sender, instance, update_fields=None, **kwargs):
+    """
+    Reads the stored category and price before an update that can change
+    them (one query), so post_save can tell whether neighbour lists need
+    rebuilding and invalidate the old category's cached responses too.
+    """
+    instance._stored_filters = None
+    if instance._state.adding or instance.pk is None:
+        return
+    if update_fields is not None and not set(update_fields) & set(NEIGHBOR_FILTER_FIELDS):
+        return
+    instance._stored_filters = (
+        Product.objects.filter(pk=instance.pk).values_list(*NEIGHBOR_FILTER_FIELDS).first()
+    )
+
+
+@receiver(post_save, sender=Product)
+def refresh_neighbors_on_filter_change(sender, instance, created, **kwargs):
+    """
+    A category or price edit leaves the embedding alone but changes which
+    products pass the similar_to() filters: rebuild the product's own list
+    and the lists that contain it. Stale embeddings are skipped, the
+    embedding task refreshes neighbours once the new vector is saved.
+    """
+    stored = getattr(instance, "_stored_filters", None)
+    if created or stored is None:
+        return
+    current = tuple(instance.__dict__.get(field) for field in NEIGHBOR_FILTER_FIELDS)
+    if current == tuple(stored) or instance.embedding_is_stale():
+        return
+    product_id = instance.id
+    transaction.on_commit(lambda: refresh_product_neighbors.delay([product_id]))
+
 
 @receiver(post_save, sender=Product)
 def trigger_embedding_generation(sender, instance, created, **kwargs):
     """
-    Automatically triggers the Celery task when a new product is created
-    or when an existing product is saved without an embedding.
+    Automatically queues embedding generation when a new product is created
+    or when a save leaves its embedding missing or out of date (edited
+    title/description, or a different embedding model).
+    Ids go into a debounced buffer that the worker drains in batches.
     """
-    if created or instance.embedding is None:
-        # .delay() sends the task to the Redis queue asynchronously
-        generate_product_embedding.delay(instance.id)
\ No newline at end of file
+    if instance.embedding_is_stale():
+        # Wait for the commit so the worker can see the row
+        product_id = instance.id
+        transaction.on_commit(lambda: queue_product_embeddings([product_id]))
+
+
+def publish_product_change(instance, previous_category=None):
+    """
+    Invalidates cached responses and tells in-memory search engines to
+    re-read the row, once the write is committed.
+    """
+    categories = {instance.category, previous_category} - {None}
+    product_id = instance.id
+
+    def publish():
+        bump_catalog_version(categories, product_ids=[product_id])
+        publish_embedding_changes([product_id])
+
+    transaction.on_commit(publish)
+
+
+@receiver(post_save, sender=Product)
+def invalidate_cached_responses_on_save(sender, instance, **kwargs):
+    stored = getattr(instance, "_stored_filters", None)
+    publish_product_change(instance, previous_category=stored[0] if stored else None)
+    instance._stored_filters = None
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_cached_responses_on_delete(sender, instance, **kwargs):
+    publish_product_change(instance)
@@ -1,19 +1,45 @@
 import logging
+import time
+
 from celery import shared_task
-from .models import Product
-from sentence_transformers import SentenceTransformer
+from celery.signals import worker_init, worker_process_init
+from django.conf import settings
+from django.db import transaction
+from . import embeddings, metrics
+from .cache import bump_catalog_version, get_redis
+from .engines import publish_embedding_changes
+from .models import Product, ProductNeighbor
+from .search import fetch_nearest
 
 logger = logging.getLogger(__name__)
 
-# Global model loading for memory optimization.
-# This ensures the model is loaded only once when the worker starts.
-try:
-    logger.info("Loading SentenceTransformer model into Worker memory...")
-    model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
-    logger.info("Model loaded successfully.")
-except Exception as e:
-    logger.error(f"Failed to load AI model: {e}")
-    model = None
+# Redis keys for the debounced embedding buffer
+PENDING_EMBEDDINGS_KEY = "products:embeddings:pending"
+DRAIN_SCHEDULED_KEY = "products:embeddings:drain-scheduled"
+# Unix time of the oldest id still in the pending set (for queue lag)
+PENDING_SINCE_KEY = "products:embeddings:pending-since"
+# Failed embedding attempts per product id (hash), see retry_or_drop()
+EMBEDDING_ATTEMPTS_KEY = "products:embeddings:attempts"
+
+
+@worker_init.connect
+def start_metrics_server(**kwargs):
+    """Exposes task throughput and queue lag for Prometheus on CELERY_METRICS_PORT."""
+    if settings.CELERY_METRICS_PORT:
+        metrics.start_metrics_server(settings.CELERY_METRICS_PORT)
+
+
+@worker_process_init.connect
+def warm_up_encoder(**kwargs):
+    """
+    Loads the model when each worker process starts, so the first task
+    does not pay for it (and failures show up at boot, not mid-queue).
+    """
+    try:
+        embeddings.warm_up()
+    except Exception as e:
+        logger.error(f"Failed to load AI model: {e}")
+
 
 @shared_task
 def generate_product_embedding(product_id):
@@ -21,29 +47,220 @@ def generate_product_embedding(product_id):
     Async task to generate vector embeddings for a given product.
     This runs in the background worker, not the main API thread.
     """
-    if model is None:
-        logger.error("Model is not loaded. Cannot generate embedding.")
+    generate_product_embeddings([product_id])
+
+
+@shared_task(autoretry_for=(Exception,), retry_backoff=True, max_retries=5)
+def generate_product_embeddings(product_ids):
+    """
+    Batch variant of generate_product_embedding: one query to fetch the
+    products, one length-bucketed encode (embeddings.encode_documents())
+    and one bulk_update().
+    """
+    started = time.perf_counter()
+    with metrics.track("task:generate_product_embeddings"):
+        # Only rows whose text or model changed since their last encode
+        with metrics.span("db"):
+            products = list(
+                Product.objects.filter(id__in=product_ids)
+                .stale_embeddings()
+                .only("id", "title", "description", "category")
+            )
+        if not products:
+            logger.info(f"Embeddings for {len(product_ids)} products are up to date.")
+            return
+
+        try:
+            with metrics.span("encode"):
+                vectors, encode_stats = embeddings.encode_documents(
+                    [product.get_embedding_document() for product in products]
+                )
+        except Exception as e:
+            # Retried by Celery; inline callers (the drain) re-queue the ids
+            logger.error(f"Error encoding {len(products)} products: {e}")
+            raise
+        for product, vector in zip(products, vectors):
+            product.set_embedding(vector)
+
+        # bulk_update() does not send post_save, so this never re-queues itself
+        with metrics.span("save"):
+            Product.objects.bulk_update(
+                products, fields=["embedding", "embedding_hash", "embedding_model"]
+            )
+    metrics.observe_embedding_batch(
+        "task", len(products), time.perf_counter() - started, encode_stats
+    )
+    logger.info(f"Saved embeddings for {len(products)} products.")
+    # bulk_update() bypasses the post_save cache invalidation
+    bump_catalog_version({product.category for product in products})
+    publish_embedding_changes([product.id for product in products])
+
+    refresh_product_neighbors.delay([product.id for product in products])
+
+
+def queue_product_embeddings(product_ids):
+    """
+    Adds ids to the pending set in Redis and schedules a single drain task
+    per debounce window, so a burst of saves becomes a few batch tasks
+    instead of one Celery message per product.
+    Falls back to a direct batch task if Redis is unavailable.
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
         return
 
     try:
-        # Fetch the product from the database
-        product = Product.objects.get(id=product_id)
-        
-        logger.info(f"Generating embedding for Product ID: {product_id} ({product.title})")
-        
-        # AI Logic: Combine title and description
-        text_data = f"{product.title} {product.description}"
-        
-        # Generate vector
-        embedding_vector = model.encode(text_data)
-        
-        # Update database
-        product.embedding = embedding_vector.tolist()
-        product.save(update_fields=['embedding'])
-        
-        logger.info(f"Successfully saved embedding for Product ID: {product_id}")
-        
-    except Product.DoesNotExist:
-        logger.warning(f"Product ID {product_id} not found. Task skipped.")
+        redis = get_redis(settings.EMBEDDING_QUEUE_REDIS_URL)
+        redis.sadd(PENDING_EMBEDDINGS_KEY, *product_ids)
+        redis.set(PENDING_SINCE_KEY, time.time(), nx=True)
+        # Only the first save in the window schedules the drain
+        if redis.set(
+            DRAIN_SCHEDULED_KEY, 1, nx=True, ex=settings.EMBEDDING_DEBOUNCE_SECONDS * 10
+        ):
+            drain_pending_embeddings.apply_async(
+                countdown=settings.EMBEDDING_DEBOUNCE_SECONDS
+            )
     except Exception as e:
-        logger.error(f"Error processing Product ID {product_id}: {e}")
\ No newline at end of file
+        logger.warning(f"Embedding buffer unavailable ({e}); queuing directly.")
+        generate_product_embeddings.delay(product_ids)
+
+
+@shared_task
+def drain_pending_embeddings():
+    """
+    Pops pending product ids from Redis in batches and embeds each batch
+    in-process with generate_product_embeddings.
+    """
+    redis = get_redis(settings.EMBEDDING_QUEUE_REDIS_URL)
+    # Release the schedule flag first: ids added from now on schedule a new
+    # drain, ids added before are popped below.
+    redis.delete(DRAIN_SCHEDULED_KEY)
+
+    # Ids added while draining set a new timestamp once this one is gone
+    pending_since = redis.getdel(PENDING_SINCE_KEY)
+    if pending_since is not None:
+        metrics.EMBEDDING_QUEUE_LAG_SECONDS.observe(max(0.0, time.time() - float(pending_since)))
+    metrics.EMBEDDING_QUEUE_DEPTH.set(redis.scard(PENDING_EMBEDDINGS_KEY))
+
+    total = 0
+    while True:
+        raw_ids = redis.spop(PENDING_EMBEDDINGS_KEY, settings.EMBEDDING_BATCH_SIZE)
+        if not raw_ids:
+            break
+        batch = [int(product_id) for product_id in raw_ids]
+        failed = embed_isolating_failures(batch)
+        if failed:
+            # SPOP already removed them: put them back for the next drain
+            retry_or_drop(redis, failed)
+        total += len(batch) - len(failed)
+
+    if total:
+        logger.info(f"Drained {total} pending embeddings.")
+
+
+def embed_isolating_failures(product_ids):
+    """
+    Embeds ``product_ids`` with generate_product_embeddings, bisecting the
+    batch when it fails so one product the encoder rejects does not fail
+    the others. Returns the ids that failed on their own.
+    """
+    try:
+        generate_product_embeddings(product_ids)
+        return []
+    except Exception as e:
+        if len(product_ids) == 1:
+            logger.warning(f"Embedding product {product_ids[0]} failed: {e}")
+            return list(product_ids)
+    middle = len(product_ids) // 2
+    return embed_isolating_failures(product_ids[:middle]) + embed_isolating_failures(
+        product_ids[middle:]
+    )
+
+
+def retry_or_drop(redis, product_ids):
+    """
+    Re-queues products whose embedding failed, until they have failed
+    EMBEDDING_MAX_ATTEMPTS drains: those are dropped from the queue (they
+    stay stale, so `manage.py generate_embeddings` still picks them up).
+    """
+    retry = []
+    for product_id in product_ids:
+        attempts = redis.hincrby(EMBEDDING_ATTEMPTS_KEY, product_id, 1)
+        if attempts < settings.EMBEDDING_MAX_ATTEMPTS:
+            retry.append(product_id)
+        else:
+            redis.hdel(EMBEDDING_ATTEMPTS_KEY, product_id)
+            logger.error(
+                f"Dropping product {product_id} from the embedding queue after "
+                f"{attempts} failed attempts."
+            )
+    # Counters of products that later succeed (or are deleted) expire with the hash
+    redis.expire(EMBEDDING_ATTEMPTS_KEY, 60 * 60 * 24)
+    if retry:
+        queue_product_embeddings(retry)
+
+
+def compute_product_neighbors(product_ids):
+    """
+    Replaces the materialized top-K neighbour rows of the given products.
+    Returns the set of neighbour ids that were found.
+    """
+    rows = []
+    found = set()
+    targets = list(
+        Product.objects.filter(id__in=product_ids).only(
+            "id", "category", "price", "embedding"
+        )
+    )
+    for target in targets:
+        if target.embedding is None:
+            continue
+        neighbors = fetch_nearest(
+            Product.objects.similar_to(target).only("id"),
+            settings.PRODUCT_NEIGHBORS_K,
+        )
+        for rank, neighbor in enumerate(neighbors, start=1):
+            rows.append(
+                ProductNeighbor(
+                    product_id=target.id,
+                    neighbor_id=neighbor.id,
+                    rank=rank,
+                    distance=neighbor.distance,
+                )
+            )
+            found.add(neighbor.id)
+
+    with transaction.atomic():
+        ProductNeighbor.objects.filter(product_id__in=product_ids).delete()
+        ProductNeighbor.objects.bulk_create(rows)
+    bump_catalog_version({target.category for target in targets})
+    return found
+
+
+@shared_task
+def refresh_product_neighbors(product_ids):
+    """
+    Incrementally refreshes materialized recommendations after embeddings,
+    categories or prices change: the changed products' own lists, the lists
+    that currently include them, and the lists of their new neighbours.
+    The last two are a heuristic (top-K under an asymmetric price window is
+    not symmetric): other lists the product now belongs to are only fixed
+    by ``manage.py build_product_neighbors``.
+    """
+    product_ids = set(product_ids)
+    affected = set(
+        ProductNeighbor.objects.filter(neighbor_id__in=product_ids).values_list(
+            "product_id", flat=True
+        )
+    )
+    affected |= compute_product_neighbors(product_ids)
+    affected -= product_ids
+
+    affected = sorted(affected)
+    for start in range(0, len(affected), settings.EMBEDDING_BATCH_SIZE):
+        compute_product_neighbors(affected[start : start + settings.EMBEDDING_BATCH_SIZE])
+
+    logger.info(
+        f"Refreshed neighbours for {len(product_ids)} products "
+        f"and {len(affected)} affected products."
+    )
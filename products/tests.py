@@ -1,12 +1,67 @@
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from importlib.util import find_spec
+
+import numpy as np
+from pgvector import Vector
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory, APITestCase
+from rest_framework.throttling import AnonRateThrottle
 
-from .models import Product
+from . import metrics
+from .benchmark import category_weights, latency_summary, recall_at_k
+from .cache import (
+    QueryEmbeddingCache,
+    bump_catalog_version,
+    etag_matches,
+    get_catalog_version,
+    normalize_query,
+)
+from . import db
+from .dump import EmbeddingDumpWriter, read_embedding_dump
+from .engines import MemoryEngine, write_snapshot
+from .embeddings import (
+    EncoderServer,
+    LocalEncoder,
+    MicroBatchEncoder,
+    OnnxEncoder,
+    SocketEncoder,
+    schedule_encode,
+)
+from .management.commands.import_amazon_data import Command as ImportCommand
+from .management.commands.import_amazon_data import iter_json_array, iter_records
+from .models import Product, ProductNeighbor, VectorParam, binary_quantize
+from .pagination import VectorCursorPagination
+from .renderers import FastJSONRenderer
+from .routers import ReplicaRouter, replica_lag, replica_reads
+from .search import hybrid_search
+from .serializers import ProductReadSerializer, ProductSerializer
+from .tasks import compute_product_neighbors, drain_pending_embeddings
+from .views import ProductListCreateView
 
 
 class ProductAPITests(APITestCase):
     def setUp(self):
+        cache.clear()
         # Create a test product with a dummy vector (384 dimensions)
         self.product = Product.objects.create(
             asin="TEST01",
@@ -108,3 +163,1100 @@ class ProductAPITests(APITestCase):
         url = reverse("products:product_detail", kwargs={"pk": 99999})
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ProductReadSerializerTests(SimpleTestCase):
+    def setUp(self):
+        self.product = Product(
+            id=1, asin="R01", title="Keyboard", description="Clicky", category="Electronics",
+            brand="Acme", price=99, created_at=timezone.now(),
+        )
+
+    def test_matches_model_serializer(self):
+        self.assertEqual(
+            ProductReadSerializer(self.product).data, ProductSerializer(self.product).data
+        )
+
+    def test_emits_distance_and_confidence(self):
+        self.product.distance = 0.25
+        data = ProductReadSerializer(self.product).data
+        self.assertEqual((data["distance"], data["is_high_confidence"]), (0.25, True))
+
+    def test_for_read_skips_vector_columns(self):
+        sql = str(Product.objects.for_read().query)
+        self.assertNotIn("embedding", sql)
+        self.assertNotIn("search_vector", sql)
+
+    def test_fast_renderer_output(self):
+        data = {"results": [ProductReadSerializer(self.product).data], "missing": []}
+        rendered = FastJSONRenderer().render(data)
+        self.assertEqual(json.loads(rendered), json.loads(json.dumps(data, default=str)))
+
+
+class ETagTests(SimpleTestCase):
+    def test_if_none_match_compares_whole_tags(self):
+        etag = '"abc123"'
+        self.assertTrue(etag_matches(etag, '"abc123"'))
+        self.assertTrue(etag_matches(etag, 'W/"other", W/"abc123"'))
+        self.assertTrue(etag_matches(etag, "*"))
+        # Substrings of another tag or of the whole header do not match
+        self.assertFalse(etag_matches(etag, '"abc1234"'))
+        self.assertFalse(etag_matches(etag, ""))
+
+
+class QueryEmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.calls = []
+        self.cache = QueryEmbeddingCache(model_name="test-model", max_size=2)
+
+    def encode(self, text):
+        self.calls.append(text)
+        return [float(len(text))] * 384
+
+    def test_normalize_query(self):
+        """Case and whitespace variants share one normalized form."""
+        self.assertEqual(normalize_query("  Gaming   MOUSE\n"), "gaming mouse")
+
+    def test_repeated_query_is_encoded_once(self):
+        """Equivalent queries hit the LRU tier instead of re-encoding."""
+        first = self.cache.get_or_encode("Gaming Mouse", self.encode)
+        second = self.cache.get_or_encode("gaming  mouse", self.encode)
+        self.assertEqual(self.calls, ["gaming mouse"])
+        self.assertIs(first, second)
+        stats = self.cache.stats()
+        self.assertEqual((stats["local_hits"], stats["misses"]), (1, 1))
+
+    def test_lru_eviction(self):
+        """The least recently used entry is evicted once max_size is reached."""
+        for query in ["a", "b", "a", "c", "b"]:
+            self.cache.get_or_encode(query, self.encode)
+        self.assertEqual(self.calls, ["a", "b", "c", "b"])
+        self.assertEqual(self.cache.stats()["size"], 2)
+
+    def test_key_includes_model_name(self):
+        """Vectors from a different model never share a cache key."""
+        other = QueryEmbeddingCache(model_name="other-model")
+        self.assertNotEqual(
+            self.cache.make_key("keyboard"), other.make_key("keyboard")
+        )
+
+    def test_key_includes_inference_backend(self):
+        torch_cache = QueryEmbeddingCache.from_settings()
+        with self.settings(EMBEDDING_INFERENCE_BACKEND="onnx"):
+            onnx_cache = QueryEmbeddingCache.from_settings()
+        self.assertNotEqual(
+            torch_cache.make_key("keyboard"), onnx_cache.make_key("keyboard")
+        )
+
+
+class StreamingImportTests(SimpleTestCase):
+    def test_json_array_split_across_reads(self):
+        """Array elements split across read boundaries are reassembled."""
+        data = [{"asin": f"A{i}", "title": "x" * i} for i in range(50)]
+        stream = io.StringIO(json.dumps(data, indent=2))
+        self.assertEqual(list(iter_json_array(stream, read_size=7)), data)
+
+    def test_json_array_empty(self):
+        self.assertEqual(list(iter_json_array(io.StringIO(" [ ] "))), [])
+
+    def test_json_array_truncated(self):
+        """A truncated file raises instead of silently dropping records."""
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('[{"asin": "A1"}, {"asin"'), read_size=4))
+
+    def test_malformed_record_stops_buffering(self):
+        """A record that never parses is reported with its byte offset."""
+        stream = io.StringIO('[{"asin": "é"}, {"asin": "' + "x" * 500)
+        with self.assertRaisesMessage(ValueError, "byte 17"):
+            list(iter_json_array(stream, read_size=16, max_record_size=100))
+
+    def test_jsonl_autodetected(self):
+        """Files starting with an object are read as JSON Lines."""
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            f.write('{"asin": "A1"}\n\n{"asin": "A2"}\n')
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual(
+            [r["asin"] for r in iter_records(f.name)], ["A1", "A2"]
+        )
+
+
+class ImportUpsertTests(TestCase):
+    def test_partial_record_keeps_missing_fields(self):
+        product = Product.objects.create(
+            asin="IMP01", title="Keyboard", category="Electronics", brand="Acme", price=50.0
+        )
+        ImportCommand().upsert_chunk(
+            [{"asin": "IMP01", "price": 45.0}, {"asin": "IMP02", "title": "Mouse"}],
+            skip_embeddings=True,
+        )
+        product.refresh_from_db()
+        self.assertEqual(
+            (product.title, product.category, product.brand, product.price),
+            ("Keyboard", "Electronics", "Acme", 45.0),
+        )
+        self.assertEqual(Product.objects.get(asin="IMP02").title, "Mouse")
+
+
+class EmbeddingHashTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            asin="HASH01",
+            title="Mechanical Keyboard",
+            description="Clicky switches.",
+            category="Electronics",
+        )
+        self.product.set_embedding([0.1] * 384)
+        self.product.save()
+
+    def test_fresh_embedding_is_not_stale(self):
+        """Python and SQL digests of the same text agree."""
+        self.assertFalse(self.product.embedding_is_stale())
+        self.assertFalse(Product.objects.stale_embeddings().exists())
+
+    def test_edited_text_is_stale(self):
+        """Changing the embedded text marks the vector as stale."""
+        self.product.title = "Membrane Keyboard"
+        self.assertTrue(self.product.embedding_is_stale())
+        self.product.save()
+        self.assertEqual(list(Product.objects.stale_embeddings()), [self.product])
+
+    def test_price_change_is_not_stale(self):
+        """Fields outside the embedded text never trigger a re-encode."""
+        self.product.price = 10.0
+        self.product.save()
+        self.assertFalse(Product.objects.stale_embeddings().exists())
+
+    def test_model_change_is_stale(self):
+        with self.settings(EMBEDDING_MODEL_NAME="another-model"):
+            self.assertTrue(self.product.embedding_is_stale())
+            self.assertTrue(Product.objects.stale_embeddings().exists())
+
+    def test_inference_backend_change_is_stale(self):
+        """int8 ONNX vectors are not interchangeable with the torch ones."""
+        with self.settings(EMBEDDING_INFERENCE_BACKEND="onnx"):
+            self.assertTrue(self.product.embedding_is_stale())
+            self.assertTrue(Product.objects.stale_embeddings().exists())
+
+    def test_description_budget_change_is_stale(self):
+        with self.settings(EMBEDDING_DESCRIPTION_TOKENS=64):
+            self.assertTrue(self.product.embedding_is_stale())
+            self.assertTrue(Product.objects.stale_embeddings().exists())
+
+
+class EmbeddingQueueTests(SimpleTestCase):
+    def drain(self, ids, generate, attempts=1):
+        redis = mock.Mock()
+        redis.getdel.return_value = None
+        redis.scard.return_value = 0
+        redis.spop.side_effect = [[str(pk).encode() for pk in ids], []]
+        redis.hincrby.return_value = attempts
+        with mock.patch("products.tasks.get_redis", return_value=redis), mock.patch(
+            "products.tasks.generate_product_embeddings", side_effect=generate
+        ) as generate_mock, mock.patch("products.tasks.queue_product_embeddings") as requeue:
+            drain_pending_embeddings()
+        return generate_mock, requeue
+
+    def test_failed_batch_is_requeued(self):
+        """Ids popped from the pending set are put back when encoding fails."""
+        _, requeue = self.drain([1, 2], RuntimeError("no model"))
+        requeue.assert_called_once_with([1, 2])
+
+    def test_failing_product_is_isolated(self):
+        def generate(product_ids):
+            if 2 in product_ids:
+                raise ValueError("rejected text")
+
+        generate_mock, requeue = self.drain([1, 2, 3, 4], generate)
+        embedded = [
+            pk for call in generate_mock.call_args_list if 2 not in call.args[0]
+            for pk in call.args[0]
+        ]
+        self.assertEqual(sorted(embedded), [1, 3, 4])
+        requeue.assert_called_once_with([2])
+
+    def test_product_is_dropped_after_max_attempts(self):
+        with self.settings(EMBEDDING_MAX_ATTEMPTS=3):
+            _, requeue = self.drain([2], ValueError("rejected text"), attempts=3)
+        requeue.assert_not_called()
+
+
+class ProductNeighborTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.target = Product.objects.create(
+            asin="NB01", title="Keyboard", category="Electronics", price=100.0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        self.near = Product.objects.create(
+            asin="NB02", title="Keyboard 2", category="Electronics", price=110.0,
+            embedding=[0.9, 0.1] + [0.0] * 382,
+        )
+        self.far = Product.objects.create(
+            asin="NB03", title="Mouse", category="Electronics", price=90.0,
+            embedding=[0.0, 1.0] + [0.0] * 382,
+        )
+        Product.objects.create(
+            asin="NB04", title="Sofa", category="Furniture", price=100.0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+
+    def test_compute_product_neighbors(self):
+        """Neighbour lists are ranked by distance and respect the category filter."""
+        compute_product_neighbors([self.target.id])
+        links = ProductNeighbor.objects.filter(product=self.target)
+        self.assertEqual(
+            [link.neighbor_id for link in links], [self.near.id, self.far.id]
+        )
+
+    def test_price_change_refreshes_neighbors(self):
+        """Filter fields changing without a re-embed still rebuild the lists."""
+        self.target.set_embedding(self.target.embedding)
+        self.target.save()
+        with mock.patch("products.signals.refresh_product_neighbors.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.target.title = "Keyboard"
+                self.target.save()
+            delay.assert_not_called()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.target.price = 500.0
+                self.target.save()
+            delay.assert_called_once_with([self.target.id])
+
+    def test_recommendations_served_from_neighbor_table(self):
+        compute_product_neighbors([self.target.id])
+        ProductNeighbor.objects.filter(neighbor=self.far).delete()
+        url = reverse("products:product_recommendations", kwargs={"pk": self.target.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["id"] for item in response.data], [self.near.id])
+
+
+class BatchRecommendationTests(APITestCase):
+    def setUp(self):
+        self.keyboard = Product.objects.create(
+            asin="BR01", title="Keyboard", category="Electronics", price=100.0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        self.keyboard_2 = Product.objects.create(
+            asin="BR02", title="Keyboard 2", category="Electronics", price=110.0,
+            embedding=[0.9, 0.1] + [0.0] * 382,
+        )
+        self.mouse = Product.objects.create(
+            asin="BR03", title="Mouse", category="Electronics", price=90.0,
+            embedding=[0.0, 1.0] + [0.0] * 382,
+        )
+        self.url = reverse("products:product_recommendations_batch")
+
+    def post(self, **body):
+        response = self.client.post(self.url, body, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def ids(self, items):
+        return [item["id"] for item in items]
+
+    def test_batch_matches_single_lookups(self):
+        data = self.post(ids=[self.keyboard.id, self.mouse.id, self.keyboard.id, 999999])
+        self.assertEqual(
+            self.ids(data["results"][str(self.keyboard.id)]),
+            [self.keyboard_2.id, self.mouse.id],
+        )
+        self.assertEqual(
+            self.ids(data["results"][str(self.mouse.id)]),
+            [self.keyboard_2.id, self.keyboard.id],
+        )
+        self.assertEqual(data["missing"], [999999])
+
+    def test_exclude_input_and_per_id_k(self):
+        data = self.post(
+            ids=[self.keyboard.id, self.mouse.id],
+            k_per_id={str(self.mouse.id): 1},
+            exclude_input=True,
+        )
+        self.assertEqual(self.ids(data["results"][str(self.keyboard.id)]), [self.keyboard_2.id])
+        self.assertEqual(self.ids(data["results"][str(self.mouse.id)]), [self.keyboard_2.id])
+
+    def test_unique_assigns_each_neighbor_once(self):
+        """A shared neighbour goes to the closest target only."""
+        data = self.post(ids=[self.keyboard.id, self.mouse.id], k=1, unique=True)
+        self.assertEqual(self.ids(data["results"][str(self.keyboard.id)]), [self.keyboard_2.id])
+        self.assertEqual(self.ids(data["results"][str(self.mouse.id)]), [self.keyboard.id])
+
+    def test_unique_over_fetch_stays_within_ef_search_limit(self):
+        """sum(k) above pgvector's ef_search maximum (1000) still succeeds."""
+        products = [
+            Product.objects.create(
+                asin=f"BRU{i:02d}", title=f"Cable {i}", category="Electronics", price=100.0,
+                embedding=[1.0, i / 25] + [0.0] * 382,
+            )
+            for i in range(25)
+        ]
+        data = self.post(ids=[p.id for p in products], k=50, unique=True)
+        assigned = [item["id"] for items in data["results"].values() for item in items]
+        self.assertEqual(len(assigned), len(set(assigned)))
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            asin="RC01", title="Keyboard", category="Electronics", price=100.0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        self.url = reverse(
+            "products:product_recommendations", kwargs={"pk": self.product.pk}
+        )
+
+    def test_bump_only_touches_given_categories(self):
+        electronics = get_catalog_version("Electronics")
+        furniture = get_catalog_version("Furniture")
+        bump_catalog_version(["Electronics"])
+        self.assertEqual(get_catalog_version("Electronics"), electronics + 1)
+        self.assertEqual(get_catalog_version("Furniture"), furniture)
+
+    def test_save_bumps_old_and_new_category(self):
+        before = get_catalog_version("Electronics")
+        self.product.category = "Furniture"
+        furniture = get_catalog_version("Furniture")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(get_catalog_version("Electronics"), before + 1)
+        self.assertEqual(get_catalog_version("Furniture"), furniture + 1)
+
+    def test_blank_category_follows_every_write(self):
+        """Recommendations of an uncategorized product span all categories."""
+        self.product.category = ""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        first = self.client.get(self.url)["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                asin="RC02", title="Keyboard tray", category="Furniture", price=100.0,
+                embedding=[0.9, 0.1] + [0.0] * 382,
+            )
+        self.assertNotEqual(self.client.get(self.url)["ETag"], first)
+
+    def test_etag_revalidation(self):
+        """A matching If-None-Match is answered with 304 and no body."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+
+    def test_hybrid_search_is_cached(self):
+        url = reverse("products:product_hybrid_search")
+        with mock.patch(
+            "products.views.embeddings.encode_query", return_value=[1.0] + [0.0] * 383
+        ), mock.patch("products.views.hybrid_search", return_value=[]) as search:
+            first = self.client.get(url, {"q": "keyboard"})
+            second = self.client.get(url, {"q": "keyboard"})
+            revalidated = self.client.get(
+                url, {"q": "keyboard"}, HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+        self.assertEqual(search.call_count, 1)
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(revalidated.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_search_errors_are_not_cached(self):
+        """An encoder outage is a 503, never a cached empty page."""
+        url = reverse("products:product_semantic_search")
+        with mock.patch(
+            "products.views.embeddings.encode_query", side_effect=RuntimeError("down")
+        ):
+            response = self.client.get(url, {"q": "keyboard outage"})
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        with mock.patch(
+            "products.views.embeddings.encode_query", return_value=[1.0] + [0.0] * 383
+        ):
+            response = self.client.get(url, {"q": "keyboard outage"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["id"], self.product.id)
+
+    def test_disabled_without_shared_cache(self):
+        """Per-process caches would miss other processes' version bumps."""
+        with self.settings(RESPONSE_CACHE_ENABLED=False):
+            with mock.patch("products.cache.cache.set") as cache_set:
+                response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(
+            [call for call in cache_set.call_args_list if call.args[0].startswith("response:")]
+        )
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.target = Product.objects.create(
+            asin="AS01", title="Keyboard", category="Electronics", price=100.0,
+            embedding=[1.0] + [0.0] * 383,
+        )
+        Product.objects.create(
+            asin="AS02", title="Keyboard 2", category="Electronics", price=110.0,
+            embedding=[0.9, 0.1] + [0.0] * 382,
+        )
+
+    async def test_async_recommendations_match_sync(self):
+        sync_url = reverse("products:product_recommendations", kwargs={"pk": self.target.pk})
+        async_url = reverse(
+            "products:product_recommendations_async", kwargs={"pk": self.target.pk}
+        )
+        expected = (await self.async_client.get(sync_url)).json()
+        response = await self.async_client.get(async_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), expected)
+
+    async def test_async_endpoints_share_the_sync_throttles(self):
+        sync_url = reverse("products:product_recommendations", kwargs={"pk": self.target.pk})
+        async_url = reverse(
+            "products:product_recommendations_async", kwargs={"pk": self.target.pk}
+        )
+        with mock.patch.object(AnonRateThrottle, "THROTTLE_RATES", {"anon": "1/min"}):
+            self.assertEqual((await self.async_client.get(sync_url)).status_code, 200)
+            response = await self.async_client.get(async_url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn("Retry-After", response)
+
+    async def test_async_search_requires_query(self):
+        response = await self.async_client.get(
+            reverse("products:product_semantic_search_async")
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class VectorCursorPaginationTests(SimpleTestCase):
+    def make_paginator(self, query):
+        request = Request(APIRequestFactory().get("/products/search/", {"q": query}))
+        paginator = VectorCursorPagination()
+        paginator.fingerprint = paginator.get_fingerprint(request)
+        return paginator
+
+    def test_cursor_round_trip(self):
+        paginator = self.make_paginator("Gaming Mouse")
+        cursor = paginator.encode_cursor(0.123456789, [4, 7])
+        self.assertEqual(paginator.decode_cursor(cursor), (0.123456789, [4, 7]))
+
+    def test_cursor_bound_to_query(self):
+        """A cursor issued for one query is rejected for another."""
+        cursor = self.make_paginator("gaming mouse").encode_cursor(0.5, [1])
+        with self.assertRaises(NotFound):
+            self.make_paginator("keyboard").decode_cursor(cursor)
+        # Normalization: case/whitespace variants share cursors
+        self.assertEqual(
+            self.make_paginator("Gaming  Mouse").decode_cursor(cursor), (0.5, [1])
+        )
+
+    def test_malformed_cursor(self):
+        with self.assertRaises(NotFound):
+            self.make_paginator("mouse").decode_cursor("not-a-cursor")
+
+    def test_unranked_queryset_gives_empty_page(self):
+        """A none() queryset has no distance to filter a cursor on."""
+        paginator = self.make_paginator("mouse")
+        cursor = paginator.encode_cursor(0.5, [1])
+        request = Request(
+            APIRequestFactory().get("/products/search/", {"q": "mouse", "cursor": cursor})
+        )
+        self.assertEqual(paginator.paginate_queryset(Product.objects.none(), request), [])
+        self.assertIsNone(paginator.get_next_link())
+
+
+class HybridSearchTests(TestCase):
+    def setUp(self):
+        self.exact = Product.objects.create(
+            asin="B08J5F3G58", title="Logitech G Pro X Superlight", brand="Logitech",
+            embedding=[0.0, 1.0] + [0.0] * 382,
+        )
+        self.semantic = Product.objects.create(
+            asin="B000000001", title="Wireless Mouse", brand="Acme",
+            embedding=[1.0] + [0.0] * 383,
+        )
+
+    def test_exact_asin_match_is_fused_with_vector_results(self):
+        results = hybrid_search("B08J5F3G58", [1.0] + [0.0] * 383)
+        by_id = {product.id: product for product in results}
+        self.assertEqual(results[0].id, self.exact.id)
+        self.assertEqual(by_id[self.exact.id].lexical_rank, 1)
+        self.assertEqual(by_id[self.semantic.id].vector_rank, 1)
+        self.assertIsNone(by_id[self.semantic.id].lexical_rank)
+
+    def test_weights(self):
+        """A zero lexical weight ranks purely by vector similarity."""
+        results = hybrid_search(
+            "B08J5F3G58", [1.0] + [0.0] * 383, lexical_weight=0.0
+        )
+        self.assertEqual(results[0].id, self.semantic.id)
+
+
+class QuantizedIndexTests(TestCase):
+    def setUp(self):
+        self.near = Product.objects.create(
+            asin="Q01", title="Near", embedding=[1.0, 0.2] + [0.0] * 382
+        )
+        self.far = Product.objects.create(
+            asin="Q02", title="Far", embedding=[-1.0, 0.2] + [0.0] * 382
+        )
+
+    def test_binary_quantize(self):
+        self.assertEqual(binary_quantize([0.5, -0.1, 0.0, 2.0]), "1001")
+
+    def test_order_by_distance_per_precision(self):
+        """Every index precision ranks the same nearest neighbour first."""
+        query = [1.0, 0.1] + [0.0] * 382
+        for precision in ["vector", "halfvec", "bit"]:
+            with self.subTest(precision=precision), self.settings(
+                EMBEDDING_INDEX_PRECISION=precision
+            ):
+                results = list(Product.objects.order_by_distance(query))
+                self.assertEqual(results, [self.near, self.far])
+
+
+@override_settings(SEARCH_FEED_REDIS_URL="redis://127.0.0.1:1/0")
+class MemoryEngineTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        # id 1 is the query direction; 2 and 3 are progressively further away
+        self.snapshot = dict(
+            ids=[3, 1, 2, 4],
+            vectors=[[0.0, 1.0], [1.0, 0.0], [0.8, 0.2], [1.0, 0.1]],
+            categories=["Electronics", "Electronics", "Electronics", "Furniture"],
+            prices=[90.0, 100.0, None, 100.0],
+        )
+
+    def test_brute_force_ranking_and_filters(self):
+        write_snapshot(self.root, **self.snapshot)
+        engine = MemoryEngine(self.root)
+        ranked = [pk for pk, _ in engine.nearest([1.0, 0.0], 4)]
+        self.assertEqual(ranked, [1, 4, 2, 3])
+        filtered = engine.nearest(
+            [1.0, 0.0], 4, category="Electronics", min_price=50.0, max_price=150.0,
+            exclude_ids=[1],
+        )
+        self.assertEqual([pk for pk, _ in filtered], [3])
+        self.assertEqual(engine.nearest([1.0, 0.0], 4, category="Toys"), [])
+
+    def test_float16_snapshot_matches_float32(self):
+        write_snapshot(self.root, dtype="float16", **self.snapshot)
+        hits = MemoryEngine(self.root).nearest([1.0, 0.0], 4)
+        self.assertEqual([pk for pk, _ in hits], [1, 4, 2, 3])
+        self.assertAlmostEqual(hits[-1][1], 1.0, places=3)
+
+    def test_switches_to_new_snapshot(self):
+        write_snapshot(self.root, **self.snapshot)
+        engine = MemoryEngine(self.root)
+        self.assertEqual(engine.count(), 4)
+        write_snapshot(
+            self.root, ids=[5], vectors=[[1.0, 0.0]], categories=[""], prices=[None]
+        )
+        engine.refresh(force=True)
+        self.assertEqual(engine.nearest([1.0, 0.0], 4), [(5, 0.0)])
+
+    def test_refuses_snapshot_of_another_model(self):
+        write_snapshot(self.root, **self.snapshot)
+        engine = MemoryEngine(self.root)
+        engine.refresh(force=True)
+        loaded = engine.state.name
+        with self.settings(EMBEDDING_MODEL_NAME="other-model"):
+            write_snapshot(self.root, **self.snapshot)
+        engine.refresh(force=True)
+        self.assertEqual(engine.state.name, loaded)
+        with self.assertRaisesMessage(RuntimeError, "other-model"):
+            MemoryEngine(self.root).refresh(force=True)
+
+    def apply_changes(self, engine, rows, product_ids):
+        """Feeds MemoryEngine._apply_changes() the given database rows (no Redis)."""
+        queryset = mock.Mock()
+        queryset.values_list.return_value = rows
+        with mock.patch("products.engines.Product.objects.filter", return_value=queryset):
+            engine._apply_changes(set(product_ids))
+
+    def test_feed_overlay_shadows_snapshot_rows(self):
+        write_snapshot(self.root, **self.snapshot)
+        engine = MemoryEngine(self.root)
+        engine.refresh(force=True)
+        before = engine.state
+        self.apply_changes(
+            engine,
+            rows=[
+                # 2 moves to Furniture and next to the query; 9 is new
+                (2, [1.0, 0.0], "Furniture", 100.0),
+                (9, [0.6, 0.8], "Electronics", 500.0),
+            ],
+            # 1 was deleted (no row)
+            product_ids=[1, 2, 9],
+        )
+        # A search that took the previous state keeps a consistent view
+        self.assertIsNot(engine.state, before)
+        self.assertFalse(before.shadowed.any())
+        self.assertEqual(before.overlay, {})
+
+        self.assertEqual(engine.count(), 4)
+        self.assertEqual([pk for pk, _ in engine.nearest([1.0, 0.0], 5)], [2, 4, 9, 3])
+        electronics = engine.nearest([1.0, 0.0], 5, category="Electronics")
+        self.assertEqual([pk for pk, _ in electronics], [9, 3])
+        # Overlay rows honour the price filter too
+        cheap = engine.nearest([1.0, 0.0], 5, category="Electronics", max_price=150.0)
+        self.assertEqual([pk for pk, _ in cheap], [3])
+        furniture = engine.nearest([1.0, 0.0], 5, category="Furniture", exclude_ids=[4])
+        self.assertEqual([pk for pk, _ in furniture], [2])
+
+    @unittest.skipUnless(find_spec("hnswlib"), "hnswlib is not installed")
+    def test_hnsw_search_with_filters(self):
+        with self.settings(SEARCH_HNSW_MIN_PRODUCTS=1):
+            write_snapshot(self.root, **self.snapshot)
+        engine = MemoryEngine(self.root)
+        engine.refresh(force=True)
+        self.assertIsNotNone(engine.snapshot.hnsw)
+        # Route every search through the graph, whatever the candidate count
+        with mock.patch("products.engines.BRUTE_FORCE_MAX_ROWS", 0):
+            self.assertEqual([pk for pk, _ in engine.nearest([1.0, 0.0], 4)], [1, 4, 2, 3])
+            filtered = engine.nearest(
+                [1.0, 0.0], 2, category="Electronics", exclude_ids=[1]
+            )
+            self.assertEqual([pk for pk, _ in filtered], [2, 3])
+            # The graph cannot return enough filtered rows: exact fallback
+            with mock.patch.object(engine.snapshot, "hnsw_search", return_value=[]):
+                self.assertEqual([pk for pk, _ in engine.nearest([1.0, 0.0], 1)], [1])
+
+
+class FakeHnswIndex:
+    """Exact stand-in for an hnswlib index (labels are row numbers)."""
+
+    def __init__(self, vectors):
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.fetches = []
+
+    def set_ef(self, ef):
+        pass
+
+    def knn_query(self, query, k):
+        self.fetches.append(k)
+        distances = 1.0 - self.vectors @ query
+        rows = np.argsort(distances, kind="stable")[:k]
+        return rows[None, :], distances[rows][None, :]
+
+
+@override_settings(SEARCH_FEED_REDIS_URL="redis://127.0.0.1:1/0")
+class HnswFetchTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        # 50 "Near" rows close to the query, 50 "Far" rows behind them
+        angles = np.concatenate([np.linspace(0.0, 0.5, 50), np.linspace(1.0, 1.5, 50)])
+        write_snapshot(
+            root,
+            ids=list(range(1, 101)),
+            vectors=np.stack([np.cos(angles), np.sin(angles)], axis=1),
+            categories=["Near"] * 50 + ["Far"] * 50,
+            prices=[None] * 100,
+        )
+        self.engine = MemoryEngine(root)
+        self.engine.refresh(force=True)
+        self.hnsw = FakeHnswIndex(self.engine.snapshot.vectors)
+        self.engine.snapshot.hnsw = self.hnsw
+
+    def test_filtered_fetch_grows_until_k_rows_pass(self):
+        with mock.patch("products.engines.BRUTE_FORCE_MAX_ROWS", 0), mock.patch.object(
+            self.engine.snapshot, "brute_force"
+        ) as brute_force:
+            hits = self.engine.nearest([1.0, 0.0], 5, category="Far")
+        self.assertEqual([pk for pk, _ in hits], [51, 52, 53, 54, 55])
+        self.assertEqual(self.hnsw.fetches, [20, 40, 80])
+        brute_force.assert_not_called()
+
+    def test_exact_scan_after_the_fetch_cap(self):
+        with mock.patch("products.engines.BRUTE_FORCE_MAX_ROWS", 0), mock.patch(
+            "products.engines.HNSW_MAX_FETCH", 30
+        ):
+            hits = self.engine.nearest([1.0, 0.0], 5, category="Far")
+        self.assertEqual([pk for pk, _ in hits], [51, 52, 53, 54, 55])
+        self.assertEqual(self.hnsw.fetches, [20, 30])
+
+    def test_small_masks_skip_the_graph(self):
+        hits = self.engine.nearest([1.0, 0.0], 5, category="Far")
+        self.assertEqual([pk for pk, _ in hits], [51, 52, 53, 54, 55])
+        self.assertEqual(self.hnsw.fetches, [])
+
+
+class EmbeddingDumpTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, "catalog.emb")
+
+    def test_round_trip(self):
+        vectors = np.random.default_rng(0).standard_normal((3, 8)).astype(np.float32)
+        for dtype in ["float32", "float16"]:
+            with self.subTest(dtype=dtype):
+                # Capacity larger than the rows written, as when rows are
+                # deleted during an export
+                writer = EmbeddingDumpWriter(self.path, capacity=5, dim=8, dtype=dtype, model="m")
+                writer.write([1, 2], [b"A1", b"A2"], [b"a" * 64, b"b" * 64], vectors[:2])
+                writer.write([7], [b"A7"], [b"c" * 64], vectors[2:])
+                writer.close()
+
+                dump = read_embedding_dump(self.path)
+                self.assertEqual((len(dump), dump.model), (3, "m"))
+                self.assertIsInstance(dump.vectors, np.memmap)
+                self.assertEqual(dump.vectors.dtype, np.dtype(dtype))
+                self.assertEqual(dump.vectors.ctypes.data % 64, 0)
+                self.assertEqual(dump.ids.tolist(), [1, 2, 7])
+                self.assertEqual(dump.asins.tolist(), [b"A1", b"A2", b"A7"])
+                np.testing.assert_allclose(dump.vectors, vectors, rtol=1e-3, atol=1e-3)
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a dump")
+        with self.assertRaises(ValueError):
+            read_embedding_dump(self.path)
+
+    def test_load_refuses_another_model(self):
+        writer = EmbeddingDumpWriter(self.path, capacity=1, dim=384, model="other-model")
+        writer.write([1], [b"A1"], [b"a" * 64], np.zeros((1, 384), np.float32))
+        writer.close()
+        with self.assertRaisesMessage(CommandError, "--force"):
+            call_command("load_embeddings", self.path, stdout=io.StringIO())
+
+
+class BenchmarkHelperTests(SimpleTestCase):
+    def test_latency_summary(self):
+        summary = latency_summary([0.001 * i for i in range(1, 101)], elapsed=2.0)
+        self.assertEqual(summary["queries"], 100)
+        self.assertAlmostEqual(summary["p50_ms"], 50.5)
+        self.assertAlmostEqual(summary["p99_ms"], 99.01)
+        self.assertEqual(summary["qps"], 50.0)
+
+    def test_recall_at_k(self):
+        self.assertEqual(recall_at_k([[1, 2, 3], [4, 5, 9]], [[1, 2, 3], [4, 5, 6]]), 0.8333)
+        self.assertIsNone(recall_at_k([[1]], [[]]))
+
+    def test_category_weights(self):
+        uniform = category_weights(4, skew=0)
+        skewed = category_weights(4, skew=1.0)
+        np.testing.assert_allclose(uniform, [0.25] * 4)
+        self.assertAlmostEqual(skewed.sum(), 1.0)
+        self.assertTrue(np.all(np.diff(skewed) < 0))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.connection = type("RawConnection", (), {})()
+
+    def ensure_connection(self):
+        pass
+
+
+class ConnectionSetupTests(SimpleTestCase):
+    def test_vector_params_are_text_until_types_are_registered(self):
+        fake = FakeConnection()
+        vector = np.array([0.5, -1.0], dtype=np.float32)
+        self.assertEqual(db.vector_param(vector, fake), "[0.5,-1.0]")
+
+        db._configured[fake.connection] = {}
+        self.assertIsInstance(db.vector_param(vector, fake), Vector)
+
+    def test_session_defaults_are_not_set_again(self):
+        fake = FakeConnection()
+        db._configured[fake.connection] = {"hnsw.ef_search": "100"}
+        overrides = db.session_overrides(
+            fake, {"hnsw.ef_search": 100, "enable_indexscan": "off"}
+        )
+        self.assertEqual(overrides, {"enable_indexscan": "off"})
+        self.assertEqual(
+            db.session_overrides(fake, {"hnsw.ef_search": 200}), {"hnsw.ef_search": "200"}
+        )
+
+    def test_vector_param_identity(self):
+        # Compared by value without hashing each component
+        self.assertEqual(VectorParam([1.0, 2.0]), VectorParam(np.array([1.0, 2.0])))
+        self.assertNotEqual(VectorParam([1.0, 2.0]), VectorParam([1.0, 3.0]))
+
+
+@override_settings(DATABASE_REPLICAS=["replica_0"], DB_REPLICA_MAX_LAG_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        patcher = mock.patch("products.routers.replica_lag", return_value=0.5)
+        self.replica_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_use_replica_only_inside_read_only_requests(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        with replica_reads() as state:
+            self.assertEqual(self.router.db_for_read(Product), "replica_0")
+            self.assertTrue(state.replica_used)
+            # Auth, sessions, ... stay on the primary
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        self.replica_lag.return_value = 30.0
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(Product))
+        self.replica_lag.return_value = None  # unreachable
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(Product))
+
+    def test_reads_after_a_write_use_primary(self):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Product), "replica_0")
+            self.assertEqual(self.router.db_for_write(Product), "default")
+            self.assertIsNone(self.router.db_for_read(Product))
+
+    def test_migrations_only_run_on_primary(self):
+        self.assertTrue(self.router.allow_migrate("default", "products"))
+        self.assertFalse(self.router.allow_migrate("replica_0", "products"))
+
+    def test_writes_pin_client_to_primary(self):
+        # Rejected writes (anonymous POST) do not pin the client
+        response = self.client.post(reverse("products:product_list"), {})
+        self.assertNotIn("primary_reads", response.cookies)
+        created = Response(status=status.HTTP_201_CREATED)
+        with mock.patch.object(ProductListCreateView, "permission_classes", []):
+            with mock.patch.object(ProductListCreateView, "post", return_value=created):
+                response = self.client.post(reverse("products:product_list"), {})
+        self.assertEqual(response.cookies["primary_reads"]["max-age"], 10)
+
+
+class ReplicaLagTests(SimpleTestCase):
+    def lag(self, value):
+        connection = mock.MagicMock()
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.fetchone.return_value = (value,)
+        with mock.patch("products.routers.connections", {"replica_0": connection}):
+            with mock.patch("products.routers._lag_checks", {}):
+                return replica_lag("replica_0")
+
+    def test_streaming_replica_reports_its_lag(self):
+        self.assertEqual(self.lag(1.5), 1.5)
+
+    def test_disconnected_replica_is_unhealthy(self):
+        """No streaming WAL receiver: the query returns NULL, never a frozen 0."""
+        self.assertIsNone(self.lag(None))
+
+
+class MetricsTests(SimpleTestCase):
+    def test_metrics_endpoint_and_server_timing(self):
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("total;dur=", response["Server-Timing"])
+
+        # The first request's latency shows up in the next scrape
+        body = self.client.get("/metrics").content.decode()
+        self.assertIn('product_api_request_seconds_count{endpoint="metrics"', body)
+
+    @override_settings(METRICS_TOKEN="secret", METRICS_ALLOWED_IPS=["10.0.0.5"])
+    def test_metrics_require_token_or_allowed_ip(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/metrics", REMOTE_ADDR="10.0.0.5")
+        self.assertEqual(response.status_code, 200)
+
+    def test_spans_are_summed_per_stage(self):
+        product = Product(id=1, asin="A1", title="T", price=1, created_at=timezone.now())
+        with metrics.track("test") as timings:
+            metrics.record("db", 0.002)
+            metrics.record("db", 0.003)
+            ProductReadSerializer([product], many=True).data
+        self.assertEqual(list(timings.stages), ["db", "serialize"])
+        self.assertAlmostEqual(timings.stages["db"], 0.005)
+        self.assertTrue(timings.server_timing().startswith("db;dur=5.0, serialize;dur="))
+
+    def test_sampling_profiler_writes_profiles(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        with self.settings(PROFILE_SAMPLE_RATE=1, PROFILE_DIR=directory):
+            self.client.get("/metrics")
+        self.assertEqual(len([f for f in os.listdir(directory) if f.endswith(".prof")]), 1)
+
+
+class ImportTimeTests(SimpleTestCase):
+    def test_entry_points_do_not_import_ml_stack(self):
+        # Runs each target in a fresh interpreter; fails if torch,
+        # sentence-transformers, onnxruntime or hnswlib get imported
+        for target in ["urls", "tasks"]:
+            with self.subTest(target=target):
+                out = io.StringIO()
+                call_command("import_report", target=target, json=True, stdout=out)
+                self.assertEqual(json.loads(out.getvalue())["heavy_modules"], [])
+
+
+class FakeEncoder:
+    """Deterministic stand-in for the model: one row of [len(text)] * 4 per text."""
+
+    def __init__(self):
+        self.calls = []
+
+    def encode(self, texts, batch_size=64):
+        self.calls.append(list(texts))
+        return np.array([[float(len(text))] * 4 for text in texts], dtype=np.float32)
+
+
+class WhitespaceTokenizer:
+    """Tokenizer stand-in: one token per word, plus [CLS] and [SEP] when asked."""
+
+    def __call__(
+        self,
+        texts,
+        add_special_tokens=True,
+        truncation=False,
+        max_length=None,
+        return_offsets_mapping=False,
+    ):
+        encoded = {"input_ids": [], "offset_mapping": []}
+        for text in texts:
+            offsets = [match.span() for match in re.finditer(r"\S+", text)]
+            ids = list(range(len(offsets)))
+            if add_special_tokens:
+                ids = [-1] + ids + [-2]
+            if truncation and max_length:
+                ids = ids[:max_length]
+            encoded["input_ids"].append(ids)
+            encoded["offset_mapping"].append(offsets)
+        return encoded
+
+
+class TokenizingFakeEncoder(FakeEncoder):
+    tokenizer = WhitespaceTokenizer()
+    max_seq_length = 16
+
+
+class BulkEncodeTests(SimpleTestCase):
+    def setUp(self):
+        self.encoder = TokenizingFakeEncoder()
+        self.documents = [
+            ("Mouse", "one two"),
+            ("Keyboard", " ".join(["word"] * 30)),
+            ("Cable", ""),
+            ("Monitor", "four five six seven"),
+        ]
+
+    def test_batches_group_similar_lengths_and_keep_order(self):
+        vectors, stats = schedule_encode(self.encoder, self.documents, batch_size=2)
+        texts = [f"{title} {description}" for title, description in self.documents]
+        np.testing.assert_array_equal(vectors[:, 0], [float(len(text)) for text in texts])
+        # Longest first: the two long texts share a batch, the two short ones another
+        self.assertEqual(self.encoder.calls, [[texts[1], texts[3]], [texts[0], texts[2]]])
+        self.assertEqual(stats.batches, 2)
+        self.assertEqual(stats.tokens, 16 + 7 + 5 + 3)
+        self.assertLess(stats.padding_waste, stats.baseline_padding_waste)
+
+    def test_baseline_follows_the_encoder_batching(self):
+        """sentence-transformers already sorts each call: same grouping, no gain."""
+        self.encoder.sorts_by_length = True
+        _, stats = schedule_encode(self.encoder, self.documents, batch_size=2)
+        self.assertEqual(stats.baseline_padding_waste, stats.padding_waste)
+
+    def test_description_budget_keeps_title_and_first_tokens(self):
+        _, stats = schedule_encode(
+            self.encoder, self.documents, batch_size=4, description_tokens=3
+        )
+        self.assertEqual(stats.truncated, 2)
+        self.assertIn("Keyboard word word word", self.encoder.calls[0])
+        self.assertIn("Monitor four five six", self.encoder.calls[0])
+        self.assertIn("Mouse one two", self.encoder.calls[0])
+
+    def test_socket_documents_are_scheduled_by_the_server(self):
+        path = os.path.join(tempfile.mkdtemp(), "encoder.sock")
+        server = EncoderServer(path, self.encoder)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        vectors, stats = SocketEncoder(path).encode_documents(self.documents, batch_size=2)
+        self.assertIsNone(stats)
+        self.assertEqual(vectors.shape, (4, 4))
+        self.assertEqual(len(self.encoder.calls), 2)
+
+
+class EncoderSocketTests(SimpleTestCase):
+    def setUp(self):
+        tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(tmpdir, "encoder.sock")
+        self.encoder = FakeEncoder()
+        self.server = EncoderServer(self.path, self.encoder)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def test_encode_single_and_batch(self):
+        client = SocketEncoder(self.path)
+        np.testing.assert_array_equal(client.encode("abc"), [3.0] * 4)
+        vectors = client.encode(["a", "abcd"])
+        self.assertEqual(vectors.shape, (2, 4))
+        np.testing.assert_array_equal(vectors[:, 0], [1.0, 4.0])
+
+    def test_encoder_errors_are_reported(self):
+        self.encoder.encode = lambda texts, batch_size=64: 1 / 0
+        with self.assertRaises(RuntimeError):
+            SocketEncoder(self.path).encode("abc")
+
+    def test_connection_is_not_shared_across_fork(self):
+        """A connection opened before fork() is replaced in the child."""
+        client = SocketEncoder(self.path)
+        client.load()
+        inherited = client._local.sock
+        with mock.patch("products.embeddings.os.getpid", return_value=os.getpid() + 1):
+            np.testing.assert_array_equal(client.encode("ab"), [2.0] * 4)
+            self.assertIsNot(client._local.sock, inherited)
+
+
+class MicroBatchEncoderTests(SimpleTestCase):
+    def test_concurrent_queries_share_a_forward_pass(self):
+        """Queries arriving within max_wait are encoded together, each gets its own row."""
+        encoder = FakeEncoder()
+        batcher = MicroBatchEncoder(encoder, max_batch_size=8, max_wait_ms=200)
+        queries = ["a" * n for n in range(1, 9)]
+        results = {}
+
+        def search(query):
+            results[query] = batcher.encode(query)
+
+        threads = [threading.Thread(target=search, args=(q,)) for q in queries]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for query in queries:
+            np.testing.assert_array_equal(results[query], [float(len(query))] * 4)
+        self.assertLess(len(encoder.calls), len(queries))
+        stats = batcher.stats()
+        self.assertEqual(stats["requests"], len(queries))
+        self.assertEqual(stats["queue_depth"], 0)
+
+    def test_errors_reach_every_caller(self):
+        encoder = FakeEncoder()
+        encoder.encode = lambda texts, batch_size=64: 1 / 0
+        with self.assertRaises(ZeroDivisionError):
+            MicroBatchEncoder(encoder, max_wait_ms=0).encode("abc")
+
+
+# CI exports the model and sets ONNX_PARITY_REQUIRED, so a missing export
+# fails there instead of skipping
+@unittest.skipUnless(
+    os.environ.get("ONNX_PARITY_REQUIRED")
+    or find_spec("onnxruntime")
+    and os.path.exists(os.path.join(settings.EMBEDDING_ONNX_DIR, settings.EMBEDDING_ONNX_FILE)),
+    "ONNX model not exported (run manage.py export_onnx_model)",
+)
+class OnnxParityTests(SimpleTestCase):
+    def test_onnx_matches_torch(self):
+        """int8 ONNX vectors stay within a small cosine drift of the torch vectors."""
+        texts = [
+            "Mechanical Keyboard A clicky mechanical keyboard for typing.",
+            "Logitech G Pro X Superlight Ultra-lightweight wireless gaming mouse.",
+            "noise cancelling headphones",
+        ]
+        torch_vectors = LocalEncoder(settings.EMBEDDING_MODEL_NAME).encode(texts)
+        onnx_vectors = OnnxEncoder(
+            settings.EMBEDDING_ONNX_DIR, file_name=settings.EMBEDDING_ONNX_FILE
+        ).encode(texts)
+        self.assertEqual(onnx_vectors.shape, torch_vectors.shape)
+        cosines = np.sum(torch_vectors * onnx_vectors, axis=1)
+        self.assertGreater(cosines.min(), 0.98)
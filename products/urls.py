@@ -1,10 +1,15 @@
 from django.urls import path
 
+from .async_views import async_product_recommendations, async_semantic_search
 from .views import (
+    BatchRecommendationView,
     ProductListCreateView,
     ProductDetailView,
+    ProductHybridSearchView,
     ProductRecommendationView,
     ProductSemanticSearchView,
+    QueryEmbeddingCacheStatsView,
+    QueryEncoderStatsView,
 )
 
 # Using descriptive app_name for reverse URL lookups in your portfolio
@@ -24,10 +29,50 @@ urlpatterns = [
         name="product_recommendations",
     ),
     
+    # Recommendations for many products in one request
+    path(
+        "recommendations/batch/",
+        BatchRecommendationView.as_view(),
+        name="product_recommendations_batch",
+    ),
+
     # Phase 4: Semantic Search using Natural Language Processing
     path(
         "search/", 
         ProductSemanticSearchView.as_view(), 
         name="product_semantic_search"
     ),
+
+    # Hybrid lexical + vector search (Reciprocal Rank Fusion)
+    path(
+        "search/hybrid/",
+        ProductHybridSearchView.as_view(),
+        name="product_hybrid_search",
+    ),
+
+    # Async (ASGI) variants of the recommendation and search endpoints
+    path(
+        "async/<int:pk>/recommendations/",
+        async_product_recommendations,
+        name="product_recommendations_async",
+    ),
+    path(
+        "async/search/",
+        async_semantic_search,
+        name="product_semantic_search_async",
+    ),
+
+    # Query-embedding cache counters (admin only)
+    path(
+        "search/cache-stats/",
+        QueryEmbeddingCacheStatsView.as_view(),
+        name="query_embedding_cache_stats",
+    ),
+
+    # Query micro-batcher metrics (admin only)
+    path(
+        "search/encoder-stats/",
+        QueryEncoderStatsView.as_view(),
+        name="query_encoder_stats",
+    ),
 ]
\ No newline at end of file
@@ -1,37 +1,54 @@
+import copy
+import hmac
 import logging
 
-from django.db.models import BooleanField, Case, QuerySet, Value, When
+from django.conf import settings
+from django.db.models import F, QuerySet
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from pgvector.django import CosineDistance
 from rest_framework import filters, generics, permissions
-from rest_framework.exceptions import ValidationError
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import APIException, ValidationError
 from rest_framework.response import Response
 from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
-from sentence_transformers import SentenceTransformer
-
+from rest_framework.views import APIView
+
+from . import embeddings, metrics
+from .cache import (
+    VersionedResponseCacheMixin,
+    get_catalog_version,
+    get_product_category,
+    get_query_embedding_cache,
+)
+from .engines import PgvectorEngine, get_search_engine
 from .models import Product
-from .serializers import ProductSerializer
+from .pagination import StandardResultsSetPagination, VectorCursorPagination
+from .search import batch_nearest, hybrid_search
+from .serializers import (
+    BatchRecommendationParamsSerializer,
+    HybridSearchParamsSerializer,
+    HybridSearchResultSerializer,
+    ProductReadSerializer,
+    ProductSerializer,
+)
 
 # Set up logging for production-ready debugging
 logger = logging.getLogger(__name__)
 
 # Constants for AI Logic
-SIMILARITY_THRESHOLD = 0.7  # Distances > 0.7 are considered low confidence
+RECOMMENDATION_LIMIT = 5  # Products returned by the recommendation endpoint
 
-# Initialize model outside the view for better performance (cached in memory)
-try:
-    model = SentenceTransformer("all-MiniLM-L6-v2", device="cpu")
-    logger.info("SentenceTransformer model loaded successfully on CPU.")
-except Exception as e:
-    logger.error(f"Error loading SentenceTransformer: {e}")
 
+class SearchUnavailable(APIException):
+    """
+    The encoder or search engine failed. A 503 rather than an empty 200 page,
+    so clients can retry and the response cache does not keep serving "no
+    results" after the outage is over.
+    """
 
-class StandardResultsSetPagination(PageNumberPagination):
-    page_size = 10
-    page_size_query_param = "page_size"
-    max_page_size = 100
+    status_code = 503
+    default_detail = "Search is temporarily unavailable."
+    default_code = "search_unavailable"
 
 
 class ProductListCreateView(generics.ListCreateAPIView):
@@ -39,7 +56,7 @@ class ProductListCreateView(generics.ListCreateAPIView):
     Standard view to list all products or create new ones.
     """
 
-    queryset = Product.objects.all()
+    queryset = Product.objects.for_read()
     serializer_class = ProductSerializer
     pagination_class = StandardResultsSetPagination
     # Protect write operations, allow read-only for public
@@ -58,6 +75,12 @@ class ProductListCreateView(generics.ListCreateAPIView):
     ]  # Enable ?search=keyword (Standard DB search)
     ordering_fields = ["price", "created_at"]  # Enable ?ordering=price
 
+    def get_serializer_class(self):
+        # Lean dict serializer for reads; full validation for creates
+        if self.request.method == "GET":
+            return ProductReadSerializer
+        return ProductSerializer
+
 
 class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     """
@@ -70,55 +93,128 @@ class ProductDetailView(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
 
-class ProductRecommendationView(generics.ListAPIView):
+class ProductRecommendationView(VersionedResponseCacheMixin, generics.ListAPIView):
     """
     Phase 3 & 4: Provides product recommendations based on a specific product ID.
-    Uses Cosine Distance for vector similarity search.
+    Serves the precomputed ProductNeighbor list when available, otherwise
+    falls back to a live Cosine Distance search.
     """
 
-    serializer_class = ProductSerializer
+    serializer_class = ProductReadSerializer
     permission_classes = [permissions.AllowAny]  # Public endpoint
     throttle_classes = [AnonRateThrottle, UserRateThrottle]  # Prevent abuse
 
-    def get_queryset(self) -> QuerySet:
+    def get_response_cache_version(self):
+        # Only writes in the product's own category can change its
+        # recommendations; a blank category matches every category
+        # (see similar_to()), so any write can.
+        category = get_product_category(self.kwargs.get("pk"))
+        if category is None:
+            return None
+        return get_catalog_version(category or None)
+
+    def get_queryset(self):
         product_id = self.kwargs.get("pk")
+
+        # Fast path: one indexed lookup on the materialized neighbour table
+        precomputed = (
+            Product.objects.for_read()
+            .filter(neighbor_of__product_id=product_id)
+            .annotate(distance=F("neighbor_of__distance"))
+            .order_by("neighbor_of__rank")[:RECOMMENDATION_LIMIT]
+        )
+        if precomputed:
+            return precomputed
+
+        # Not materialized yet: fall back to a live vector search
         target_product = get_object_or_404(Product, pk=product_id)
 
         if target_product.embedding is None:
             logger.warning(f"Product ID {product_id} has no embedding.")
             return Product.objects.none()
 
-        # Start with all other products
-        queryset = Product.objects.exclude(id=product_id)
-
-        # 1. Filter by Category (if available) to ensure relevance
-        if target_product.category:
-            queryset = queryset.filter(category=target_product.category)
+        return get_search_engine().similar_to(target_product, RECOMMENDATION_LIMIT)
 
-        # 2. Filter by Price Range (e.g., +/- 50%) to keep recommendations affordable/comparable
-        if target_product.price is not None:
-            min_price = target_product.price * 0.5
-            max_price = target_product.price * 1.5
-            queryset = queryset.filter(price__gte=min_price, price__lte=max_price)
 
-        return queryset.annotate(
-            distance=CosineDistance("embedding", target_product.embedding)
-        ).order_by("distance")[:5]
+class BatchRecommendationView(generics.GenericAPIView):
+    """
+    Recommendations for many products in one request (listing and cart
+    pages). All target embeddings are read and every neighbour lookup runs
+    in a single LATERAL query, instead of one request per product.
+    """
 
+    serializer_class = ProductReadSerializer
+    permission_classes = [permissions.AllowAny]  # Public endpoint
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]  # Prevent abuse
 
-class ProductSemanticSearchView(generics.ListAPIView):
+    def post(self, request, *args, **kwargs):
+        params = BatchRecommendationParamsSerializer(data=request.data)
+        params.is_valid(raise_exception=True)
+        options = params.validated_data
+
+        # Repeated ids are looked up once; order is preserved
+        product_ids = list(dict.fromkeys(options["ids"]))
+        k_per_id = options.get("k_per_id", {})
+        limits = {pk: k_per_id.get(pk, options["k"]) for pk in product_ids}
+
+        neighbors = batch_nearest(
+            limits,
+            exclude_ids=product_ids if options["exclude_input"] else (),
+            unique=options["unique"],
+        )
+
+        found = set(
+            Product.objects.filter(id__in=product_ids).values_list("id", flat=True)
+        )
+        products = Product.objects.for_read().in_bulk(
+            {neighbor_id for rows in neighbors.values() for neighbor_id, _ in rows}
+        )
+
+        results = {}
+        for pk in product_ids:
+            if pk not in found:
+                continue
+            rows = []
+            for neighbor_id, distance in neighbors.get(pk, []):
+                # A product can be listed under several ids with different distances
+                row = copy.copy(products[neighbor_id])
+                row.distance = distance
+                rows.append(row)
+            results[str(pk)] = self.get_serializer(rows, many=True).data
+
+        return Response(
+            {
+                "results": results,
+                "missing": [pk for pk in product_ids if pk not in found],
+            }
+        )
+
+
+class ProductSemanticSearchView(VersionedResponseCacheMixin, generics.ListAPIView):
     """
     Phase 4: Enables natural language search using vector embeddings.
     Includes a quality filter to identify high-confidence matches.
+    Page-number pagination by default; ?pagination=cursor (or any ?cursor=)
+    switches to keyset pagination without a total count.
     """
 
-    serializer_class = ProductSerializer
+    serializer_class = ProductReadSerializer
     permission_classes = [permissions.AllowAny]  # Public endpoint
     pagination_class = (
         StandardResultsSetPagination  # Enable pagination for search results
     )
     throttle_classes = [AnonRateThrottle, UserRateThrottle]  # Prevent abuse
 
+    @property
+    def paginator(self):
+        if not hasattr(self, "_paginator"):
+            params = self.request.query_params
+            if "cursor" in params or params.get("pagination") == "cursor":
+                self._paginator = VectorCursorPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+
     def get_queryset(self) -> QuerySet:
         query = self.request.query_params.get("q", None)
         if not query:
@@ -126,26 +222,23 @@ class ProductSemanticSearchView(generics.ListAPIView):
             raise ValidationError({"q": "This query parameter is required."})
 
         try:
-            # Convert text query into a vector in real-time
-            query_embedding = model.encode(query).tolist()
-
-            # Annotate each result with a boolean 'is_high_confidence'
-            return (
-                Product.objects.annotate(
-                    distance=CosineDistance("embedding", query_embedding)
-                )
-                .annotate(
-                    is_high_confidence=Case(
-                        When(distance__lt=SIMILARITY_THRESHOLD, then=Value(True)),
-                        default=Value(False),
-                        output_field=BooleanField(),
-                    )
+            # Convert text query into a vector, reusing cached encodes of the
+            # same normalized query (e.g. ?page=2 of the same search)
+            with metrics.span("encode"):
+                query_embedding = get_query_embedding_cache().get_or_encode(
+                    query, embeddings.encode_query
                 )
-                .order_by("distance")
-            )
+
+            # Keyset cursors need a queryset, so they always use pgvector
+            if isinstance(self.paginator, VectorCursorPagination):
+                engine = PgvectorEngine()
+            else:
+                engine = get_search_engine()
+            # Results carry 'distance'; the serializer derives 'is_high_confidence'
+            return engine.search(query_embedding)
         except Exception as e:
             logger.error(f"Search error: {e}")
-            return Product.objects.none()
+            raise SearchUnavailable() from e
 
     def list(self, request, *args, **kwargs):
         """
@@ -172,3 +265,71 @@ class ProductSemanticSearchView(generics.ListAPIView):
         # Fallback if pagination is disabled
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
+
+
+class ProductHybridSearchView(VersionedResponseCacheMixin, generics.ListAPIView):
+    """
+    Hybrid search: fuses PostgreSQL full-text ranking (exact ASINs, brands,
+    model numbers) with vector similarity (meaning) via Reciprocal Rank Fusion.
+    """
+
+    serializer_class = HybridSearchResultSerializer
+    permission_classes = [permissions.AllowAny]  # Public endpoint
+    throttle_classes = [AnonRateThrottle, UserRateThrottle]  # Prevent abuse
+
+    def list(self, request, *args, **kwargs):
+        # list(), not get(): get() is the response cache's entry point
+        params = HybridSearchParamsSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        options = dict(params.validated_data)
+        query = options.pop("q")
+
+        with metrics.span("encode"):
+            query_embedding = get_query_embedding_cache().get_or_encode(
+                query, embeddings.encode_query
+            )
+        results = hybrid_search(query, query_embedding, **options)
+
+        serializer = self.get_serializer(results, many=True)
+        return Response({"results": serializer.data})
+
+
+class QueryEmbeddingCacheStatsView(APIView):
+    """
+    Exposes this worker's query-embedding cache counters for capacity sizing.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(get_query_embedding_cache().stats())
+
+
+class QueryEncoderStatsView(APIView):
+    """
+    Exposes this worker's query micro-batcher metrics (queue depth, batch sizes).
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        encoder = embeddings.get_query_encoder()
+        if not isinstance(encoder, embeddings.MicroBatchEncoder):
+            return Response({"enabled": False})
+        return Response({"enabled": True, **encoder.stats()})
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, for METRICS_TOKEN bearers and
+    METRICS_ALLOWED_IPS only (nginx also denies /api/metrics, but the app
+    ports are reachable without it).
+    """
+    token = settings.METRICS_TOKEN
+    authorized = bool(token) and hmac.compare_digest(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    )
+    if not authorized and request.META.get("REMOTE_ADDR") not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    body, content_type = metrics.render_metrics()
+    return HttpResponse(body, content_type=content_type)